@@ -1,10 +1,61 @@
-from collections import defaultdict, deque
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+import config
+from fanout import next_seq, publish, register_handler
+from vitals_ring import make_store
+
+# Recent alerts per username, with their event ids (see vitals_ring.py)
+_ALERTS = make_store("alerts")
+
+_SUBSCRIBERS: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
 
-_MAX = 100
-_ALERTS = defaultdict(lambda: deque(maxlen=_MAX))
 
 def add_alert(username: str, record: dict) -> None:
-    _ALERTS[username].appendleft(record)
+    """Publish to every worker (see fanout.py); each one runs _deliver_alert."""
+    publish("alert", username, {"id": next_seq(), "record": record})
+
+
+def _deliver_alert(username: str, payload: dict) -> None:
+    seq, record = payload["id"], payload["record"]
+    _ALERTS.append(username, record, seq)
+    for q in _SUBSCRIBERS.get(username, ()):
+        if q.full():
+            q.get_nowait()          # slow reader: drop its oldest pending event
+        q.put_nowait((seq, record))
+
 
 def get_alerts(username: str) -> list[dict]:
-    return list(_ALERTS[username])
+    return _ALERTS.records(username)
+
+
+def get_alerts_since(username: str, last_id: int) -> List[Tuple[int, dict]]:
+    """Buffered (id, record) pairs newer than `last_id`, oldest first."""
+    return _ALERTS.since(username, last_id)
+
+
+def alert_buffer_stats() -> dict:
+    return _ALERTS.stats()
+
+
+def subscribe(username: str) -> asyncio.Queue:
+    q: asyncio.Queue = asyncio.Queue(maxsize=config.SSE_SUBSCRIBER_QUEUE)
+    _SUBSCRIBERS[username].add(q)
+    return q
+
+
+def unsubscribe(username: str, q: asyncio.Queue) -> None:
+    subs = _SUBSCRIBERS.get(username)
+    if subs is None:
+        return
+    subs.discard(q)
+    if not subs:
+        del _SUBSCRIBERS[username]
+
+
+def subscriber_count() -> int:
+    return sum(len(s) for s in _SUBSCRIBERS.values())
+
+
+register_handler("alert", _deliver_alert)
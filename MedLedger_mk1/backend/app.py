@@ -3,10 +3,19 @@ import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from utils.etag import ETagMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from routes import vitals as vitals_routes
 from routes import users, patients, doctor, anomaly, audit
 from routes import sse as sse_routes
+from routes import metrics as metrics_routes
+from routes import models as models_routes
+from fhir_service import open_fhir_client, close_fhir_client
+from audit_queue import start_audit_worker, stop_audit_worker
+from audit_indexer import run_audit_indexer
+from fanout import start_fanout, stop_fanout
+from identity_cache import identity
+from fhir_outbox import run_outbox_worker
 from sync_fhir import ensure_fhir_sync, update_patient_ids_from_usernames, start_scheduler, wait_for_fhir_server
 
 
@@ -17,7 +26,18 @@ async def mongo_lifespan(app: FastAPI):
     db = client[os.getenv("MONGO_DB", "medledger_analytics")]
     app.state.mongo = db
     print("[✅] Connected to MongoDB.")
+    app.state.fhir = await open_fhir_client()
+    await start_fanout(db)
+    await identity.seed(db)
+    await start_audit_worker(db)
+    indexer = asyncio.create_task(run_audit_indexer(db))
+    outbox = asyncio.create_task(run_outbox_worker(db))
     yield
+    outbox.cancel()
+    indexer.cancel()
+    await stop_audit_worker()
+    await stop_fanout()
+    await close_fhir_client()
     client.close()
 
 
@@ -29,7 +49,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Data-Source", "X-Data-Refreshed-At", "X-Data-Age"],
 )
+app.add_middleware(ETagMiddleware)
 
 app.include_router(users.router, tags=["Authentication"])
 app.include_router(patients.router, prefix="/patients", tags=["Patients"])
@@ -39,6 +61,8 @@ app.include_router(sse_routes.router)
 app.include_router(vitals_routes.router, prefix="/vitals", tags=["Vitals"])
 app.include_router(vitals_routes.router2)
 app.include_router(audit.router)
+app.include_router(metrics_routes.router)
+app.include_router(models_routes.router)
 
 FHIR_BASE = os.getenv("FHIR_SERVER_URL", "http://localhost:8080")
 
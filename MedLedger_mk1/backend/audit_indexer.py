@@ -0,0 +1,251 @@
+"""
+Incremental indexer for PatientAudit `RecordStored` events.
+
+Instead of get_logs(0 → latest) on every lookup, scan only the blocks after
+the stored checkpoint, in AUDIT_INDEX_CHUNK-sized ranges fetched up to
+AUDIT_INDEX_CONCURRENCY at a time, and upsert the decoded events into the
+`audit_events` collection:
+
+    {tx_hash, log_index, block_number, sender, record_hash, timestamp}
+
+The checkpoint (`audit_index_state`) only advances past ranges that were
+fully written, so a crash mid-run just re-reads those blocks next time.
+
+`run_audit_indexer` starts in every uvicorn worker, but only the holder of
+the "audit_indexer" lease (fhir_outbox.acquire_lease) runs a pass, and it
+renews the lease before each window of ranges.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+import config
+from audit_queue import verify_audit_doc
+from blockchain import w3, contract
+from database import db as default_db
+from fhir_outbox import LeaseLost, acquire_lease
+
+EVENTS_COLLECTION = "audit_events"
+STATE_COLLECTION = "audit_index_state"
+_STATE_ID = "RecordStored"
+
+_event_sig = w3.keccak(text="RecordStored(address,bytes32,uint256)")
+
+_indexes_ready = False
+
+
+async def ensure_audit_event_indexes(db=None) -> None:
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    db = db if db is not None else default_db
+    col = db[EVENTS_COLLECTION]
+    await col.create_index([("tx_hash", ASCENDING), ("log_index", ASCENDING)], unique=True)
+    await col.create_index([("record_hash", ASCENDING)])
+    await col.create_index([("sender", ASCENDING), ("timestamp", DESCENDING)])
+    await col.create_index([("timestamp", DESCENDING)])
+    # audit_trail: record-hash lookups (verify_record_hashes) and the
+    # keyset-paginated export in routes/audit.py
+    trail = db["audit_trail"]
+    await trail.create_index([("record_hash", ASCENDING)])
+    await trail.create_index([("blockNumber", ASCENDING), ("_id", ASCENDING)])
+    await trail.create_index([("from", ASCENDING), ("_id", ASCENDING)])
+    _indexes_ready = True
+
+
+def _get_logs(from_block: int, to_block: int) -> list:
+    return w3.eth.get_logs({
+        "fromBlock": from_block,
+        "toBlock": to_block,
+        "address": contract.address,
+        "topics": [_event_sig],
+    })
+
+
+async def _fetch_range(from_block: int, to_block: int) -> list:
+    """get_logs for one range; halve the range if the node rejects it."""
+    try:
+        return await asyncio.to_thread(_get_logs, from_block, to_block)
+    except Exception:
+        if from_block == to_block:
+            raise
+        mid = (from_block + to_block) // 2
+        left = await _fetch_range(from_block, mid)
+        right = await _fetch_range(mid + 1, to_block)
+        return left + right
+
+
+def _decode(raw) -> Dict[str, Any]:
+    evt = contract.events.RecordStored().process_log(raw)
+    return {
+        "tx_hash": evt.transactionHash.hex(),
+        "log_index": evt.logIndex,
+        "block_number": evt.blockNumber,
+        "sender": evt.args.sender,
+        "record_hash": evt.args.recordHash.hex(),
+        "timestamp": datetime.fromtimestamp(evt.args.timestamp, tz=timezone.utc),
+    }
+
+
+def _ranges(start: int, end: int, size: int) -> List[Tuple[int, int]]:
+    return [(b, min(b + size - 1, end)) for b in range(start, end + 1, size)]
+
+
+async def index_audit_events(db=None, lease: Optional[str] = None) -> Dict[str, int]:
+    """
+    Index every RecordStored event since the last checkpoint.
+    With `lease`, renew that lease before each window and raise LeaseLost
+    if another worker holds it.  Returns {from_block, to_block, events}.
+    """
+    db = db if db is not None else default_db
+    await ensure_audit_event_indexes(db)
+    events_col = db[EVENTS_COLLECTION]
+    state_col = db[STATE_COLLECTION]
+
+    state = await state_col.find_one({"_id": _STATE_ID}) or {}
+    start = state.get("last_block", config.AUDIT_INDEX_START_BLOCK - 1) + 1
+    latest = await asyncio.to_thread(lambda: w3.eth.block_number)
+    if start > latest:
+        return {"from_block": start, "to_block": latest, "events": 0}
+
+    ranges = _ranges(start, latest, config.AUDIT_INDEX_CHUNK)
+    step = config.AUDIT_INDEX_CONCURRENCY
+    total = 0
+
+    # Fetch a window of ranges in parallel, write it, then move the checkpoint
+    # to the end of that window before starting the next one.
+    for i in range(0, len(ranges), step):
+        if lease and not await acquire_lease(db, lease, config.AUDIT_INDEX_LEASE_SECONDS):
+            raise LeaseLost()
+        window = ranges[i:i + step]
+        results = await asyncio.gather(*(_fetch_range(a, b) for a, b in window))
+
+        ops = []
+        for logs in results:
+            for raw in logs:
+                doc = _decode(raw)
+                ops.append(UpdateOne(
+                    {"tx_hash": doc["tx_hash"], "log_index": doc["log_index"]},
+                    {"$set": doc},
+                    upsert=True,
+                ))
+        if ops:
+            await events_col.bulk_write(ops, ordered=False)
+        total += len(ops)
+
+        await state_col.update_one(
+            {"_id": _STATE_ID},
+            {"$set": {"last_block": window[-1][1], "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+
+    print(f"[📒] audit index: blocks {start}–{latest}, {total} events")
+    return {"from_block": start, "to_block": latest, "events": total}
+
+
+async def find_audit_events(
+    db=None,
+    record_hash: Optional[str] = None,
+    sender: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Indexed lookup by record hash, sender and/or time range, newest first."""
+    db = db if db is not None else default_db
+    query: Dict[str, Any] = {}
+    if record_hash:
+        query["record_hash"] = record_hash.lower().removeprefix("0x")
+    if sender:
+        query["sender"] = w3.to_checksum_address(sender)
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lte"] = until
+
+    cursor = (db[EVENTS_COLLECTION]
+              .find(query, {"_id": 0})
+              .sort("timestamp", DESCENDING)
+              .limit(limit))
+    return await cursor.to_list(length=limit)
+
+
+def _hex(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    return str(value).lower().removeprefix("0x")
+
+
+async def verify_record_hashes(hashes: List[str], db=None) -> Dict[str, Dict[str, Any]]:
+    """
+    Anchoring status for many record hashes with two indexed `$in` queries
+    per chunk: audit_trail (our receipts, incl. Merkle proofs) and
+    audit_events (what the chain actually emitted, for the block timestamp).
+    """
+    db = db if db is not None else default_db
+    await ensure_audit_event_indexes(db)
+    wanted = list(dict.fromkeys(_hex(h) for h in hashes))
+    results: Dict[str, Dict[str, Any]] = {h: {"anchored": False} for h in wanted}
+
+    chunk = config.AUDIT_VERIFY_CHUNK
+    for i in range(0, len(wanted), chunk):
+        part = wanted[i:i + chunk]
+
+        trail = {}
+        async for doc in db["audit_trail"].find(
+            {"record_hash": {"$in": part}},
+            {"_id": 0, "record_hash": 1, "transactionHash": 1, "blockNumber": 1,
+             "status": 1, "merkle_root": 1, "merkle_proof": 1},
+        ):
+            trail.setdefault(doc["record_hash"], doc)
+
+        # On chain the anchored value is the record hash itself or its batch root
+        anchors = set(part) | {d["merkle_root"] for d in trail.values() if d.get("merkle_root")}
+        events = {}
+        async for evt in db[EVENTS_COLLECTION].find(
+            {"record_hash": {"$in": list(anchors)}}, {"_id": 0}
+        ):
+            events.setdefault(evt["record_hash"], evt)
+
+        for h in part:
+            doc = trail.get(h)
+            anchor = (doc or {}).get("merkle_root") or h
+            evt = events.get(anchor)
+            if doc is None and evt is None:
+                continue
+            proof_valid = verify_audit_doc({**doc, "record_hash": h}) if doc else None
+            # seen on chain (or a successful receipt), and the proof, if any, holds
+            on_chain = evt is not None or bool(doc and doc.get("status") == 1)
+            results[h] = {
+                "anchored": on_chain and proof_valid is not False,
+                "indexed_on_chain": evt is not None,
+                "tx_hash": evt["tx_hash"] if evt else _hex(doc.get("transactionHash")),
+                "block_number": evt["block_number"] if evt else doc.get("blockNumber"),
+                "timestamp": evt["timestamp"] if evt else None,
+                "merkle_root": (doc or {}).get("merkle_root"),
+                "proof_valid": proof_valid,
+            }
+    return results
+
+
+async def run_audit_indexer(db=None) -> None:
+    """Background loop started from the app lifespan; only the lease holder indexes."""
+    db = db if db is not None else default_db
+    while True:
+        try:
+            if await acquire_lease(db, "audit_indexer", config.AUDIT_INDEX_LEASE_SECONDS):
+                await index_audit_events(db, lease="audit_indexer")
+        except asyncio.CancelledError:
+            raise
+        except LeaseLost:
+            print("[⚠] audit indexer lease lost mid-run – stopping")
+        except Exception as e:
+            print("⚠️ audit indexer run failed:", e)
+        await asyncio.sleep(config.AUDIT_INDEX_INTERVAL)
@@ -0,0 +1,431 @@
+"""
+Background blockchain audit pipeline.
+
+Handlers call `enqueue_audit(action_string)` and return immediately.  Every
+worker process spools its records into the `audit_outbox` collection, and
+one submitter across all workers (the holder of the "audit_submitter" lease
+in `fhir_leases`, see fhir_outbox.acquire_lease) anchors them:
+
+  * the submit loop signs and broadcasts storeRecord() transactions using a
+    local nonce counter (so many can be pending at once, bounded by
+    AUDIT_MAX_IN_FLIGHT).  Only the lease holder hands out nonces for the
+    shared sender, and a new holder re-reads them from the node.
+  * a failed send leaves its records in `audit_outbox` and retries them
+    with backoff (AUDIT_RETRY_BASE · 2^(attempts-1), capped at AUDIT_RETRY_MAX)
+  * the receipt loop polls for sent transactions and mirrors each mined
+    receipt into `audit_trail`.  A transaction still unmined after
+    AUDIT_PENDING_TIMEOUT is checked against the sender's mined nonce: if
+    that nonce was used by something else its records go back to pending,
+    otherwise the transaction is re-broadcast on the same nonce.
+
+Outbox items live as {record_hash, queued_at, status: pending|sent,
+attempts, next_attempt, last_error, tx_hash, nonce, sent_at, merkle_index}
+and are deleted once their receipt is stored.
+
+With AUDIT_BATCH_MODE on, the submit loop instead collects records for up
+to AUDIT_BATCH_WINDOW seconds / AUDIT_BATCH_SIZE records, anchors only their
+Merkle root, and stores one audit_trail document per record carrying its
+inclusion proof (see merkle.py and verify_audit_doc()).
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from web3.exceptions import TransactionNotFound
+
+import config
+from blockchain import w3, compute_patient_hash, get_sender, send_record_hash
+from database import db as default_db, get_audit_collection
+from fhir_outbox import LeaseLost, acquire_lease
+from merkle import build_levels, merkle_proof, verify_proof
+from utils.latency import LatencyWindow
+
+AUDIT_OUTBOX_COLLECTION = "audit_outbox"
+_LEASE = "audit_submitter"
+
+_queue: Optional[asyncio.Queue] = None
+_tasks: list = []
+_leader = False
+
+_stats: Dict[str, int] = {
+    "enqueued": 0,
+    "dropped": 0,
+    "spooled": 0,
+    "submitted": 0,
+    "submit_errors": 0,
+    "confirmed": 0,
+    "reverted": 0,
+    "records_anchored": 0,
+    "resent": 0,
+    "requeued": 0,
+    "in_flight": 0,
+}
+_submit_latency = LatencyWindow()
+_confirm_latency = LatencyWindow()
+
+
+class NonceManager:
+    """
+    Hands out consecutive nonces without asking the node each time.  Seeded
+    from the node's pending count; reset() re-reads it after a failed send so
+    a gap never stalls later transactions.
+    """
+
+    def __init__(self):
+        self._next: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def next(self, sender: str) -> int:
+        async with self._lock:
+            if self._next is None:
+                self._next = await asyncio.to_thread(
+                    w3.eth.get_transaction_count, sender, "pending"
+                )
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def reset(self) -> None:
+        self._next = None
+
+
+_nonces = NonceManager()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _age(ts: datetime) -> float:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (_now() - ts).total_seconds()
+
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(config.AUDIT_RETRY_MAX, config.AUDIT_RETRY_BASE * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=config.AUDIT_QUEUE_MAX)
+    return _queue
+
+
+def enqueue_audit(patient_data: str) -> str:
+    """
+    Queue one audit record for anchoring and return its SHA-256 hex.
+    Raises asyncio.QueueFull when the backlog is at AUDIT_QUEUE_MAX.
+    """
+    record_hash = compute_patient_hash(patient_data)
+    item = {
+        "record_hash": record_hash,
+        "queued_at": datetime.now(timezone.utc),
+    }
+    try:
+        _get_queue().put_nowait(item)
+    except asyncio.QueueFull:
+        _stats["dropped"] += 1
+        raise
+    _stats["enqueued"] += 1
+    return record_hash.hex()
+
+
+async def _spool_loop(col) -> None:
+    """Move this worker's queued records into the shared audit_outbox."""
+    queue = _get_queue()
+    while True:
+        items = [await queue.get()]
+        while not queue.empty() and len(items) < config.AUDIT_BATCH_SIZE:
+            items.append(queue.get_nowait())
+        docs = [{
+            "record_hash": i["record_hash"].hex(),
+            "queued_at": i["queued_at"],
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt": i["queued_at"],
+        } for i in items]
+        while True:
+            try:
+                await col.insert_many(docs, ordered=False)
+                break
+            except BulkWriteError as e:
+                # a retry after a partial insert: the docs already carry their _id
+                if all(err.get("code") == 11000 for err in e.details.get("writeErrors", [])):
+                    break
+                print("⚠️ audit spool write failed – retrying:", e)
+            except Exception as e:
+                print("⚠️ audit spool write failed – retrying:", e)
+            await asyncio.sleep(config.AUDIT_RECEIPT_POLL)
+        _stats["spooled"] += len(items)
+        for _ in items:
+            queue.task_done()
+
+
+async def _hold_lease(db) -> bool:
+    """Take or renew the submitter lease; a new holder re-reads the nonces."""
+    global _leader
+    held = await acquire_lease(db, _LEASE, config.AUDIT_LEASE_SECONDS)
+    if held and not _leader:
+        _nonces.reset()
+    _leader = held
+    return held
+
+
+def _anchor(items: List[Dict[str, Any]], batched: bool) -> bytes:
+    hashes = [bytes.fromhex(i["record_hash"]) for i in items]
+    return build_levels(hashes)[-1][0] if batched else hashes[0]
+
+
+async def _send(db, col, sender: str, items: List[Dict[str, Any]]) -> bool:
+    """Broadcast one transaction for `items`; on failure schedule their retry."""
+    batched = config.AUDIT_BATCH_MODE
+    anchor = _anchor(items, batched)
+    if not await _hold_lease(db):
+        raise LeaseLost()
+    try:
+        nonce = await _nonces.next(sender)
+        tx_hash = await asyncio.to_thread(send_record_hash, anchor, nonce, sender)
+    except Exception as e:
+        _stats["submit_errors"] += 1
+        _nonces.reset()
+        now = _now()
+        await col.bulk_write([
+            UpdateOne({"_id": i["_id"]}, {
+                "$set": {"next_attempt": now + _backoff(i.get("attempts", 0) + 1), "last_error": str(e)},
+                "$inc": {"attempts": 1},
+            })
+            for i in items
+        ], ordered=False)
+        print("⚠️ blockchain audit submit failed – will retry:", e)
+        return False
+
+    now = _now()
+    await col.bulk_write([
+        UpdateOne({"_id": i["_id"]}, {"$set": {
+            "status": "sent", "tx_hash": bytes(tx_hash).hex(), "nonce": nonce, "sent_at": now,
+            "batched": batched, "merkle_index": idx, "last_error": None,
+        }})
+        for idx, i in enumerate(items)
+    ], ordered=False)
+    _stats["submitted"] += 1
+    for item in items:
+        _submit_latency.record(_age(item["queued_at"]))
+    return True
+
+
+async def _submit_due(db, col, sender: str) -> int:
+    """Send due records while there is room in flight; returns the transactions sent."""
+    in_flight = len(await col.distinct("tx_hash", {"status": "sent"}))
+    _stats["in_flight"] = in_flight
+    room = config.AUDIT_MAX_IN_FLIGHT - in_flight
+    if room <= 0:
+        return 0
+
+    size = config.AUDIT_BATCH_SIZE if config.AUDIT_BATCH_MODE else 1
+    due = await (col.find({"status": "pending", "next_attempt": {"$lte": _now()}})
+                 .sort("queued_at", ASCENDING)
+                 .to_list(length=size * room))
+    sent = 0
+    for i in range(0, len(due), size):
+        items = due[i:i + size]
+        if len(items) < size and _age(items[0]["queued_at"]) < config.AUDIT_BATCH_WINDOW:
+            break                                # partial batch: wait out the window
+        if await _send(db, col, sender, items):
+            sent += 1
+    return sent
+
+
+async def _submit_loop(db) -> None:
+    col = db[AUDIT_OUTBOX_COLLECTION]
+    sender = await asyncio.to_thread(get_sender)
+    while True:
+        sent = 0
+        try:
+            if await _hold_lease(db):
+                sent = await _submit_due(db, col, sender)
+        except asyncio.CancelledError:
+            raise
+        except LeaseLost:
+            print("[⚠] audit submitter lease lost – stopping")
+        except Exception as e:
+            print("⚠️ audit submit pass failed:", e)
+        if not sent:
+            await asyncio.sleep(config.AUDIT_RECEIPT_POLL)
+
+
+def _fetch_receipt(tx_hash: bytes):
+    try:
+        return w3.eth.get_transaction_receipt(tx_hash)
+    except TransactionNotFound:
+        return None
+
+
+def _audit_docs(receipt, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """audit_trail documents for one mined transaction (its outbox items in merkle_index order)."""
+    if not items[0].get("batched"):
+        doc = dict(receipt)
+        doc["record_hash"] = items[0]["record_hash"]
+        doc["queued_at"] = items[0]["queued_at"]
+        return [doc]
+
+    # Batched: the bulky log/bloom fields are the same for every record, so
+    # each per-record document keeps only the receipt summary plus its proof.
+    levels = build_levels([bytes.fromhex(i["record_hash"]) for i in items])
+    summary = {k: v for k, v in dict(receipt).items() if k not in ("logs", "logsBloom")}
+    root = levels[-1][0].hex()
+    docs = []
+    for idx, item in enumerate(items):
+        doc = dict(summary)
+        doc.update({
+            "record_hash": item["record_hash"],
+            "queued_at": item["queued_at"],
+            "merkle_root": root,
+            "merkle_index": idx,
+            "merkle_proof": merkle_proof(levels, idx),
+            "batch_size": len(items),
+        })
+        docs.append(doc)
+    return docs
+
+
+def verify_audit_doc(doc: Dict[str, Any]) -> bool:
+    """
+    True if an audit_trail document's record hash is covered by what was
+    anchored: the record hash itself, or its Merkle proof up to `merkle_root`.
+    """
+    record_hash = bytes.fromhex(doc["record_hash"])
+    if "merkle_root" not in doc:
+        return True
+    return verify_proof(record_hash, doc.get("merkle_proof", []), bytes.fromhex(doc["merkle_root"]))
+
+
+async def _expire(col, sender: str, tx_hash: str, items: List[Dict[str, Any]]) -> None:
+    """A transaction unmined after AUDIT_PENDING_TIMEOUT: requeue or re-broadcast it."""
+    nonce = items[0]["nonce"]
+    mined = await asyncio.to_thread(w3.eth.get_transaction_count, sender, "latest")
+    if await asyncio.to_thread(_fetch_receipt, bytes.fromhex(tx_hash)) is not None:
+        return                                   # mined meanwhile; stored on the next poll
+    if mined > nonce:
+        # Its nonce went to another transaction, so this one can never be
+        # mined: the records go back to pending and get a fresh nonce.
+        await col.update_many(
+            {"tx_hash": tx_hash, "status": "sent"},
+            {"$set": {"status": "pending", "next_attempt": _now(), "last_error": "transaction dropped"},
+             "$unset": {"tx_hash": "", "nonce": "", "sent_at": "", "batched": "", "merkle_index": ""}},
+        )
+        _stats["requeued"] += 1
+        print(f"[⚠] audit tx {tx_hash} dropped (nonce {nonce} used) – requeued {len(items)} record(s)")
+        return
+
+    # Still the next nonce to be mined (or behind a gap that is being
+    # re-sent too): broadcast it again.  A node that still holds it rejects
+    # the duplicate, which is fine; either way the timeout starts over.
+    update: Dict[str, Any] = {"sent_at": _now()}
+    try:
+        anchor = _anchor(items, items[0].get("batched", False))
+        update["tx_hash"] = bytes(await asyncio.to_thread(send_record_hash, anchor, nonce, sender)).hex()
+        _stats["resent"] += 1
+    except Exception as e:
+        print(f"[⚠] audit tx {tx_hash} re-broadcast rejected: {e}")
+    await col.update_many({"tx_hash": tx_hash, "status": "sent"}, {"$set": update})
+
+
+async def _check_receipts(col, audit_col, sender: str) -> None:
+    sent = await (col.find({"status": "sent"})
+                  .sort([("tx_hash", ASCENDING), ("merkle_index", ASCENDING)])
+                  .to_list(length=None))
+    by_tx: Dict[str, List[Dict[str, Any]]] = {}
+    for item in sent:
+        by_tx.setdefault(item["tx_hash"], []).append(item)
+    _stats["in_flight"] = len(by_tx)
+    if not by_tx:
+        return
+
+    hashes = list(by_tx)
+    receipts = await asyncio.gather(
+        *(asyncio.to_thread(_fetch_receipt, bytes.fromhex(h)) for h in hashes),
+        return_exceptions=True,
+    )
+    for tx_hash, receipt in zip(hashes, receipts):
+        items = by_tx[tx_hash]
+        if isinstance(receipt, Exception):
+            continue
+        if receipt is None:
+            if _age(items[0]["sent_at"]) > config.AUDIT_PENDING_TIMEOUT:
+                await _expire(col, sender, tx_hash, items)
+            continue
+
+        try:
+            await audit_col.insert_many(_audit_docs(receipt, items), ordered=False)
+        except Exception as e:
+            print("⚠️ Failed to store blockchain receipt in MongoDB – retrying:", e)
+            continue
+        await col.delete_many({"tx_hash": tx_hash})
+        _confirm_latency.record(_age(items[0]["sent_at"]))
+        if receipt.get("status", 1):
+            _stats["confirmed"] += 1
+            _stats["records_anchored"] += len(items)
+        else:
+            _stats["reverted"] += 1
+
+
+async def _receipt_loop(db) -> None:
+    col = db[AUDIT_OUTBOX_COLLECTION]
+    audit_col = get_audit_collection()
+    sender = await asyncio.to_thread(get_sender)
+    while True:
+        await asyncio.sleep(config.AUDIT_RECEIPT_POLL)
+        try:
+            if await _hold_lease(db):
+                await _check_receipts(col, audit_col, sender)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("⚠️ audit receipt pass failed:", e)
+
+
+async def start_audit_worker(db=None) -> None:
+    """Start the spool, submit and receipt workers (called from the app lifespan)."""
+    if _tasks:
+        return
+    db = default_db if db is None else db
+    col = db[AUDIT_OUTBOX_COLLECTION]
+    await col.create_index([("status", ASCENDING), ("next_attempt", ASCENDING)])
+    await col.create_index([("status", ASCENDING), ("tx_hash", ASCENDING)])
+    _tasks.append(asyncio.create_task(_spool_loop(col)))
+    _tasks.append(asyncio.create_task(_submit_loop(db)))
+    _tasks.append(asyncio.create_task(_receipt_loop(db)))
+    print("[🔗] blockchain audit worker started")
+
+
+async def stop_audit_worker(drain_timeout: float = 5.0) -> None:
+    """Give queued records a moment to reach audit_outbox, then cancel the workers."""
+    if _queue is not None and _tasks:
+        try:
+            await asyncio.wait_for(_queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[⚠] audit queue still holds {_queue.qsize()} records at shutdown")
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+def audit_queue_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "submitter": _leader,
+        "max_in_flight": config.AUDIT_MAX_IN_FLIGHT,
+        "batch_mode": config.AUDIT_BATCH_MODE,
+        "submit_latency": _submit_latency.snapshot(),
+        "confirm_latency": _confirm_latency.snapshot(),
+    }
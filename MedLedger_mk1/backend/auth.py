@@ -19,13 +19,18 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, config.JWT_SECRET_KEY, algorithm=config.JWT_ALGORITHM)
 
 
+def decode_token(token: str) -> dict:
+    """Verify signature and expiry and return the raw JWT payload."""
+    return jwt.decode(token, config.JWT_SECRET_KEY, algorithms=[config.JWT_ALGORITHM])
+
+
 def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """
     Decode the incoming JWT, verify its signature and expiry, and return
     a dict with at least 'username' and 'role'. Raises 401 if invalid.
     """
     try:
-        payload = jwt.decode(token, config.JWT_SECRET_KEY, algorithms=[config.JWT_ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         role: str = payload.get("role")
         if not username or not role:
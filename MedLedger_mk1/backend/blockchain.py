@@ -38,25 +38,45 @@ def compute_patient_hash(patient_data: str) -> bytes:
     return bytes.fromhex(hash_hex)
 
 
-def store_patient_record(patient_data: str):
-    record_hash = compute_patient_hash(patient_data)
-    sender = w3.eth.accounts[0]
+def _signing_key() -> str:
+    key = PRIVATE_KEY.strip().replace("\n", "")
+    if not key.startswith("0x"):
+        key = "0x" + key
+    if not is_valid_private_key(key):
+        raise ValueError("Invalid PRIVATE_KEY format.")
+    return key
+
+
+def get_sender() -> str:
+    return w3.eth.accounts[0]
 
+
+def send_record_hash(record_hash: bytes, nonce: int, sender: str = None) -> bytes:
+    """
+    Build, sign and broadcast storeRecord(record_hash) with an explicit nonce.
+    Returns the tx hash without waiting for it to be mined, so callers (see
+    audit_queue.py) can keep many transactions in flight.
+    """
+    sender = sender or get_sender()
     tx = contract.functions.storeRecord(record_hash).build_transaction({
         'from': sender,
-        'nonce': w3.eth.get_transaction_count(sender),
+        'nonce': nonce,
         'gas': 2000000,
         'gasPrice': w3.to_wei('20', 'gwei')
     })
+    signed_tx = w3.eth.account.sign_transaction(tx, private_key=_signing_key())
+    return w3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
-    key = PRIVATE_KEY.strip().replace("\n", "")
-    if not key.startswith("0x"):
-        key = "0x" + key
-    if not is_valid_private_key(key):
-        raise ValueError("Invalid PRIVATE_KEY format.")
 
-    signed_tx = w3.eth.account.sign_transaction(tx, private_key=key)
-    tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+def store_patient_record(patient_data: str):
+    """
+    Blocking submit-and-wait.  Request handlers should use
+    audit_queue.enqueue_audit() instead; this stays for scripts.
+    """
+    record_hash = compute_patient_hash(patient_data)
+    sender = get_sender()
+
+    tx_hash = send_record_hash(record_hash, w3.eth.get_transaction_count(sender), sender)
     receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
 
     # ✅ Mirror receipt into MongoDB
@@ -0,0 +1,170 @@
+"""
+Array-backed Isolation Forest scorer.
+
+`IsolationForest.predict` validates input, builds a decision-path sparse
+matrix per tree and loops over estimators in Python – fine for big batches,
+but that overhead dominates for our 3-feature vitals rows.  `CompiledForest`
+flattens every tree of a fitted model into a perfect binary heap of the
+forest's max depth, stored as contiguous per-tree rows
+
+    feature, threshold   – inner nodes (padding nodes: threshold = +inf)
+    leaf_value           – depth + c(n_samples) for each bottom-row slot
+
+and scores by walking all (sample, tree) pairs one level at a time with
+NumPy gathers – no child-pointer lookups, no per-tree Python loop.  Scores match sklearn's score_samples() exactly (same
+float32 input cast, same path-length correction); see
+scripts/bench_isoforest.py for the check and timings.
+
+The gathers touch every level of every tree, so sklearn catches up on big
+batches (parity near 6k rows here); model_registry only routes batches of
+up to ISOFOREST_COMPILED_MAX_BATCH rows through this scorer.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional, Sequence
+
+import joblib
+import numpy as np
+
+_CHUNK = 256
+_ARRAYS = ("feature", "threshold", "leaf_value")
+
+
+def _average_path_length(n: np.ndarray) -> np.ndarray:
+    """c(n) from the Isolation Forest paper, as in sklearn.ensemble._iforest."""
+    n = np.asarray(n, dtype=float)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, leaf_value, depth: int,
+                 norm: float, offset: float, n_features: int):
+        self.feature = feature          # (n_trees, 2**depth - 1)
+        self.threshold = threshold      # (n_trees, 2**depth - 1)
+        self.leaf_value = leaf_value    # (n_trees, 2**depth)
+        self.depth = int(depth)
+        self.norm = float(norm)         # n_estimators · c(max_samples)
+        self.offset = float(offset)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        trees = [est.tree_ for est in model.estimators_]
+        depth = max(t.max_depth for t in trees)
+        n_inner, n_leaves = 2 ** depth - 1, 2 ** depth
+
+        feature = np.zeros((len(trees), n_inner), dtype=np.intp)
+        # Padding nodes compare against +inf, so they always go left.
+        threshold = np.full((len(trees), n_inner), np.inf)
+        leaf_value = np.zeros((len(trees), n_leaves))
+
+        for k, (t, est_feats) in enumerate(zip(trees, model.estimators_features_)):
+            path_len = _average_path_length(t.n_node_samples)
+            stack = [(0, 0, 0)]                    # (sklearn node, heap slot, level)
+            while stack:
+                node, slot, level = stack.pop()
+                if t.children_left[node] == -1:
+                    value = level + path_len[node]
+                    # Leaves above the bottom level are pushed down their
+                    # always-left padding chain to the bottom row.
+                    while level < depth:
+                        slot, level = 2 * slot + 1, level + 1
+                    leaf_value[k, slot - n_inner] = value
+                    continue
+                # Trees see X[:, est_feats]; map back to global column numbers.
+                feature[k, slot] = est_feats[t.feature[node]]
+                threshold[k, slot] = t.threshold[node]
+                stack.append((t.children_left[node], 2 * slot + 1, level + 1))
+                stack.append((t.children_right[node], 2 * slot + 2, level + 1))
+
+        norm = len(trees) * _average_path_length(np.array([model._max_samples]))[0]
+        return cls(feature, threshold, leaf_value, depth, norm, model.offset_, model.n_features_in_)
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        """Load a joblib-pickled sklearn IsolationForest and flatten it."""
+        return cls.from_sklearn(joblib.load(path))
+
+    def save(self, directory: str) -> None:
+        """
+        Write the arrays as .npy files plus a meta.json into `directory`.
+        The files are built in a sibling temp dir and renamed into place, so
+        readers never see a partial set; if another process got there first
+        its copy is kept.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        tmp = tempfile.mkdtemp(prefix=".compiled-", dir=parent)
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"depth": self.depth, "norm": self.norm, "offset": self.offset,
+                           "n_features": self.n_features}, f)
+            os.rename(tmp, directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @classmethod
+    def open(cls, directory: str, mmap_mode: Optional[str] = "r") -> Optional["CompiledForest"]:
+        """Arrays saved by save(), memory-mapped read-only; None if there are none."""
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in _ARRAYS]
+        return cls(*arrays, **meta)
+
+    def _prepare(self, X) -> np.ndarray:
+        # sklearn casts to float32 before comparing with (float64) thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"expected {self.n_features} features, got {X.shape[1]}")
+        return X
+
+    def _depths(self, X: np.ndarray) -> np.ndarray:
+        n, n_trees = X.shape[0], self.feature.shape[0]
+        n_inner = self.feature.shape[1]
+        flat_x = X.ravel()
+        # (sample, tree) pairs flattened; every tree is a perfect heap, so a
+        # level is two gathers, a compare and `slot = 2*slot + 1 + went_right`.
+        tree_off = np.tile(np.arange(n_trees) * n_inner, n)
+        row_off = np.repeat(np.arange(n) * self.n_features, n_trees)
+        feat, thr = self.feature.ravel(), self.threshold.ravel()
+        slot = np.zeros(n * n_trees, dtype=np.intp)
+        for _ in range(self.depth):
+            k = tree_off + slot
+            right = flat_x.take(row_off + feat.take(k)) > thr.take(k)
+            slot = 2 * slot + 1 + right
+        leaf = np.tile(np.arange(n_trees) * (n_inner + 1), n) + slot - n_inner
+        return self.leaf_value.ravel().take(leaf).reshape(n, n_trees).sum(axis=1)
+
+    def score_samples(self, X) -> np.ndarray:
+        X = self._prepare(X)
+        # Chunked so the (sample × tree) work arrays stay cache-sized
+        depths = np.concatenate([
+            self._depths(X[i:i + _CHUNK]) for i in range(0, X.shape[0], _CHUNK)
+        ]) if X.shape[0] else np.zeros(0)
+        return -(2.0 ** (-depths / self.norm))
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X) -> np.ndarray:
+        """+1 inlier / -1 anomaly, like IsolationForest.predict."""
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def predict_one(self, row: Sequence[float]) -> int:
+        return int(self.predict(row)[0])
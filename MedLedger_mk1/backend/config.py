@@ -20,3 +20,106 @@ PRIVATE_KEY = os.getenv("PRIVATE_KEY")
 
 RSA_PRIVATE_KEY = os.getenv("RSA_PRIVATE_KEY")
 RSA_PUBLIC_KEY = os.getenv("RSA_PUBLIC_KEY")
+
+# Shared FHIR HTTP client (see fhir_service.py)
+FHIR_HTTP2 = os.getenv("FHIR_HTTP2", "false").lower() in ("1", "true", "yes")
+FHIR_MAX_CONNECTIONS = int(os.getenv("FHIR_MAX_CONNECTIONS", "100"))
+FHIR_MAX_KEEPALIVE = int(os.getenv("FHIR_MAX_KEEPALIVE", "20"))
+FHIR_KEEPALIVE_EXPIRY = float(os.getenv("FHIR_KEEPALIVE_EXPIRY", "30"))  # seconds
+FHIR_TIMEOUT = float(os.getenv("FHIR_TIMEOUT", "15"))                    # seconds
+FHIR_CONNECT_TIMEOUT = float(os.getenv("FHIR_CONNECT_TIMEOUT", "5"))     # seconds
+FHIR_POOL_TIMEOUT = float(os.getenv("FHIR_POOL_TIMEOUT", "5"))           # seconds
+
+# Background blockchain audit queue (see audit_queue.py)
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_MAX_IN_FLIGHT = int(os.getenv("AUDIT_MAX_IN_FLIGHT", "64"))
+AUDIT_RECEIPT_POLL = float(os.getenv("AUDIT_RECEIPT_POLL", "1"))           # seconds
+AUDIT_BATCH_MODE = os.getenv("AUDIT_BATCH_MODE", "false").lower() in ("1", "true", "yes")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "256"))
+AUDIT_BATCH_WINDOW = float(os.getenv("AUDIT_BATCH_WINDOW", "2"))           # seconds
+AUDIT_LEASE_SECONDS = float(os.getenv("AUDIT_LEASE_SECONDS", "30"))         # submitter lease across workers
+AUDIT_PENDING_TIMEOUT = float(os.getenv("AUDIT_PENDING_TIMEOUT", "120"))     # seconds unmined before re-check
+AUDIT_RETRY_BASE = float(os.getenv("AUDIT_RETRY_BASE", "2"))                 # seconds, doubled per failed send
+AUDIT_RETRY_MAX = float(os.getenv("AUDIT_RETRY_MAX", "300"))
+
+# On-chain audit event indexer (see audit_indexer.py)
+AUDIT_INDEX_START_BLOCK = int(os.getenv("AUDIT_INDEX_START_BLOCK", "0"))
+AUDIT_INDEX_CHUNK = int(os.getenv("AUDIT_INDEX_CHUNK", "2000"))              # blocks per get_logs
+AUDIT_INDEX_CONCURRENCY = int(os.getenv("AUDIT_INDEX_CONCURRENCY", "4"))
+AUDIT_INDEX_INTERVAL = float(os.getenv("AUDIT_INDEX_INTERVAL", "15"))         # seconds
+AUDIT_INDEX_LEASE_SECONDS = float(os.getenv("AUDIT_INDEX_LEASE_SECONDS", "60"))  # one indexer across workers
+AUDIT_VERIFY_CHUNK = int(os.getenv("AUDIT_VERIFY_CHUNK", "1000"))            # hashes per $in query
+AUDIT_VERIFY_MAX = int(os.getenv("AUDIT_VERIFY_MAX", "10000"))               # hashes per request
+
+# SSE alert streams (see alert_buffer.py / routes/sse.py)
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))                      # seconds
+SSE_SUBSCRIBER_QUEUE = int(os.getenv("SSE_SUBSCRIBER_QUEUE", "100"))
+
+# Cross-worker alert/vitals fan-out (see fanout.py): "memory" or "mongo"
+FANOUT_BACKEND = os.getenv("FANOUT_BACKEND", "memory").lower()
+FANOUT_COLLECTION = os.getenv("FANOUT_COLLECTION", "fanout_events")
+FANOUT_CAPPED_BYTES = int(os.getenv("FANOUT_CAPPED_BYTES", str(64 * 1024 * 1024)))
+FANOUT_RETRY_DELAY = float(os.getenv("FANOUT_RETRY_DELAY", "1"))             # seconds
+FANOUT_REOPEN_WINDOW = float(os.getenv("FANOUT_REOPEN_WINDOW", "30"))       # seconds of insert skew a reopen still covers
+
+# WebSocket vitals broadcast (see notification.py)
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "32"))                        # frames per socket
+WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop_oldest")                  # drop_oldest | drop_newest | disconnect
+
+# Batch vitals ingest (POST /vitals/batch)
+VITALS_BATCH_MAX = int(os.getenv("VITALS_BATCH_MAX", "5000"))
+
+# Micro-batching Isolation Forest inference (see inference.py)
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "2"))
+ISOFOREST_COMPILED = os.getenv("ISOFOREST_COMPILED", "true").lower() in ("1", "true", "yes")
+ISOFOREST_COMPILED_MAX_BATCH = int(os.getenv("ISOFOREST_COMPILED_MAX_BATCH", "5000"))  # rows; sklearn above
+ISOFOREST_PATH = os.getenv("ISOFOREST_PATH", os.path.join(os.path.dirname(__file__), "isoforest.joblib"))
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.dirname(os.path.abspath(ISOFOREST_PATH)))        # hot-swap source dir
+
+# Vitals storage engine (see vitals_store.py): documents | timeseries | buckets
+VITALS_STORAGE = os.getenv("VITALS_STORAGE", "documents").lower()
+VITALS_BUCKET_SECONDS = int(os.getenv("VITALS_BUCKET_SECONDS", "3600"))      # bucket span
+VITALS_BUCKET_MAX = int(os.getenv("VITALS_BUCKET_MAX", "720"))               # samples per bucket
+VITALS_ROLLUP_MAX_POINTS = int(os.getenv("VITALS_ROLLUP_MAX_POINTS", "1500"))  # finest rollup under this many periods
+VITALS_CHART_MAX_POINTS = int(os.getenv("VITALS_CHART_MAX_POINTS", "2000"))    # per-series cap for /vitals_chart
+
+# In-memory recent vitals/alerts per key (see vitals_ring.py)
+VITALS_RING_DEPTH = int(os.getenv("VITALS_RING_DEPTH", "100"))                # readings per patient
+VITALS_RING_IDLE_SECONDS = float(os.getenv("VITALS_RING_IDLE_SECONDS", "3600"))
+VITALS_RING_MAX_BYTES = int(os.getenv("VITALS_RING_MAX_BYTES", str(512 * 1024 * 1024)))  # per buffer
+
+# username ↔ FHIR Patient.id cache (see identity_cache.py)
+IDENTITY_TTL = float(os.getenv("IDENTITY_TTL", "600"))                        # seconds
+IDENTITY_NEGATIVE_TTL = float(os.getenv("IDENTITY_NEGATIVE_TTL", "30"))       # "no such patient"
+IDENTITY_MAX_ENTRIES = int(os.getenv("IDENTITY_MAX_ENTRIES", "200000"))
+
+# FHIR read coalescing (see fhir_service.fhir_get)
+FHIR_COALESCE = os.getenv("FHIR_COALESCE", "true").lower() in ("1", "true", "yes")
+FHIR_MICRO_TTL = float(os.getenv("FHIR_MICRO_TTL", "0"))                     # seconds; 0 = off
+FHIR_MICRO_CACHE_MAX = int(os.getenv("FHIR_MICRO_CACHE_MAX", "1000"))
+FHIR_CONDITIONAL = os.getenv("FHIR_CONDITIONAL", "true").lower() in ("1", "true", "yes")  # ETag revalidation
+FHIR_ETAG_CACHE_MAX = int(os.getenv("FHIR_ETAG_CACHE_MAX", "5000"))          # cached validated responses
+
+# Mirror → FHIR resync (see sync_fhir.py)
+FHIR_SYNC_CONCURRENCY = int(os.getenv("FHIR_SYNC_CONCURRENCY", "8"))          # docs replayed at once
+FHIR_SYNC_BUNDLE_SIZE = int(os.getenv("FHIR_SYNC_BUNDLE_SIZE", "50"))         # resources per replay Bundle; 1 = per-item POSTs
+FHIR_SYNC_BUNDLE_TYPE = os.getenv("FHIR_SYNC_BUNDLE_TYPE", "batch")           # batch | transaction
+FHIR_BACKFILL_BATCH = int(os.getenv("FHIR_BACKFILL_BATCH", "50"))            # usernames per Patient?identifier= search
+FHIR_RESYNC_LEASE_SECONDS = float(os.getenv("FHIR_RESYNC_LEASE_SECONDS", "600"))  # one resync across workers
+
+# Durable outbox for failed FHIR replays (see fhir_outbox.py)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))             # then dead-lettered
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))            # seconds
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))           # seconds
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "200"))                          # items per pass
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))          # seconds
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "30"))         # worker lease
+OUTBOX_DONE_TTL = int(os.getenv("OUTBOX_DONE_TTL", str(7 * 24 * 3600)))      # keep delivered items
+
+# Read policy for per-patient clinical lists (see mirror_reads.py): fhir-first | mirror-first
+FHIR_READ_POLICY = os.getenv("FHIR_READ_POLICY", "fhir-first").lower()
+MIRROR_FRESH_SECONDS = float(os.getenv("MIRROR_FRESH_SECONDS", "30"))         # served from the mirror as-is
+MIRROR_MAX_STALENESS = float(os.getenv("MIRROR_MAX_STALENESS", "300"))        # served + refreshed in background
+MIRROR_FHIR_TIMEOUT = float(os.getenv("MIRROR_FHIR_TIMEOUT", "5"))            # seconds before falling back
+MIRROR_READ_LIMIT = int(os.getenv("MIRROR_READ_LIMIT", "100"))                # resources per list
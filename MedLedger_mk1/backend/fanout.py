@@ -0,0 +1,190 @@
+"""
+Cross-worker fan-out for alerts and vitals.
+
+Producers call `publish(kind, key, payload)`; every worker then runs the
+local handler registered for `kind` (see alert_buffer.py / notification.py),
+which updates its in-memory buffers and wakes its own SSE/WebSocket clients.
+
+FANOUT_BACKEND selects how messages travel:
+
+  memory – handlers run in-process (single worker, the default)
+  mongo  – messages are appended to a capped collection and every worker
+           follows it with a tailable await cursor; works on a standalone
+           mongod (no replica set needed), and the cap bounds storage.
+"""
+
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+import config
+
+Handler = Callable[[str, Dict[str, Any]], Union[None, Awaitable[None]]]
+
+_handlers: Dict[str, Handler] = {}
+_stats: Dict[str, int] = {"published": 0, "delivered": 0, "handler_errors": 0, "publish_errors": 0}
+
+
+def register_handler(kind: str, handler: Handler) -> None:
+    """`handler(key, payload)` runs on every worker for each `kind` message."""
+    _handlers[kind] = handler
+
+
+async def _dispatch(kind: str, key: str, payload: Dict[str, Any]) -> None:
+    handler = _handlers.get(kind)
+    if handler is None:
+        return
+    try:
+        result = handler(key, payload)
+        if asyncio.iscoroutine(result):
+            await result
+        _stats["delivered"] += 1
+    except Exception as e:
+        _stats["handler_errors"] += 1
+        print(f"⚠️ fan-out handler for {kind} failed:", e)
+
+
+class InProcessBackend:
+    name = "memory"
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, kind: str, key: str, payload: Dict[str, Any]) -> None:
+        handler = _handlers.get(kind)
+        if handler is None:
+            return
+        try:
+            result = handler(key, payload)
+            if asyncio.iscoroutine(result):
+                asyncio.get_running_loop().create_task(result)
+            _stats["delivered"] += 1
+        except Exception as e:
+            _stats["handler_errors"] += 1
+            print(f"⚠️ fan-out handler for {kind} failed:", e)
+
+
+class MongoCappedBackend:
+    """
+    Publish = insert into a capped collection; every worker (including the
+    publisher) delivers by tailing it, so all of them see the same stream in
+    the same order.
+    """
+    name = "mongo"
+
+    def __init__(self, db, collection: str, size_bytes: int):
+        self._db = db
+        self._name = collection
+        self._size = size_bytes
+        self._col = db[collection]
+        self._task: Optional[asyncio.Task] = None
+        self._inserts: set = set()             # publish tasks, kept referenced until done
+        self._origin = f"{os.uname().nodename}:{os.getpid()}"
+
+    async def start(self) -> None:
+        try:
+            await self._db.create_collection(self._name, capped=True, size=self._size)
+        except CollectionInvalid:
+            pass                                   # already exists
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def publish(self, kind: str, key: str, payload: Dict[str, Any]) -> None:
+        doc = {"kind": kind, "key": key, "payload": payload, "origin": self._origin}
+        task = asyncio.get_running_loop().create_task(self._col.insert_one(doc))
+        self._inserts.add(task)
+        task.add_done_callback(self._insert_done)
+
+    def _insert_done(self, task: asyncio.Task) -> None:
+        self._inserts.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _stats["publish_errors"] += 1
+            print("⚠️ fan-out publish failed:", task.exception())
+
+    async def _tail(self) -> None:
+        # Start at the current end: workers only care about live traffic.
+        last = await self._col.find_one(sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            # ObjectIds from different workers are not ordered, so resume by
+            # position: tail in natural (insertion) order and skip up to the
+            # last doc we delivered.  Only docs whose ObjectId is at most
+            # FANOUT_REOPEN_WINDOW older than that one can follow it, so the
+            # server filters out the rest instead of sending the whole
+            # collection.  If that doc has already been overwritten by the
+            # cap, replay whatever is left.
+            query: Dict[str, Any] = {}
+            skipping = False
+            if last_id is not None and await self._col.find_one({"_id": last_id}, {"_id": 1}) is not None:
+                since = last_id.generation_time - timedelta(seconds=config.FANOUT_REOPEN_WINDOW)
+                query = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+                skipping = True
+            cursor = self._col.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        if skipping:
+                            skipping = doc["_id"] != last_id
+                            continue
+                        last_id = doc["_id"]
+                        await _dispatch(doc["kind"], doc["key"], doc["payload"])
+                    await asyncio.sleep(0)        # cursor timed out with no data
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("⚠️ fan-out tail cursor failed, reopening:", e)
+            await asyncio.sleep(config.FANOUT_RETRY_DELAY)
+
+
+_backend: Union[InProcessBackend, MongoCappedBackend] = InProcessBackend()
+
+
+async def start_fanout(db) -> None:
+    """Pick the backend from FANOUT_BACKEND (called from the app lifespan)."""
+    global _backend
+    if config.FANOUT_BACKEND == "mongo":
+        _backend = MongoCappedBackend(db, config.FANOUT_COLLECTION, config.FANOUT_CAPPED_BYTES)
+    else:
+        _backend = InProcessBackend()
+    await _backend.start()
+    print(f"[📡] fan-out backend: {_backend.name}")
+
+
+async def stop_fanout() -> None:
+    await _backend.stop()
+
+
+def publish(kind: str, key: str, payload: Dict[str, Any]) -> None:
+    _stats["published"] += 1
+    _backend.publish(kind, key, payload)
+
+
+_last_seq = 0
+
+
+def next_seq() -> int:
+    """
+    Event id that increases within a worker and is roughly time-ordered
+    across workers (microseconds since the epoch), so a Last-Event-ID from
+    one worker is still meaningful on another.
+    """
+    global _last_seq
+    _last_seq = max(_last_seq + 1, time.time_ns() // 1000)
+    return _last_seq
+
+
+def fanout_stats() -> Dict[str, Any]:
+    return {"backend": _backend.name, **_stats}
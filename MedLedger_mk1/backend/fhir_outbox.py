@@ -0,0 +1,308 @@
+"""
+Durable outbox for mirror → FHIR writes that failed.
+
+When a replay fails (sync_fhir._mark_failed), the mirrored document is
+handed to `enqueue()`, which upserts one item into `fhir_outbox`:
+
+    {_id: "<collection>:<doc _id>", collection, doc_id, resource_type,
+     patient_key, status: pending|done|dead, attempts, next_attempt,
+     last_error, created_at, updated_at}
+
+From then on the periodic resync leaves the document alone, and
+`run_outbox_worker` owns the retries:
+
+  * exponential backoff with jitter: OUTBOX_BACKOFF_BASE · 2^(attempts-1),
+    capped at OUTBOX_BACKOFF_MAX, scaled by a random factor in [0.5, 1]
+  * per-patient ordering: items are keyed on the FHIR patient id, and only
+    the oldest pending item of each patient is eligible, so a backing-off
+    item holds back the ones queued after it.  While a patient has pending
+    items the resync queues that patient's other dirty docs here too
+    (`blocked_patients`) instead of replaying them ahead of the queue.
+  * docs that already carry a fhir_id are verified first and only re-POSTed
+    if the server answers 404/410
+  * after OUTBOX_MAX_ATTEMPTS an item goes to `dead` (see
+    scripts/outbox_admin.py to inspect and requeue)
+  * once an item is done or dead its mirror doc loses the `outbox` flag,
+    so a dead doc that is still unsynced is offered to the resync again
+  * one active worker across all uvicorn processes, elected through a
+    lease document in `fhir_leases` (`acquire_lease`).  The lease is renewed
+    before every FHIR call of a pass, and the pass stops if it was lost.
+
+The item only references the mirror document; the payload is always read
+from there, so the mirror stays the single source of truth.
+"""
+
+import asyncio
+import os
+import random
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import config
+from identity_cache import identity
+
+OUTBOX_COLLECTION = "fhir_outbox"
+LEASE_COLLECTION = "fhir_leases"
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_indexes_ready = False
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(config.OUTBOX_BACKOFF_MAX, config.OUTBOX_BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _lease_ttl() -> float:
+    # must outlive the slowest single FHIR call made between two renewals
+    floor = config.FHIR_POOL_TIMEOUT + config.FHIR_CONNECT_TIMEOUT + 2 * config.FHIR_TIMEOUT
+    return max(config.OUTBOX_LEASE_SECONDS, floor)
+
+
+class LeaseLost(Exception):
+    """Another worker took the outbox lease during a pass."""
+
+
+async def patient_key(coll_name: str, doc: Dict[str, Any]) -> str:
+    """
+    Ordering key: the FHIR patient id (resolved from the username if the
+    doc has none), else the username of a patient not on FHIR yet.  Docs
+    that name no patient are independent.
+    """
+    pid = doc.get("patient_id")
+    username = doc.get("username")
+    if not pid and username:
+        try:
+            pid = await identity.patient_id_for(username)
+        except Exception:
+            pid = None
+    if pid:
+        return str(pid)
+    if username:
+        return f"user:{username}"
+    return f"{coll_name}:{doc['_id']}"
+
+
+async def blocked_patients(db) -> set:
+    """Patient keys with pending outbox items; the resync defers their docs."""
+    return set(await db[OUTBOX_COLLECTION].distinct("patient_key", {"status": "pending"}))
+
+
+async def ensure_outbox_indexes(db) -> None:
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    col = db[OUTBOX_COLLECTION]
+    await col.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    await col.create_index([("status", ASCENDING), ("next_attempt", ASCENDING)])
+    await col.create_index("done_at", expireAfterSeconds=config.OUTBOX_DONE_TTL, sparse=True)
+    _indexes_ready = True
+
+
+async def acquire_lease(db, name: str, ttl: float, owner: str = _OWNER) -> bool:
+    """Take or renew lease `name` for `ttl` seconds; False if someone else holds it."""
+    now = _now()
+    try:
+        doc = await db[LEASE_COLLECTION].find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"expires": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires": now + timedelta(seconds=ttl), "renewed_at": now}},
+            upsert=True,
+            return_document=True,
+        )
+    except DuplicateKeyError:
+        return False                      # held by another live owner
+    return doc is not None and doc.get("owner") == owner
+
+
+async def release_lease(db, name: str, owner: str = _OWNER) -> None:
+    await db[LEASE_COLLECTION].delete_one({"_id": name, "owner": owner})
+
+
+async def enqueue(db, coll_name: str, doc: Dict[str, Any], error: Optional[str] = None,
+                  key: Optional[str] = None, failed: bool = True) -> None:
+    """
+    Hand a mirror document to the outbox (idempotent per document).
+    `failed=False` queues it behind its patient's pending items without
+    counting an attempt.
+    """
+    await ensure_outbox_indexes(db)
+    now = _now()
+    attempts = 1 if failed else 0           # the failed replay that got us here
+    await db[OUTBOX_COLLECTION].update_one(
+        {"_id": f"{coll_name}:{doc['_id']}"},
+        {
+            "$setOnInsert": {
+                "collection": coll_name,
+                "doc_id": doc["_id"],
+                "resource_type": (doc.get("payload") or {}).get("resourceType"),
+                "patient_key": key or await patient_key(coll_name, doc),
+                "status": "pending",
+                "attempts": attempts,
+                "next_attempt": now + backoff(1) if failed else now,
+                "created_at": doc.get("timestamp") or now,
+            },
+            "$set": {"last_error": error, "updated_at": now},
+        },
+        upsert=True,
+    )
+    await db[coll_name].update_one({"_id": doc["_id"]}, {"$set": {"outbox": True}})
+
+
+async def _due_heads(db, limit: int) -> List[Dict[str, Any]]:
+    """Oldest pending item per patient, if it is due."""
+    pipeline = [
+        {"$match": {"status": "pending"}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": "$patient_key", "item": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$item"}},
+        {"$match": {"next_attempt": {"$lte": _now()}}},
+        {"$sort": {"created_at": 1}},
+        {"$limit": limit},
+    ]
+    return await db[OUTBOX_COLLECTION].aggregate(pipeline).to_list(length=limit)
+
+
+async def process_due(db) -> Dict[str, int]:
+    """One outbox pass: replay every due head item, then record the outcomes."""
+    # Lazy import: sync_fhir imports this module to enqueue failures
+    from sync_fhir import RESOURCE_COLLECTIONS, _post_bundle, _post_doc, _verify_doc
+
+    async def _keep_lease() -> None:
+        if not await acquire_lease(db, "fhir_outbox", _lease_ttl()):
+            raise LeaseLost()
+
+    stats = {"picked": 0, "done": 0, "retry": 0, "dead": 0,
+             "replayed": 0, "failed": 0, "bundles": 0, "verified": 0}
+    items = await _due_heads(db, config.OUTBOX_BATCH)
+    stats["picked"] = len(items)
+    if not items:
+        return stats
+
+    by_coll: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        by_coll.setdefault(item["collection"], []).append(item)
+
+    now = _now()
+    ops = []
+    settled: Dict[str, list] = {}            # mirror docs whose item is done/dead, per collection
+    for coll_name, group in by_coll.items():
+        coll = db[coll_name]
+        fhir_type = RESOURCE_COLLECTIONS.get(coll_name)
+        ids = [i["doc_id"] for i in group]
+        docs = {d["_id"]: d async for d in coll.find({"_id": {"$in": ids}})}
+
+        pending = [d for d in docs.values()
+                   if not d.get("synced") and (d.get("payload") or {}).get("resourceType") == fhir_type]
+
+        # A doc with a fhir_id may already be on the server (it got here
+        # because its verify GET failed): re-POST it only on a real 404/410.
+        to_post, check_errors = [], {}
+        for d in pending:
+            if not d.get("fhir_id"):
+                to_post.append(d)
+                continue
+            await _keep_lease()
+            try:
+                if not await _verify_doc(coll, fhir_type, d, stats):
+                    to_post.append(d)
+            except Exception as exc:
+                check_errors[d["_id"]] = str(exc)
+
+        size = max(1, config.FHIR_SYNC_BUNDLE_SIZE)
+        retry = to_post
+        if size > 1 and len(to_post) > 1:
+            retry = []
+            for i in range(0, len(to_post), size):
+                await _keep_lease()
+                retry += await _post_bundle(coll, fhir_type, to_post[i:i + size], stats)
+        for d in retry:
+            await _keep_lease()
+            await _post_doc(coll, fhir_type, d, stats)
+
+        after = {d["_id"]: d async for d in coll.find(
+            {"_id": {"$in": ids}}, {"synced": 1, "error": 1, "payload.resourceType": 1})}
+        for item in group:
+            d = after.get(item["doc_id"])
+            if d is None or d.get("synced"):
+                # synced now (or the mirror doc is gone): nothing left to deliver
+                ops.append(UpdateOne({"_id": item["_id"]},
+                                     {"$set": {"status": "done", "done_at": now, "updated_at": now}}))
+                settled.setdefault(coll_name, []).append(item["doc_id"])
+                stats["done"] += 1
+                continue
+            attempts = item.get("attempts", 0) + 1
+            error = check_errors.get(item["doc_id"]) or d.get("error")
+            if (d.get("payload") or {}).get("resourceType") != fhir_type:
+                error = f"payload is not a {fhir_type}"
+                attempts = config.OUTBOX_MAX_ATTEMPTS
+            if attempts >= config.OUTBOX_MAX_ATTEMPTS:
+                update = {"status": "dead", "dead_at": now}
+                settled.setdefault(coll_name, []).append(item["doc_id"])
+                stats["dead"] += 1
+            else:
+                update = {"next_attempt": now + backoff(attempts)}
+                stats["retry"] += 1
+            ops.append(UpdateOne({"_id": item["_id"]}, {"$set": {
+                **update, "attempts": attempts, "last_error": error, "updated_at": now,
+            }}))
+
+    if ops:
+        await db[OUTBOX_COLLECTION].bulk_write(ops, ordered=False)
+    # The outbox no longer owns these docs: hand them back to the resync
+    for coll_name, doc_ids in settled.items():
+        await db[coll_name].update_many({"_id": {"$in": doc_ids}}, {"$unset": {"outbox": ""}})
+    print(f"[📤] outbox: {stats['done']} delivered, {stats['retry']} backing off, {stats['dead']} dead")
+    return stats
+
+
+async def run_outbox_worker(db) -> None:
+    """Background loop (app lifespan); only the lease holder does any work."""
+    await ensure_outbox_indexes(db)
+    while True:
+        busy = False
+        try:
+            if await acquire_lease(db, "fhir_outbox", _lease_ttl()):
+                busy = (await process_due(db))["picked"] >= config.OUTBOX_BATCH
+        except asyncio.CancelledError:
+            raise
+        except LeaseLost:
+            # outcomes of this pass are picked up from the mirror docs next time
+            print("[⚠] outbox lease lost mid-pass – stopping")
+        except Exception as e:
+            print("⚠️ outbox pass failed:", e)
+        if not busy:
+            await asyncio.sleep(config.OUTBOX_POLL_INTERVAL)
+
+
+async def outbox_stats(db) -> Dict[str, Any]:
+    """Backlog size, lag of the oldest pending item, and dead letters."""
+    col = db[OUTBOX_COLLECTION]
+    now = _now()
+    counts = {d["_id"]: d["n"] async for d in col.aggregate(
+        [{"$group": {"_id": "$status", "n": {"$sum": 1}}}])}
+    oldest = await col.find_one({"status": "pending"}, sort=[("created_at", 1)])
+    due = await col.count_documents({"status": "pending", "next_attempt": {"$lte": now}})
+    lease = await db[LEASE_COLLECTION].find_one({"_id": "fhir_outbox"}, {"_id": 0})
+
+    lag = None
+    if oldest:
+        created = oldest["created_at"]
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        lag = round((now - created).total_seconds(), 1)
+    return {
+        "pending": counts.get("pending", 0),
+        "due": due,
+        "dead": counts.get("dead", 0),
+        "done_retained": counts.get("done", 0),
+        "oldest_pending_lag_s": lag,
+        "lease": lease,
+    }
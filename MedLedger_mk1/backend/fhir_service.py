@@ -1,20 +1,310 @@
 
+import asyncio
+import time
+from collections import OrderedDict
 import httpx
-from typing import List, Dict
+from typing import List, Dict, Optional, Any, Tuple
+import config
 from config import FHIR_SERVER_URL
 
+# One pooled client per process, opened in the app lifespan (app.py).
+# Scripts that never run the lifespan get a lazily created client instead.
+_client: Optional[httpx.AsyncClient] = None
+_http2_enabled = False
+
+_stats: Dict[str, int] = {
+    "requests": 0,
+    "errors": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+}
+
+# GET coalescing: identical concurrent reads share one upstream task, and
+# (if FHIR_MICRO_TTL > 0) a successful answer is reused for that long.
+_inflight: Dict[Tuple, "asyncio.Task[httpx.Response]"] = {}
+_write_gen = 0                      # bumped by our own writes; see _forget_reads
+_micro: "OrderedDict[Tuple, Tuple[float, httpx.Response]]" = OrderedDict()
+_read_stats: Dict[str, int] = {
+    "gets": 0,
+    "upstream_gets": 0,
+    "coalesced": 0,
+    "micro_cache_hits": 0,
+    "revalidated": 0,
+    "not_modified": 0,
+}
+
+# Conditional-request cache: the last 200 per URL that carried an ETag or
+# Last-Modified, revalidated with If-None-Match / If-Modified-Since.
+_validated: "OrderedDict[Tuple, httpx.Response]" = OrderedDict()
+
+
+def _build_client() -> httpx.AsyncClient:
+    global _http2_enabled
+    http2 = config.FHIR_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        except ImportError:
+            print("[⚠] FHIR_HTTP2 set but 'h2' is not installed – falling back to HTTP/1.1")
+            http2 = False
+    _http2_enabled = http2
+
+    return httpx.AsyncClient(
+        base_url=f"{FHIR_SERVER_URL}/",
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.FHIR_MAX_CONNECTIONS,
+            max_keepalive_connections=config.FHIR_MAX_KEEPALIVE,
+            keepalive_expiry=config.FHIR_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            config.FHIR_TIMEOUT,
+            connect=config.FHIR_CONNECT_TIMEOUT,
+            pool=config.FHIR_POOL_TIMEOUT,
+        ),
+        headers={"Accept": "application/fhir+json"},
+    )
+
+
+async def open_fhir_client() -> httpx.AsyncClient:
+    """Create the shared client (called once from the app lifespan)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        print(f"[🔌] FHIR client pool ready (http2={_http2_enabled})")
+    return _client
+
+
+async def close_fhir_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_fhir_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def fhir_request(
+    method: str,
+    path: str,
+    *,
+    params: Optional[Dict[str, Any]] = None,
+    json: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Any = httpx.USE_CLIENT_DEFAULT,
+) -> httpx.Response:
+    """
+    Send one request to the FHIR server through the shared pool.
+    `path` is relative to FHIR_SERVER_URL ("Patient/123"); absolute URLs are
+    passed through untouched (used by the /metadata probe).
+    """
+    client = get_fhir_client()
+    _stats["requests"] += 1
+    _stats["in_flight"] += 1
+    _stats["max_in_flight"] = max(_stats["max_in_flight"], _stats["in_flight"])
+    try:
+        return await client.request(
+            method, path, params=params, json=json, headers=headers, timeout=timeout
+        )
+    except httpx.HTTPError:
+        _stats["errors"] += 1
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+
+
+def _read_key(path: str, params: Optional[Dict[str, Any]]) -> Tuple:
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return (path, tuple(items))
+
+
+def _clone(resp: httpx.Response) -> httpx.Response:
+    """
+    A private copy of a shared response.  The body bytes are shared, but each
+    caller parses its own JSON, because some routes edit the resource they
+    read (e.g. add_additional_details) before PUTting it back.
+    """
+    # .content is already decoded, so drop the transfer-level headers
+    headers = [(k, v) for k, v in resp.headers.multi_items()
+               if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+    return httpx.Response(resp.status_code, headers=headers,
+                          content=resp.content, request=resp.request)
+
+
+async def fhir_get(path: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> httpx.Response:
+    """
+    GET through the coalescing layer and the conditional (ETag) cache.
+    Requests with custom headers bypass both, because their answer may differ.
+    """
+    if kwargs.get("headers"):
+        return await fhir_request("GET", path, params=params, **kwargs)
+
+    _read_stats["gets"] += 1
+    key = _read_key(path, params)
+    if not config.FHIR_COALESCE:
+        return _clone(await _conditional_get(key, path, params, **kwargs))
+    gen = _write_gen
+
+    if config.FHIR_MICRO_TTL > 0:
+        hit = _micro.get(key)
+        if hit is not None:
+            if hit[0] > time.monotonic():
+                _read_stats["micro_cache_hits"] += 1
+                return _clone(hit[1])
+            del _micro[key]
+
+    # Keyed by write generation: a read issued after one of our writes never
+    # joins (or caches) a fetch that started before it.
+    task = _inflight.get((gen, key))
+    if task is not None:
+        _read_stats["coalesced"] += 1
+    else:
+        _read_stats["upstream_gets"] += 1
+        # Its own task, so one caller going away does not cancel the others
+        task = asyncio.ensure_future(_conditional_get(key, path, params, **kwargs))
+        _inflight[(gen, key)] = task
+        task.add_done_callback(lambda t, key=key, gen=gen: _read_done(key, gen, t))
+    resp = await asyncio.shield(task)
+    return _clone(resp)
+
+
+async def _conditional_get(key: Tuple, path: str, params, **kwargs) -> httpx.Response:
+    """One upstream GET, turned into a 304 revalidation when we hold validators."""
+    cached = _validated.get(key) if config.FHIR_CONDITIONAL else None
+    headers = None
+    if cached is not None:
+        headers = {}
+        if "etag" in cached.headers:
+            headers["If-None-Match"] = cached.headers["etag"]
+        if "last-modified" in cached.headers:
+            headers["If-Modified-Since"] = cached.headers["last-modified"]
+        _read_stats["revalidated"] += 1
+
+    resp = await fhir_request("GET", path, params=params, headers=headers, **kwargs)
+    if resp.status_code == 304 and cached is not None:
+        _read_stats["not_modified"] += 1
+        _validated.move_to_end(key)
+        return cached
+    if config.FHIR_CONDITIONAL and resp.status_code == 200 and (
+        "etag" in resp.headers or "last-modified" in resp.headers
+    ):
+        _validated[key] = resp
+        _validated.move_to_end(key)
+        while len(_validated) > config.FHIR_ETAG_CACHE_MAX:
+            _validated.popitem(last=False)
+    elif cached is not None:
+        _validated.pop(key, None)
+    return resp
+
+
+def _read_done(key: Tuple, gen: int, task: "asyncio.Task[httpx.Response]") -> None:
+    if _inflight.get((gen, key)) is task:
+        del _inflight[(gen, key)]
+    if task.cancelled() or task.exception() is not None:
+        return
+    if config.FHIR_MICRO_TTL <= 0 or gen != _write_gen:
+        return
+    resp = task.result()
+    if resp.status_code == 200:
+        _micro[key] = (time.monotonic() + config.FHIR_MICRO_TTL, resp)
+        _micro.move_to_end(key)
+        while len(_micro) > config.FHIR_MICRO_CACHE_MAX:
+            _micro.popitem(last=False)
+
+
+def _forget_reads(path: str) -> None:
+    """
+    Called before each of our own writes.  The micro cache is simply cleared,
+    because its TTL is tiny.  Validated entries are dropped for the resource
+    type that was written, so a write to `Observation/…` also drops every
+    `Observation?...` search.  A Bundle POSTed to the base URL can touch any
+    type, so it drops all of them.
+    """
+    global _write_gen
+    _write_gen += 1
+    _micro.clear()
+    rtype = path.strip("/").split("/")[0].split("?")[0]
+    if not rtype:                               # Bundle POSTed to the base URL
+        _validated.clear()
+        return
+    for key in [k for k in _validated if k[0].strip("/").split("/")[0] == rtype]:
+        del _validated[key]
+
+
+def invalidate_fhir_cache(path: Optional[str] = None) -> None:
+    """Drop cached reads for `path`'s resource type (or everything)."""
+    if path:
+        _forget_reads(path)
+    else:
+        _micro.clear()
+        _validated.clear()
+
+
+async def fhir_post(path: str, json: Any, **kwargs) -> httpx.Response:
+    kwargs.setdefault("headers", {"Content-Type": "application/fhir+json"})
+    _forget_reads(path)
+    return await fhir_request("POST", path, json=json, **kwargs)
+
+
+async def fhir_put(path: str, json: Any, **kwargs) -> httpx.Response:
+    kwargs.setdefault("headers", {"Content-Type": "application/fhir+json"})
+    _forget_reads(path)
+    return await fhir_request("PUT", path, json=json, **kwargs)
+
+
+async def fhir_delete(path: str, **kwargs) -> httpx.Response:
+    _forget_reads(path)
+    return await fhir_request("DELETE", path, **kwargs)
+
+
+def fhir_pool_stats() -> Dict[str, Any]:
+    """
+    Request counters plus a snapshot of the underlying httpcore pool, so the
+    limits above can be sized under load.
+    """
+    stats: Dict[str, Any] = dict(_stats)
+    stats["reads"] = {
+        **_read_stats,
+        "in_flight_keys": len(_inflight),
+        "micro_cache_entries": len(_micro),
+        "micro_ttl": config.FHIR_MICRO_TTL,
+        "validated_entries": len(_validated),
+    }
+    stats["limits"] = {
+        "max_connections": config.FHIR_MAX_CONNECTIONS,
+        "max_keepalive": config.FHIR_MAX_KEEPALIVE,
+        "keepalive_expiry": config.FHIR_KEEPALIVE_EXPIRY,
+        "http2": _http2_enabled,
+    }
+
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    if pool is None:
+        stats["pool"] = None
+        return stats
+
+    connections = list(getattr(pool, "connections", []))
+    queued = [r for r in getattr(pool, "_requests", []) if getattr(r, "is_queued", lambda: False)()]
+    stats["pool"] = {
+        "connections": len(connections),
+        "idle": sum(1 for c in connections if c.is_idle()),
+        "active": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+        "http2": sum(1 for c in connections if "HTTP/2" in c.info()),
+        "queued_requests": len(queued),
+    }
+    return stats
+
 
 async def fetch_fhir_resources(kind: str, params: Dict[str, str]) -> List[Dict]:
     """
     GET [FHIR_SERVER_URL]/<kind>?<params>
     Returns the list of resources from Bundle.entry[].resource
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{FHIR_SERVER_URL}/{kind}",
-            params=params,
-            headers={"Accept": "application/fhir+json"}
-        )
+    resp = await fhir_get(kind, params=params)
     resp.raise_for_status()
     bundle = resp.json()
     entries = bundle.get("entry", [])
@@ -27,11 +317,6 @@ async def create_fhir_resource(kind: str, resource_body: Dict) -> Dict:
     with JSON body = a FHIR resource
     Returns the created resource (as returned by HAPI)
     """
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            f"{FHIR_SERVER_URL}/{kind}",
-            json=resource_body,
-            headers={"Content-Type": "application/fhir+json"}
-        )
+    resp = await fhir_post(kind, json=resource_body)
     resp.raise_for_status()
     return resp.json()
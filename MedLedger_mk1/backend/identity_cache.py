@@ -0,0 +1,178 @@
+"""
+Bidirectional username ↔ FHIR Patient.id cache.
+
+The /patients/me/* routes need the patient id for a username, and the
+doctor create_* routes need the username for a patient id.  Both used to
+ask FHIR on every call.  Now they go through `patient_id_for()` and
+`username_for()`, which check this cache first:
+
+  * entries live for IDENTITY_TTL seconds, and the least recently used are
+    evicted past IDENTITY_MAX_ENTRIES
+  * "no such patient" answers are cached too (negative entries), but only
+    for IDENTITY_NEGATIVE_TTL seconds, so a freshly registered user shows
+    up quickly
+  * FHIR errors are never cached; they propagate to the caller
+
+The cache is seeded from `patients_basic` at startup and refreshed by
+sync_fhir.update_patient_ids_from_usernames().  Writes that change the
+mapping call `remember()` or `invalidate()`.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import config
+from config import USERNAME_SYSTEM
+from fhir_service import fhir_get
+
+_MISSING = object()
+
+
+class _TTLMap:
+    """LRU map whose values expire; `None` values are negative entries."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Optional[str], ttl: float) -> None:
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str) -> Optional[str]:
+        item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class IdentityCache:
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._by_user = _TTLMap(max_entries)
+        self._by_pid = _TTLMap(max_entries)
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "fhir_lookups": 0, "invalidations": 0}
+
+    # -- writes ---------------------------------------------------------------
+    def remember(self, username: str, patient_id: str) -> None:
+        """Record a known mapping in both directions."""
+        old_pid = self._by_user.get(username)
+        if old_pid not in (_MISSING, None, patient_id):
+            self._by_pid.pop(old_pid)
+        self._by_user.put(username, patient_id, self.ttl)
+        self._by_pid.put(patient_id, username, self.ttl)
+
+    def invalidate(self, username: Optional[str] = None, patient_id: Optional[str] = None) -> None:
+        if username:
+            pid = self._by_user.pop(username)
+            if pid:
+                self._by_pid.pop(pid)
+        if patient_id:
+            user = self._by_pid.pop(patient_id)
+            if user:
+                self._by_user.pop(user)
+        self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        self._by_user.clear()
+        self._by_pid.clear()
+
+    # -- reads ----------------------------------------------------------------
+    def _cached(self, table: _TTLMap, key: str):
+        value = table.get(key)
+        if value is _MISSING:
+            self._stats["misses"] += 1
+        elif value is None:
+            self._stats["negative_hits"] += 1
+        else:
+            self._stats["hits"] += 1
+        return value
+
+    async def patient_id_for(self, username: str) -> Optional[str]:
+        """FHIR Patient.id for `username`, or None if no such patient."""
+        pid = self._cached(self._by_user, username)
+        if pid is not _MISSING:
+            return pid
+        self._stats["fhir_lookups"] += 1
+        resp = await fhir_get("Patient", params={"identifier": f"{USERNAME_SYSTEM}|{username}"})
+        resp.raise_for_status()
+        entries = resp.json().get("entry") or []
+        if not entries:
+            self._by_user.put(username, None, self.negative_ttl)
+            return None
+        pid = entries[0]["resource"]["id"]
+        self.remember(username, pid)
+        return pid
+
+    async def username_for(self, patient_id: str) -> Optional[str]:
+        """Username identifier on Patient/{patient_id}, or None if it has none."""
+        user = self._cached(self._by_pid, patient_id)
+        if user is not _MISSING:
+            return user
+        self._stats["fhir_lookups"] += 1
+        resp = await fhir_get(f"Patient/{patient_id}")
+        if resp.status_code in (404, 410):
+            self._by_pid.put(patient_id, None, self.negative_ttl)
+            return None
+        resp.raise_for_status()
+        user = next(
+            (i.get("value") for i in resp.json().get("identifier", []) if i.get("system") == USERNAME_SYSTEM),
+            None,
+        )
+        if user is None:
+            self._by_pid.put(patient_id, None, self.negative_ttl)
+            return None
+        self.remember(user, patient_id)
+        return user
+
+    async def seed(self, db) -> int:
+        """Load every known mapping from `patients_basic`."""
+        n = 0
+        async for doc in db["patients_basic"].find(
+            {"username": {"$exists": True}, "patient_id": {"$exists": True, "$ne": None}},
+            {"_id": 0, "username": 1, "patient_id": 1},
+        ):
+            self.remember(doc["username"], str(doc["patient_id"]))
+            n += 1
+        print(f"[🪪] identity cache seeded with {n} patients")
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["negative_hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_ratio": round((lookups - self._stats["misses"]) / lookups, 4) if lookups else None,
+            "usernames": len(self._by_user),
+            "patient_ids": len(self._by_pid),
+            "evictions": self._by_user.evictions + self._by_pid.evictions,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+        }
+
+
+identity = IdentityCache(
+    ttl=config.IDENTITY_TTL,
+    negative_ttl=config.IDENTITY_NEGATIVE_TTL,
+    max_entries=config.IDENTITY_MAX_ENTRIES,
+)
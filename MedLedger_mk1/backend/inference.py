@@ -0,0 +1,95 @@
+"""
+Micro-batching front for model.predict().
+
+Callers `await scheduler.predict(row)` one sample at a time; a single worker
+task gathers whatever arrives within INFERENCE_MAX_WAIT_MS (up to
+INFERENCE_MAX_BATCH rows), runs one batched predict in a worker thread so the
+event loop never blocks on scikit-learn, and resolves each caller's future.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+import config
+from utils.latency import Histogram
+
+
+class BatchScheduler:
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], Sequence],
+        max_batch: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch or config.INFERENCE_MAX_BATCH
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.INFERENCE_MAX_WAIT_MS) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 20, 50, 100])
+        self.inference_ms = Histogram([0.5, 1, 2, 5, 10, 20, 50, 100])
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        return self._queue
+
+    async def predict(self, row: Sequence[float]) -> Any:
+        """Prediction for one feature row, batched with concurrent callers."""
+        fut = asyncio.get_running_loop().create_future()
+        self._ensure_worker().put_nowait((row, fut, time.perf_counter()))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            start = time.perf_counter()
+            for _, _, queued in batch:
+                self.queue_wait_ms.observe((start - queued) * 1000)
+            self.batch_size.observe(len(batch))
+
+            X = np.array([row for row, _, _ in batch], dtype=float)
+            try:
+                preds = await asyncio.to_thread(self.predict_fn, X)
+            except Exception as exc:
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                continue
+            self.inference_ms.observe((time.perf_counter() - start) * 1000)
+
+            for (_, fut, _), pred in zip(batch, preds):
+                if not fut.done():          # caller may have gone away
+                    fut.set_result(pred)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "inference_ms": self.inference_ms.snapshot(),
+        }
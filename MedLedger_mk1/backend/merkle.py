@@ -0,0 +1,53 @@
+"""
+Minimal SHA-256 Merkle tree for batched audit anchoring.
+
+Leaves are the 32-byte record hashes from compute_patient_hash().  Inner
+nodes hash the *sorted* pair of children (prefixed with 0x01 so an inner
+node can never be passed off as a leaf), which means a proof is just the
+list of sibling hashes – no left/right flags needed.  An odd node at the end
+of a level is promoted unchanged.
+"""
+
+import hashlib
+from typing import List
+
+
+def _parent(a: bytes, b: bytes) -> bytes:
+    lo, hi = (a, b) if a <= b else (b, a)
+    return hashlib.sha256(b"\x01" + lo + hi).digest()
+
+
+def build_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Return every level of the tree, leaves first and the root last."""
+    if not leaves:
+        raise ValueError("cannot build a Merkle tree with no leaves")
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        cur = levels[-1]
+        nxt = [_parent(cur[i], cur[i + 1]) for i in range(0, len(cur) - 1, 2)]
+        if len(cur) % 2:
+            nxt.append(cur[-1])
+        levels.append(nxt)
+    return levels
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    return build_levels(leaves)[-1][0]
+
+
+def merkle_proof(levels: List[List[bytes]], index: int) -> List[str]:
+    """Sibling hashes (hex) from leaf `index` up to the root."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling].hex())
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf: bytes, proof: List[str], root: bytes) -> bool:
+    node = leaf
+    for sibling in proof:
+        node = _parent(node, bytes.fromhex(sibling))
+    return node == root
@@ -0,0 +1,251 @@
+"""
+Read policy for the per-patient clinical lists (doctor list_* routes and
+the patient /me/* routes).
+
+FHIR_READ_POLICY=fhir-first (default) keeps the old behaviour: ask FHIR,
+and fall back to the Mongo mirror if it fails or exceeds MIRROR_FHIR_TIMEOUT.
+It adds no Mongo writes to the read path.
+
+FHIR_READ_POLICY=mirror-first answers from the mirror (stale-while-revalidate):
+
+  * refreshed ≤ MIRROR_FRESH_SECONDS ago    → mirror, no refresh
+  * refreshed ≤ MIRROR_MAX_STALENESS ago    → mirror, FHIR refresh in the background
+  * older, or never refreshed              → FHIR now (mirror if that fails)
+
+In mirror-first mode every successful FHIR search is written through to
+the mirror (upsert by fhir_id) and stamps `mirror_freshness` for that
+(resource type, patient), so all workers share the same notion of "fresh".
+When the search result is complete (no `next` page), synced mirror docs of
+that patient that FHIR no longer returns are flagged `deleted_on_fhir`
+rather than removed, so their local fields survive, and reads skip them.
+Docs that were inserted, synced or refreshed after the search started are
+left alone: the search may simply predate them.
+
+Responses carry the freshness as headers:
+    X-Data-Source: fhir | mirror
+    X-Data-Refreshed-At: <ISO time of the last FHIR refresh>
+    X-Data-Age: <seconds since then>
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+import config
+from fhir_service import fhir_get
+
+FRESHNESS_COLLECTION = "mirror_freshness"
+
+# resource field used as the mirror `timestamp` for docs first seen on FHIR
+_DATE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "Observation": ("effectiveDateTime", "issued"),
+    "MedicationRequest": ("authoredOn",),
+    "AllergyIntolerance": ("recordedDate", "onsetDateTime"),
+    "Condition": ("onsetDateTime", "recordedDate"),
+    "Immunization": ("occurrenceDateTime", "recorded"),
+}
+
+_refreshing: Dict[Tuple[str, str], "asyncio.Task[None]"] = {}
+_writes: set = set()                   # write-through tasks, kept referenced until done
+_indexed: set = set()
+_stats: Dict[str, int] = {
+    "fhir": 0,
+    "mirror_fresh": 0,
+    "mirror_stale": 0,
+    "mirror_fallback": 0,
+    "background_refreshes": 0,
+    "refresh_errors": 0,
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _resource_time(resource_type: str, resource: dict) -> Optional[datetime]:
+    for field in _DATE_FIELDS.get(resource_type, ()):
+        value = resource.get(field)
+        if not value:
+            continue
+        try:
+            return _as_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        except ValueError:
+            continue
+    return None
+
+
+async def _ensure_indexes(col) -> None:
+    if col.name in _indexed:
+        return
+    await col.create_index([("patient_id", ASCENDING), ("timestamp", DESCENDING)])
+    await col.create_index([("fhir_id", ASCENDING)], sparse=True)
+    _indexed.add(col.name)
+
+
+async def _read_mirror(col, patient_id: str) -> List[dict]:
+    await _ensure_indexes(col)
+    docs = (await col.find({"patient_id": patient_id, "deleted_on_fhir": {"$ne": True}},
+                           {"payload": 1, "fhir_id": 1})
+            .sort("timestamp", -1)
+            .to_list(length=config.MIRROR_READ_LIMIT))
+    # payloads mirrored at create time predate the server-assigned id
+    return [{**d["payload"], "id": d["payload"].get("id") or d.get("fhir_id")}
+            for d in docs if d.get("payload")]
+
+
+async def _store(col, resource_type: str, patient_id: str, resources: List[dict],
+                 complete: bool, fetched_at: datetime) -> datetime:
+    """Write a FHIR search result through to the mirror and stamp its freshness."""
+    await _ensure_indexes(col)
+    now = _now()
+    ops = [
+        UpdateOne(
+            {"fhir_id": r["id"]},
+            {
+                "$set": {"payload": r, "patient_id": patient_id, "resource_type": resource_type,
+                         "synced": True, "error": None, "refreshed_at": now},
+                "$setOnInsert": {"timestamp": _resource_time(resource_type, r) or now},
+                "$unset": {"deleted_on_fhir": "", "deleted_on_fhir_at": ""},
+            },
+            upsert=True,
+        )
+        for r in resources if r.get("id")
+    ]
+    if ops:
+        await col.bulk_write(ops, ordered=False)
+    if complete:
+        # Gone from FHIR.  Only docs inserted, replayed (sync_fhir /
+        # fhir_outbox stamp resynced_at) and refreshed before the search
+        # started: a resource created on FHIR meanwhile may simply be missing
+        # from this result.
+        await col.update_many(
+            {
+                "patient_id": patient_id,
+                "synced": True,
+                "deleted_on_fhir": {"$ne": True},
+                "fhir_id": {"$exists": True, "$nin": [r["id"] for r in resources if r.get("id")] + [None]},
+                "_id": {"$lt": ObjectId.from_datetime(fetched_at)},
+                "$nor": [{"resynced_at": {"$gte": fetched_at}}, {"refreshed_at": {"$gte": fetched_at}}],
+            },
+            {"$set": {"deleted_on_fhir": True, "deleted_on_fhir_at": now}},
+        )
+    await col.database[FRESHNESS_COLLECTION].update_one(
+        {"_id": f"{resource_type}:{patient_id}"},
+        {"$set": {"refreshed_at": now}},
+        upsert=True,
+    )
+    return now
+
+
+async def _fetch(resource_type: str, params: Dict[str, Any]) -> Tuple[List[dict], bool]:
+    """The search's resources, and whether that is all of them (no next page)."""
+    r = await fhir_get(resource_type, params={**params, "_count": config.MIRROR_READ_LIMIT},
+                       timeout=config.MIRROR_FHIR_TIMEOUT)
+    r.raise_for_status()
+    bundle = r.json()
+    complete = not any(l.get("relation") == "next" for l in bundle.get("link", []))
+    return [e["resource"] for e in bundle.get("entry", []) if "resource" in e], complete
+
+
+async def _refresh(col, resource_type: str, patient_id: str, params: Dict[str, Any]) -> None:
+    try:
+        started = _now()
+        resources, complete = await _fetch(resource_type, params)
+        await _store(col, resource_type, patient_id, resources, complete, started)
+    except Exception as e:
+        _stats["refresh_errors"] += 1
+        print(f"[⚠] background {resource_type} refresh for {patient_id} failed: {e}")
+
+
+def _refresh_in_background(col, resource_type: str, patient_id: str, params: Dict[str, Any]) -> None:
+    key = (resource_type, patient_id)
+    if key in _refreshing:
+        return                                 # one refresh per key at a time
+    _stats["background_refreshes"] += 1
+    task = asyncio.create_task(_refresh(col, resource_type, patient_id, params))
+    _refreshing[key] = task
+    task.add_done_callback(lambda t, key=key: _refreshing.pop(key, None))
+
+
+def _tag(response, source: str, refreshed_at: Optional[datetime]) -> None:
+    if response is None:
+        return
+    response.headers["X-Data-Source"] = source
+    if refreshed_at is not None:
+        response.headers["X-Data-Refreshed-At"] = refreshed_at.isoformat()
+        response.headers["X-Data-Age"] = str(round((_now() - refreshed_at).total_seconds(), 1))
+
+
+async def read_resources(
+    col,
+    resource_type: str,
+    patient_id: str,
+    params: Dict[str, Any],
+    response=None,
+) -> List[dict]:
+    """
+    `resource_type` resources of `patient_id` (newest first) per
+    FHIR_READ_POLICY.  `params` is the FHIR search; `col` its mirror
+    collection.  Raises the FHIR error only if the mirror is empty too.
+    """
+    refreshed_at = None
+    if config.FHIR_READ_POLICY == "mirror-first":
+        state = await col.database[FRESHNESS_COLLECTION].find_one({"_id": f"{resource_type}:{patient_id}"})
+        if state:
+            refreshed_at = _as_utc(state["refreshed_at"])
+            age = (_now() - refreshed_at).total_seconds()
+            if age <= config.MIRROR_MAX_STALENESS:
+                if age <= config.MIRROR_FRESH_SECONDS:
+                    _stats["mirror_fresh"] += 1
+                else:
+                    _stats["mirror_stale"] += 1
+                    _refresh_in_background(col, resource_type, patient_id, params)
+                _tag(response, "mirror", refreshed_at)
+                return await _read_mirror(col, patient_id)
+
+    started = _now()
+    try:
+        resources, complete = await _fetch(resource_type, params)
+    except Exception as e:
+        print(f"[⚠] FHIR {resource_type} fetch failed – using Mongo mirror: {e}")
+        mirrored = await _read_mirror(col, patient_id)
+        if not mirrored:
+            raise
+        _stats["mirror_fallback"] += 1
+        if refreshed_at is None:
+            state = await col.database[FRESHNESS_COLLECTION].find_one({"_id": f"{resource_type}:{patient_id}"})
+            refreshed_at = _as_utc(state["refreshed_at"]) if state else None
+        _tag(response, "mirror", refreshed_at)
+        return mirrored
+
+    _stats["fhir"] += 1
+    _tag(response, "fhir", _now())
+    if config.FHIR_READ_POLICY == "mirror-first":
+        # write-through off the request path
+        task = asyncio.create_task(_store(col, resource_type, patient_id, resources, complete, started))
+        _writes.add(task)
+        task.add_done_callback(_write_done)
+    return resources
+
+
+def _write_done(task: "asyncio.Task[datetime]") -> None:
+    _writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[⚠] mirror write-through failed: {task.exception()}")
+
+
+def mirror_read_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "policy": config.FHIR_READ_POLICY,
+        "fresh_seconds": config.MIRROR_FRESH_SECONDS,
+        "max_staleness": config.MIRROR_MAX_STALENESS,
+        "refreshing": len(_refreshing),
+    }
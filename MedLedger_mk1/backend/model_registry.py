@@ -0,0 +1,145 @@
+"""
+Process-wide registry of anomaly models.
+
+Each artifact is loaded once per process with joblib `mmap_mode="r"`.  With
+ISOFOREST_COMPILED the forest is scored from CompiledForest arrays, which
+the first process to load an artifact version writes as .npy files to
+`<artifact>.<version>.compiled/`; every process then maps them read-only
+with np.load(mmap_mode="r"), so they sit once in the page cache and are
+shared by every uvicorn worker on the host instead of being copied into
+each heap.
+
+`swap()` loads a new artifact off the event loop and then replaces the
+active `ModelVersion` with a single reference assignment.  Requests that
+already grabbed the old version finish on it; new ones see the new one –
+nothing is dropped.  Every prediction comes back with the version that made
+it, so stored decisions can be traced to an artifact.
+"""
+
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+import config
+from compiled_forest import CompiledForest
+
+
+@dataclass
+class ModelVersion:
+    name: str
+    version: str
+    path: str
+    model: Any
+    predict: Callable[[np.ndarray], np.ndarray]
+    compiled: bool = False
+    loaded_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at.isoformat(),
+            "compiled": self.compiled,
+        }
+
+
+def _file_version(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def _by_batch_size(compiled_predict, model_predict):
+    """
+    The compiled walk wins on small batches, sklearn's vectorised
+    decision paths on big ones (see scripts/bench_isoforest.py).
+    """
+    def predict(X):
+        if len(X) > config.ISOFOREST_COMPILED_MAX_BATCH:
+            return model_predict(X)
+        return compiled_predict(X)
+    return predict
+
+
+def _compiled_forest(model, path: str, version: str) -> CompiledForest:
+    """The model's CompiledForest, mapped from its .npy cache (written on first use)."""
+    cache = f"{path}.{version}.compiled"
+    forest = CompiledForest.open(cache)
+    if forest is not None:
+        return forest
+    forest = CompiledForest.from_sklearn(model)
+    try:
+        forest.save(cache)
+    except OSError as e:
+        print(f"[⚠] cannot write {cache} ({e}) – compiled forest stays in process memory")
+        return forest
+    return CompiledForest.open(cache)
+
+
+def load_model_version(name: str, path: str) -> ModelVersion:
+    """Blocking load of one artifact (memory-mapped where joblib can)."""
+    path = os.path.abspath(path)
+    version = _file_version(path)
+    model = joblib.load(path, mmap_mode="r")
+    compiled = config.ISOFOREST_COMPILED and hasattr(model, "estimators_features_")
+    predict = model.predict
+    if compiled:
+        predict = _by_batch_size(_compiled_forest(model, path, version).predict, model.predict)
+    return ModelVersion(name=name, version=version, path=path,
+                        model=model, predict=predict, compiled=compiled)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._active: Dict[str, ModelVersion] = {}
+        self._lock = asyncio.Lock()
+
+    def register(self, name: str, path: str) -> ModelVersion:
+        """Load synchronously at import time; a no-op if already active."""
+        if name not in self._active:
+            self._active[name] = load_model_version(name, path)
+        return self._active[name]
+
+    def get(self, name: str) -> ModelVersion:
+        return self._active[name]
+
+    async def swap(self, name: str, path: Optional[str] = None) -> ModelVersion:
+        """
+        Load `path` (default: the active artifact's path, i.e. re-read it)
+        in a worker thread and make it the active version of `name`.
+        """
+        async with self._lock:
+            current = self._active.get(name)
+            path = path or (current.path if current else None)
+            if path is None:
+                raise KeyError(f"no model registered as {name!r}")
+            if current and current.path == os.path.abspath(path) \
+                    and current.version == await asyncio.to_thread(_file_version, path):
+                return current
+            mv = await asyncio.to_thread(load_model_version, name, path)
+            self._active[name] = mv                # the atomic swap
+            print(f"[🧠] model {name} → {mv.version} ({mv.path})")
+            return mv
+
+    def predict_tagged(self, name: str, X: np.ndarray) -> List[Tuple[int, str]]:
+        """(prediction, model version) per row, all from one version."""
+        mv = self._active[name]
+        return [(int(p), mv.version) for p in mv.predict(X)]
+
+    def describe(self) -> Dict[str, Any]:
+        return {name: mv.describe() for name, mv in self._active.items()}
+
+
+registry = ModelRegistry()
+
+ISOFOREST = "isoforest"
+registry.register(ISOFOREST, config.ISOFOREST_PATH)
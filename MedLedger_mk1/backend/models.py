@@ -1,7 +1,7 @@
 # backend/models.py
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class Patient(BaseModel):
     name: str
@@ -25,4 +25,9 @@ class PatientAdditional(BaseModel):
     email: Optional[str]
     address: Optional[str]
     emergencyContactName: Optional[str]
-    emergencyContactPhone: Optional[str]
\ No newline at end of file
+    emergencyContactPhone: Optional[str]
+
+
+class AuditVerifyRequest(BaseModel):
+    hashes: List[str] = []     # SHA-256 hex from compute_patient_hash
+    actions: List[str] = []    # or the original action strings
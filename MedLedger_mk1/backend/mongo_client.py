@@ -15,7 +15,9 @@ def schedule_fhir_sync(db):
     scheduler.add_job(
         sync_wrapper,
         trigger=IntervalTrigger(minutes=2),
-        name="fhir_resync_job"
+        name="fhir_resync_job",
+        max_instances=1,
+        coalesce=True,
     )
 
 @asynccontextmanager
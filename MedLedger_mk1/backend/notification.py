@@ -1,39 +1,145 @@
-from collections import defaultdict, deque
-from typing import Dict, Deque, Any, Set
+from collections import defaultdict
+from typing import Dict, Any
 from fastapi import WebSocket, WebSocketDisconnect
-import asyncio
+import asyncio, json, time
+import config
+from utils.latency import LatencyWindow
+from fanout import publish, register_handler
+from vitals_ring import make_store
 
-_VITAL_HISTORY: Dict[str, Deque[dict]] = defaultdict(lambda: deque(maxlen=100))
-_CONNECTIONS: Dict[str, Set[WebSocket]] = defaultdict(set)
+_VITAL_HISTORY = make_store("vitals")          # recent readings per patient_id
+_CONNECTIONS: Dict[str, Dict[WebSocket, "_Connection"]] = defaultdict(dict)
 
 
 def store_vital(patient_id: str, record: dict) -> None:
-    _VITAL_HISTORY[patient_id].appendleft(record)
+    """Publish to every worker (see fanout.py); each one runs _deliver_vital."""
+    publish("vital", patient_id, record)
+
+
+async def _deliver_vital(patient_id: str, record: dict) -> None:
+    _VITAL_HISTORY.append(patient_id, record)
+    if _CONNECTIONS.get(patient_id):
+        await broadcast_alert(patient_id, record)
 
 
 def list_vitals(patient_id: str) -> list[dict]:
-    return list(_VITAL_HISTORY[patient_id])
+    return _VITAL_HISTORY.records(patient_id)
 
 
 def list_alerts(patient_id: str) -> list[dict]:
-    return [v for v in _VITAL_HISTORY[patient_id] if v.get("anomaly")]
+    return _VITAL_HISTORY.records(patient_id, anomalies_only=True)
+
+
+def vital_history_stats() -> Dict[str, Any]:
+    return _VITAL_HISTORY.stats()
+
+
+class _Connection:
+    """
+    One WebSocket with its own bounded outbox and sender task, so a slow
+    socket only ever delays itself.
+    """
+
+    def __init__(self, patient_id: str, ws: WebSocket):
+        self.patient_id = patient_id
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=config.WS_SEND_QUEUE)
+        self.task = asyncio.create_task(self._sender())
+
+    async def _sender(self) -> None:
+        stats = _fanout_stats(self.patient_id)
+        try:
+            while True:
+                text, queued = await self.queue.get()
+                await self.ws.send_text(text)
+                stats["delivered"] += 1
+                stats["latency"].record(time.monotonic() - queued)
+        except (RuntimeError, WebSocketDisconnect):
+            pass
+        except asyncio.CancelledError:
+            return
+        unregister_ws(self.patient_id, self.ws)
+
+    def offer(self, text: str, queued: float) -> bool:
+        """Queue a frame; False means this consumer should be disconnected."""
+        if not self.queue.full():
+            self.queue.put_nowait((text, queued))
+            return True
+        stats = _fanout_stats(self.patient_id)
+        stats["dropped"] += 1
+        policy = config.WS_SLOW_POLICY
+        if policy == "disconnect":
+            return False
+        if policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait((text, queued))
+        # "drop_newest": keep what is queued, skip this frame
+        return True
+
+
+_STATS: Dict[str, Dict[str, Any]] = {}
+
+
+def _fanout_stats(patient_id: str) -> Dict[str, Any]:
+    stats = _STATS.get(patient_id)
+    if stats is None:
+        stats = _STATS[patient_id] = {
+            "broadcasts": 0, "delivered": 0, "dropped": 0, "disconnected": 0,
+            "latency": LatencyWindow(200),
+        }
+    return stats
 
 
 async def register_ws(patient_id: str, ws: WebSocket) -> None:
     await ws.accept()
-    _CONNECTIONS[patient_id].add(ws)
+    _CONNECTIONS[patient_id][ws] = _Connection(patient_id, ws)
 
 
 def unregister_ws(patient_id: str, ws: WebSocket) -> None:
-    _CONNECTIONS[patient_id].discard(ws)
+    conns = _CONNECTIONS.get(patient_id)
+    if conns is None:
+        return
+    conn = conns.pop(ws, None)
+    if conn is not None and conn.task is not asyncio.current_task():
+        conn.task.cancel()
+    if not conns:
+        del _CONNECTIONS[patient_id]
+        _STATS.pop(patient_id, None)
 
 
 async def broadcast_alert(patient_id: str, payload: dict) -> None:
-    dead = set()
-    for ws in _CONNECTIONS[patient_id]:
+    """
+    Serialize once and drop the frame into every viewer's outbox; the
+    per-connection sender tasks do the actual (concurrent) sends.
+    """
+    conns = _CONNECTIONS.get(patient_id)
+    if not conns:
+        return
+    text = json.dumps(payload, default=str)
+    queued = time.monotonic()
+    stats = _fanout_stats(patient_id)
+    stats["broadcasts"] += 1
+
+    slow = [conn for conn in conns.values() if not conn.offer(text, queued)]
+    for conn in slow:
+        stats["disconnected"] += 1
+        unregister_ws(patient_id, conn.ws)
         try:
-            await ws.send_json(payload)
-        except (RuntimeError, WebSocketDisconnect):
-            dead.add(ws)
-    for ws in dead:
-        unregister_ws(patient_id, ws)
+            await conn.ws.close(code=1013)      # "try again later"
+        except Exception:
+            pass
+
+
+def ws_fanout_stats() -> Dict[str, Any]:
+    return {
+        "connections": sum(len(c) for c in _CONNECTIONS.values()),
+        "policy": config.WS_SLOW_POLICY,
+        "patients": {
+            pid: {**{k: v for k, v in st.items() if k != "latency"},
+                  "latency": st["latency"].snapshot()}
+            for pid, st in _STATS.items()
+        },
+    }
+
+
+register_handler("vital", _deliver_vital)
@@ -1,12 +1,21 @@
 
-import joblib
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
-from pydantic import BaseModel, Field
+import asyncio
+import json
+import numpy as np
+from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, Request
+from pydantic import BaseModel, Field, ValidationError
+from pymongo.errors import BulkWriteError
 from datetime import datetime
-from pathlib import Path
+from typing import List, Optional
 import pandas as pd
+import config
 from alert_buffer import add_alert
+from notification import store_vital
+from vitals_store import insert_vital, insert_vitals
+from inference import BatchScheduler
+from model_registry import registry, ISOFOREST
 from mongo_client import get_mongo_collection
+from identity_cache import identity
 
 from config import FHIR_SERVER_URL, USERNAME_SYSTEM
 from auth import get_current_user
@@ -14,8 +23,9 @@ from auth import get_current_user
 router = APIRouter(prefix="/vitals", tags=["vitals"])
 
 
-model_path = Path(__file__).resolve().parent.parent / "isoforest.joblib"
-iso_forest = joblib.load(model_path)
+# Single-sample callers share batched predict() calls (see inference.py);
+# each result is (prediction, model version) from the registry's active model.
+iso_scheduler = BatchScheduler(lambda X: registry.predict_tagged(ISOFOREST, X))
 
 
 class VitalBase(BaseModel):
@@ -32,6 +42,10 @@ class VitalInWithNone(VitalBase):
     """Same schema, but patient_id can be omitted by the caller."""
     patient_id: str | None = None
 
+class VitalBatchItem(VitalIn):
+    """One sample of a gateway upload; alerts go to `username` if given."""
+    username: Optional[str] = None
+
 
 async def send_anomaly_alert(patient_id: str, vitals: VitalBase) -> None:
     """Stub that would fan‑out to e‑mail / SMS / websocket etc."""
@@ -53,14 +67,10 @@ async def ingest_vitals(
     if current_user["role"] != "patient":
         raise HTTPException(status_code=403, detail="Not permitted")
 
-    features = [[
-        v.heart_rate,
-        v.spo2,
-        v.temperature
-    ]]
+    features = [v.heart_rate, v.spo2, v.temperature]
 
     try:
-        pred = int(iso_forest.predict(features)[0])
+        pred, model_version = await iso_scheduler.predict(features)
     except Exception as exc:
         raise HTTPException(500, f"Anomaly detection failed: {exc}")
 
@@ -73,9 +83,12 @@ async def ingest_vitals(
         "heart_rate":  int(v.heart_rate),
         "timestamp":   v.timestamp.isoformat(),
         "anomaly":     is_anomaly,
+        "model_version": model_version,
     }
 
     add_alert(username, record)
+    if v.patient_id:
+        store_vital(v.patient_id, record)
 
     if is_anomaly:
         bg.add_task(send_anomaly_alert, username, v)
@@ -86,14 +99,137 @@ async def ingest_vitals(
         f"{'ANOMALY' if is_anomaly else 'normal'} @ {v.timestamp.isoformat()}"
     )
 
-    await col.insert_one({
+    await insert_vital(col, {
         "username": username,
         "patient_id": v.patient_id,
         "spo2": v.spo2,
         "temperature": v.temperature,
         "heart_rate": v.heart_rate,
         "timestamp": v.timestamp,
-        "anomaly": is_anomaly
+        "anomaly": is_anomaly,
+        "model_version": model_version,
     })
 
-    return record
\ No newline at end of file
+    return record
+
+async def _read_batch(request: Request) -> List[dict]:
+    """JSON array body, or NDJSON (one sample per line) read as it streams in."""
+    if "ndjson" not in request.headers.get("content-type", ""):
+        body = await request.json()
+        if not isinstance(body, list):
+            raise HTTPException(400, "Expected a JSON array of samples")
+        return body
+
+    items, buf = [], b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        items.extend(json.loads(line) for line in lines if line.strip())
+        if len(items) > config.VITALS_BATCH_MAX:
+            break
+    if buf.strip():
+        items.append(json.loads(buf))
+    return items
+
+
+@router.post("/batch", summary="Ingest many vitals samples in one call")
+async def ingest_vitals_batch(
+    request: Request,
+    bg: BackgroundTasks,
+    current_user: dict = Depends(get_current_user),
+    col = Depends(get_mongo_collection("vitals")),
+):
+    """
+    Accepts a JSON array or NDJSON stream of samples.  Doctors and admins
+    may upload for any patient; a patient token only for its own username
+    and patient_id (other items fail with `ok: False`).  All valid samples are scored in one vectorized
+    `predict` call on the active registry model and written with a single unordered
+    bulk write (see vitals_store.py); the response has one result per input item, in order.
+    """
+    try:
+        raw = await _read_batch(request)
+    except ValueError as exc:
+        raise HTTPException(400, f"Malformed batch: {exc}")
+    if len(raw) > config.VITALS_BATCH_MAX:
+        raise HTTPException(413, f"At most {config.VITALS_BATCH_MAX} samples per batch")
+
+    role, username = current_user["role"], current_user["username"]
+    if role not in ("patient", "doctor", "admin"):
+        raise HTTPException(403, "Not permitted")
+    own_pid = None
+    if role == "patient":
+        try:
+            own_pid = await identity.patient_id_for(username)
+        except Exception as exc:
+            raise HTTPException(500, f"Patient lookup failed: {exc}")
+
+    results: List[dict] = [None] * len(raw)
+    valid: List[tuple] = []                      # (input index, VitalBatchItem)
+    for i, item in enumerate(raw):
+        try:
+            v = VitalBatchItem.model_validate(item)
+        except ValidationError as exc:
+            results[i] = {"index": i, "ok": False, "error": exc.errors()[0]["msg"]}
+            continue
+        if role == "patient":
+            if v.username not in (None, username) or v.patient_id != own_pid:
+                results[i] = {"index": i, "ok": False, "error": "Not permitted for this patient"}
+                continue
+            v.username = username
+        valid.append((i, v))
+
+    mv = registry.get(ISOFOREST)        # one model version for the whole batch
+    if valid:
+        X = np.array([[v.heart_rate, v.spo2, v.temperature] for _, v in valid], dtype=float)
+        try:
+            preds = await asyncio.to_thread(mv.predict, X)
+        except Exception as exc:
+            raise HTTPException(500, f"Anomaly detection failed: {exc}")
+
+        docs = []
+        for (i, v), pred in zip(valid, preds):
+            is_anomaly = bool(pred == -1)
+            docs.append({
+                "patient_id":  v.patient_id,
+                "username":    v.username,
+                "spo2":        v.spo2,
+                "temperature": v.temperature,
+                "heart_rate":  v.heart_rate,
+                "timestamp":   v.timestamp,
+                "anomaly":     is_anomaly,
+                "model_version": mv.version,
+            })
+            results[i] = {"index": i, "ok": True, "patient_id": v.patient_id,
+                          "anomaly": is_anomaly, "model_version": mv.version}
+
+        failed = {}
+        try:
+            await insert_vitals(col, docs)
+        except BulkWriteError as exc:
+            failed = {e["index"]: e.get("errmsg", "write failed") for e in exc.details["writeErrors"]}
+
+        for pos, ((i, v), doc) in enumerate(zip(valid, docs)):
+            if pos in failed:
+                results[i] = {"index": i, "ok": False, "error": failed[pos]}
+                continue
+            record = {
+                "spo2":        float(v.spo2),
+                "temperature": float(v.temperature),
+                "heart_rate":  int(v.heart_rate),
+                "timestamp":   v.timestamp.isoformat(),
+                "anomaly":     doc["anomaly"],
+                "model_version": mv.version,
+            }
+            add_alert(v.username or v.patient_id, record)
+            store_vital(v.patient_id, record)
+            if doc["anomaly"]:
+                bg.add_task(send_anomaly_alert, v.patient_id, v)
+
+    accepted = sum(1 for r in results if r["ok"])
+    return {
+        "received": len(raw),
+        "accepted": accepted,
+        "anomalies": sum(1 for r in results if r.get("anomaly")),
+        "model_version": mv.version,
+        "results": results,
+    }
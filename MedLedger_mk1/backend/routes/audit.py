@@ -1,9 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pymongo.errors import PyMongoError
 from database import get_audit_collection  # Assumes you already have this
-from bson import json_util
-import json
+from bson import ObjectId, json_util
+from audit_indexer import find_audit_events, verify_record_hashes
+from blockchain import compute_patient_hash
+from models import AuditVerifyRequest
+from datetime import datetime, timedelta
+from typing import List, Literal, Optional
+import config
 
 router = APIRouter()
 
@@ -22,17 +27,147 @@ async def store_audit_log(audit_data: dict):
         raise HTTPException(status_code=500, detail=f"MongoDB Error: {e}")
 
 
+def _logs_query(
+    after: Optional[str],
+    after_block: Optional[int],
+    order: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    sender: Optional[str],
+) -> dict:
+    query: dict = {}
+    # _id embeds the Mongo insert time (whole seconds), so date filters work
+    # for every receipt, including ones written before `queued_at` existed.
+    # They are insert times, not block times: receipts carry no timestamp.
+    if since or until:
+        query["_id"] = {}
+        if since:
+            query["_id"]["$gte"] = ObjectId.from_datetime(since)
+        if until:
+            # from_datetime zeroes the counter bytes: use the next second as an
+            # exclusive bound so the whole final second is included
+            query["_id"]["$lt"] = ObjectId.from_datetime(until + timedelta(seconds=1))
+    if sender:
+        query["from"] = sender
+
+    if order == "block":
+        # receipts without a blockNumber have no place in block order (and
+        # would sort ahead of every cursor), so they are listed by order=id only
+        query["blockNumber"] = {"$ne": None}
+        if after_block is not None:
+            tie = {"blockNumber": after_block}
+            if after:
+                tie["_id"] = {"$gt": ObjectId(after)}
+            query["$or"] = [{"blockNumber": {"$gt": after_block}}, tie]
+    elif after:
+        query.setdefault("_id", {})["$gt"] = ObjectId(after)
+    return query
+
+
 @router.get("/audit/logs")
-async def get_audit_logs():
+async def get_audit_logs(
+    after: Optional[str] = Query(None, description="Return records after this _id"),
+    after_block: Optional[int] = Query(None, description="With order=block: resume after this block (with `after`)"),
+    order: Literal["id", "block"] = "id",
+    limit: int = Query(100, ge=1, le=1000),
+    since: Optional[datetime] = Query(None, description="Inserted at or after (Mongo insert time)"),
+    until: Optional[datetime] = Query(None, description="Inserted at or before, whole second included"),
+    sender: Optional[str] = Query(None, alias="from", description="Receipt `from` address"),
+    fields: Optional[str] = Query(None, description="Comma-separated projection, e.g. transactionHash,blockNumber"),
+    format: Literal["json", "ndjson"] = "json",
+):
     """
-    Return all audit records stored in MongoDB audit_trail.
+    Audit records from MongoDB audit_trail, keyset-paginated by _id (or by
+    blockNumber with order=block, which skips receipts without one).
+
+    * json   – one page of `limit` records; the cursor for the next page is in
+               the X-Next-After / X-Next-After-Block headers.
+    * ndjson – every matching record, streamed straight off the Motor cursor
+               (one line per document, constant memory), ignoring `limit`.
     """
     try:
         audit_col = get_audit_collection()
-        cursor = audit_col.find()
-        logs = []
-        async for doc in cursor:
-            logs.append(json.loads(json_util.dumps(doc)))
-        return JSONResponse(content=logs)
+        if after is not None and not ObjectId.is_valid(after):
+            raise HTTPException(400, "`after` must be an ObjectId")
+        if order == "block" and after is not None and after_block is None:
+            raise HTTPException(400, "order=block resumes from `after` together with `after_block`")
+        query = _logs_query(after, after_block, order, since, until, sender)
+        projection = None
+        if fields:
+            projection = {f.strip(): 1 for f in fields.split(",") if f.strip()}
+            projection["blockNumber"] = 1   # needed for the block cursor
+        sort = [("blockNumber", 1), ("_id", 1)] if order == "block" else [("_id", 1)]
+
+        if format == "ndjson":
+            cursor = audit_col.find(query, projection).sort(sort).batch_size(1000)
+
+            async def lines():
+                async for doc in cursor:
+                    yield json_util.dumps(doc) + "\n"
+
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        docs = await audit_col.find(query, projection).sort(sort).limit(limit).to_list(length=limit)
+        headers = {}
+        if len(docs) == limit:
+            headers["X-Next-After"] = str(docs[-1]["_id"])
+            if order == "block":
+                headers["X-Next-After-Block"] = str(docs[-1]["blockNumber"])
+        return Response(content=json_util.dumps(docs), media_type="application/json", headers=headers)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB Error: {e}")
+
+
+@router.get("/audit/events")
+async def get_audit_events(
+    record_hash: Optional[str] = Query(None, description="SHA-256 hex of the audit record"),
+    sender: Optional[str] = Query(None, description="Address that anchored the record"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    On-chain RecordStored events from the `audit_events` index (kept up to
+    date by audit_indexer.py), newest first.
+    """
+    try:
+        return await find_audit_events(
+            record_hash=record_hash, sender=sender, since=since, until=until, limit=limit
+        )
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB Error: {e}")
+
+
+async def _verify(hashes: List[str], actions: List[str]) -> dict:
+    wanted = list(hashes) + [compute_patient_hash(a).hex() for a in actions]
+    if not wanted:
+        raise HTTPException(400, "Provide at least one hash or action")
+    if len(wanted) > config.AUDIT_VERIFY_MAX:
+        raise HTTPException(413, f"At most {config.AUDIT_VERIFY_MAX} hashes per call")
+    try:
+        results = await verify_record_hashes(wanted)
     except PyMongoError as e:
         raise HTTPException(status_code=500, detail=f"MongoDB Error: {e}")
+    return {
+        "checked": len(results),
+        "anchored": sum(1 for r in results.values() if r["anchored"]),
+        "results": results,
+    }
+
+
+@router.get("/audit/verify")
+async def verify_audit(
+    hash: List[str] = Query([], description="SHA-256 hex from compute_patient_hash (repeatable)"),
+    action: List[str] = Query([], description="Original action string (repeatable)"),
+):
+    """
+    Was this patient action anchored?  Answers from the audit_trail /
+    audit_events indexes with block number, timestamp and tx hash.
+    """
+    return await _verify(hash, action)
+
+
+@router.post("/audit/verify")
+async def verify_audit_bulk(body: AuditVerifyRequest):
+    """Bulk form of GET /audit/verify for thousands of hashes in one call."""
+    return await _verify(body.hashes, body.actions)
@@ -1,16 +1,17 @@
 # backend/routes/doctor.py
 from fastapi import APIRouter, HTTPException, Depends, Query
-import httpx, config
+import asyncio, config
 from auth import get_current_user
 from datetime import datetime, timezone
-from fhir_service import fetch_fhir_resources, create_fhir_resource
+from fhir_service import fetch_fhir_resources, create_fhir_resource, fhir_get, fhir_post
+from identity_cache import identity
 from typing import List, Dict
 from mongo_client import get_mongo_collection
 from crypto import decrypt_text, encrypt_text
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from mirror_reads import read_resources
 from utils.pdf_report import render_patient_pdf
 import io
-from config import USERNAME_SYSTEM
 
 router = APIRouter()
 FHIR = config.FHIR_SERVER_URL
@@ -28,9 +29,7 @@ async def list_or_search_patients(
     params = {"_count": 100}
     if q:
         params["name"] = q
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{FHIR}/Patient", params=params,
-                                headers={"Accept": "application/fhir+json"})
+    resp = await fhir_get("Patient", params=params)
     if resp.status_code != 200:
         raise HTTPException(500, f"FHIR search failed: {resp.status_code}")
     bundle = resp.json()
@@ -39,11 +38,7 @@ async def list_or_search_patients(
 @router.get("/patients/{patient_id}")
 async def get_patient(patient_id: str, user=Depends(get_current_user)):
     check_doctor(user)
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{FHIR}/Patient/{patient_id}",
-            headers={"Accept": "application/fhir+json"}
-        )
+    resp = await fhir_get(f"Patient/{patient_id}")
     if resp.status_code != 200:
         raise HTTPException(resp.status_code, f"Failed to fetch patient: {resp.text}")
     return resp.json()
@@ -54,32 +49,21 @@ async def get_patient(patient_id: str, user=Depends(get_current_user)):
 @router.get("/observations/{patient_id}", response_model=List[Dict])
 async def list_observations(
     patient_id: str,
+    response: Response,
     user=Depends(get_current_user),
     col=Depends(get_mongo_collection("observations"))
 ):
     check_doctor(user)
 
-    # Try FHIR first
+    # FHIR or the Mongo mirror, per FHIR_READ_POLICY (see mirror_reads.py)
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.get(
-                f"{FHIR}/Observation",
-                params={"subject": f"Patient/{patient_id}", "_sort": "-date"},
-                headers={"Accept": "application/fhir+json"}
-            )
-        resp.raise_for_status()
-        bundle = resp.json()
-        return [e["resource"] for e in bundle.get("entry", [])]
-
+        return await read_resources(
+            col, "Observation", patient_id,
+            {"subject": f"Patient/{patient_id}", "_sort": "-date"},
+            response,
+        )
     except Exception as e:
-        print(f"[⚠] FHIR fetch failed: {e}")
-        # Fallback to Mongo
-        mongo_results = await col.find({"patient_id": patient_id}).sort("timestamp", -1).to_list(length=100)
-        observations = [entry.get("payload") for entry in mongo_results if "payload" in entry]
-
-        if not observations:
-            raise HTTPException(500, f"No observations found (FHIR and Mongo failed)")
-        return observations
+        raise HTTPException(500, f"No observations found (FHIR & Mongo failed): {e}")
 
 # -----------------------------------
 # POST a new observation
@@ -104,22 +88,9 @@ async def create_observation(
 
     username = None
 
-    # Fetch username from FHIR
+    # Resolve username (identity cache, FHIR on a miss)
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{FHIR}/Patient/{patient_id}",
-                headers={"Accept": "application/fhir+json"}
-            )
-        resp.raise_for_status()
-        patient = resp.json()
-
-        identifiers = patient.get("identifier", [])
-        username = next(
-            (i.get("value") for i in identifiers if i.get("system") == USERNAME_SYSTEM),
-            None
-        )
-
+        username = await identity.username_for(patient_id)
         if not username:
             raise HTTPException(400, detail="Username not found in patient's FHIR identifiers")
     except Exception as e:
@@ -147,12 +118,7 @@ async def create_observation(
 
     # Post to FHIR
     try:
-        async with httpx.AsyncClient() as client:
-            post_resp = await client.post(
-                f"{FHIR}/Observation",
-                json=obs,
-                headers={"Content-Type": "application/fhir+json"}
-            )
+        post_resp = await fhir_post("Observation", json=obs)
         post_resp.raise_for_status()
         fhir_id = post_resp.json().get("id")
         synced = True
@@ -186,33 +152,21 @@ async def create_observation(
 @router.get("/treatments/{patient_id}", response_model=List[Dict])
 async def list_treatments(
     patient_id: str,
+    response: Response,
     user = Depends(get_current_user),
     col  = Depends(get_mongo_collection("treatments")),
 ):
     check_doctor(user)
 
-    # 1️⃣  try FHIR
+    # FHIR or the Mongo mirror, per FHIR_READ_POLICY (see mirror_reads.py)
     try:
-        async with httpx.AsyncClient(timeout=5) as cli:
-            r = await cli.get(
-                f"{FHIR}/MedicationRequest",
-                params  = {"subject": f"Patient/{patient_id}", "_sort": "-authoredon"},
-                headers = {"Accept": "application/fhir+json"},
-            )
-        r.raise_for_status()
-        bundle = r.json()
-        return [e["resource"] for e in bundle.get("entry", [])]
-
-    # 2️⃣  fall back to Mongo mirror
+        return await read_resources(
+            col, "MedicationRequest", patient_id,
+            {"subject": f"Patient/{patient_id}", "_sort": "-authoredon"},
+            response,
+        )
     except Exception as e:
-        print(f"[⚠] FHIR MedicationRequest fetch failed → {e}")
-        docs = await col.find({"patient_id": patient_id}) \
-                        .sort("timestamp", -1) \
-                        .to_list(length=100)
-        mirrored = [d["payload"] for d in docs if "payload" in d]
-        if not mirrored:
-            raise HTTPException(500, "No treatments found (FHIR & Mongo failed)")
-        return mirrored
+        raise HTTPException(500, f"No treatments found (FHIR & Mongo failed): {e}")
 
 # ─────────────────────────────────────────────────────────────────────────────
 # POST /doctor/treatments/{patient_id}
@@ -236,18 +190,7 @@ async def create_treatment(
 
     # ── resolve the patient’s username (needed for Mongo mirror) ────────────
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.get(
-                f"{FHIR}/Patient/{patient_id}",
-                headers={"Accept": "application/fhir+json"},
-            )
-        r.raise_for_status()
-        patient    = r.json()
-        username = next(
-            (idn["value"] for idn in patient.get("identifier", [])
-             if idn.get("system") == USERNAME_SYSTEM),
-            None,
-        )
+        username = await identity.username_for(patient_id)
         if not username:
             raise RuntimeError("username identifier missing")
     except Exception as e:
@@ -270,12 +213,7 @@ async def create_treatment(
 
     # 1️⃣  POST to FHIR
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.post(
-                f"{FHIR}/MedicationRequest",
-                json    = mr_resource,
-                headers = {"Content-Type": "application/fhir+json"},
-            )
+        r = await fhir_post("MedicationRequest", json=mr_resource)
         r.raise_for_status()
         fhir_id = r.json().get("id")
         synced  = True
@@ -309,38 +247,21 @@ async def create_treatment(
 @router.get("/allergies/{patient_id}", response_model=List[Dict])
 async def list_allergies(
     patient_id: str,
+    response: Response,
     user          = Depends(get_current_user),
     col           = Depends(get_mongo_collection("allergies"))
 ):
     check_doctor(user)
 
-    # 1️⃣ Try FHIR first ------------------------------------------------------
+    # FHIR or the Mongo mirror, per FHIR_READ_POLICY (see mirror_reads.py)
     try:
-        async with httpx.AsyncClient(timeout=5.0) as cli:
-            r = await cli.get(
-                f"{FHIR}/AllergyIntolerance",
-                params = {
-                    "patient": f"Patient/{patient_id}",
-                    "_sort"  : "-recorded-date"
-                },
-                headers = {"Accept": "application/fhir+json"}
-            )
-        r.raise_for_status()
-        bundle = r.json()
-        return [e["resource"] for e in bundle.get("entry", [])]
-
-    # 2️⃣ Fallback → Mongo ----------------------------------------------------
-    except Exception as e:
-        print(f"[⚠] FHIR allergy fetch failed – using Mongo: {e}")
-        docs = (
-            await col.find({"patient_id": patient_id})
-                     .sort("timestamp", -1)
-                     .to_list(length=100)
+        return await read_resources(
+            col, "AllergyIntolerance", patient_id,
+            {"patient": f"Patient/{patient_id}", "_sort": "-recorded-date"},
+            response,
         )
-        resources = [d.get("payload") for d in docs if "payload" in d]
-        if not resources:
-            raise HTTPException(500, "No allergies found (FHIR & Mongo both failed)")
-        return resources
+    except Exception as e:
+        raise HTTPException(500, f"No allergies found (FHIR & Mongo failed): {e}")
 
 
 # ✍️  POST /doctor/allergies/{patient_id}
@@ -362,17 +283,7 @@ async def create_allergy(
 
     # Who is this patient’s username?  (same trick the observation route uses)
     try:
-        async with httpx.AsyncClient() as cli:
-            pat = await cli.get(
-                f"{FHIR}/Patient/{patient_id}",
-                headers={"Accept": "application/fhir+json"}
-            )
-        pat.raise_for_status()
-        identifiers = pat.json().get("identifier", [])
-        username = next(
-            (i["value"] for i in identifiers if i.get("system") == USERNAME_SYSTEM),
-            None
-        )
+        username = await identity.username_for(patient_id)
         if not username:
             raise HTTPException(400, "username identifier missing on Patient")
     except Exception as exc:
@@ -396,12 +307,7 @@ async def create_allergy(
 
     # --- push to FHIR --------------------------------------------------------
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.post(
-                f"{FHIR}/AllergyIntolerance",
-                json    = allergy_res,
-                headers = {"Content-Type": "application/fhir+json"}
-            )
+        r = await fhir_post("AllergyIntolerance", json=allergy_res)
         r.raise_for_status()
         fhir_id = r.json().get("id")
         synced  = True
@@ -438,33 +344,21 @@ async def create_allergy(
 @router.get("/conditions/{patient_id}", response_model=List[Dict])
 async def list_conditions(
     patient_id: str,
+    response: Response,
     user = Depends(get_current_user),
     col  = Depends(get_mongo_collection("conditions")),
 ):
     check_doctor(user)
 
-    # 1️⃣ FHIR first
+    # FHIR or the Mongo mirror, per FHIR_READ_POLICY (see mirror_reads.py)
     try:
-        async with httpx.AsyncClient(timeout=5) as cli:
-            r = await cli.get(
-                f"{FHIR}/Condition",
-                params  = {"patient": f"Patient/{patient_id}", "_sort": "-date"},
-                headers = {"Accept": "application/fhir+json"},
-            )
-        r.raise_for_status()
-        bundle = r.json()
-        return [e["resource"] for e in bundle.get("entry", [])]
-
-    # 2️⃣ Fallback to Mongo
+        return await read_resources(
+            col, "Condition", patient_id,
+            {"patient": f"Patient/{patient_id}", "_sort": "-date"},
+            response,
+        )
     except Exception as e:
-        print(f"[⚠] FHIR Condition fetch failed → {e}")
-        docs = await col.find({"patient_id": patient_id}) \
-                        .sort("timestamp", -1) \
-                        .to_list(length=100)
-        mirrored = [d["payload"] for d in docs if "payload" in d]
-        if not mirrored:
-            raise HTTPException(500, "No conditions found (FHIR & Mongo failed)")
-        return mirrored
+        raise HTTPException(500, f"No conditions found (FHIR & Mongo failed): {e}")
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -486,18 +380,7 @@ async def create_condition(
 
     # ── resolve patient username (for Mongo mirror) ─────────────────────────
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.get(
-                f"{FHIR}/Patient/{patient_id}",
-                headers={"Accept": "application/fhir+json"},
-            )
-        r.raise_for_status()
-        patient  = r.json()
-        username = next(
-            (idn["value"] for idn in patient.get("identifier", [])
-             if idn.get("system") == USERNAME_SYSTEM),
-            None,
-        )
+        username = await identity.username_for(patient_id)
         if not username:
             raise RuntimeError("username identifier missing")
     except Exception as e:
@@ -520,12 +403,7 @@ async def create_condition(
 
     # 1️⃣ POST to FHIR
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.post(
-                f"{FHIR}/Condition",
-                json    = cond_resource,
-                headers = {"Content-Type": "application/fhir+json"},
-            )
+        r = await fhir_post("Condition", json=cond_resource)
         r.raise_for_status()
         fhir_id = r.json().get("id")
         synced  = True
@@ -558,33 +436,21 @@ async def create_condition(
 @router.get("/immunizations/{patient_id}", response_model=List[Dict])
 async def list_immunizations(
     patient_id: str,
+    response: Response,
     user = Depends(get_current_user),
     col  = Depends(get_mongo_collection("immunizations")),
 ):
     check_doctor(user)
 
-    # 1️⃣ try FHIR
+    # FHIR or the Mongo mirror, per FHIR_READ_POLICY (see mirror_reads.py)
     try:
-        async with httpx.AsyncClient(timeout=5) as cli:
-            r = await cli.get(
-                f"{FHIR}/Immunization",
-                params  = {"patient": f"Patient/{patient_id}", "_sort": "-date"},
-                headers = {"Accept": "application/fhir+json"},
-            )
-        r.raise_for_status()
-        bundle = r.json()
-        return [e["resource"] for e in bundle.get("entry", [])]
-
-    # 2️⃣ fallback to Mongo
+        return await read_resources(
+            col, "Immunization", patient_id,
+            {"patient": f"Patient/{patient_id}", "_sort": "-date"},
+            response,
+        )
     except Exception as e:
-        print(f"[⚠] FHIR Immunization fetch failed → {e}")
-        docs = await col.find({"patient_id": patient_id}) \
-                        .sort("timestamp", -1) \
-                        .to_list(length=100)
-        mirrored = [d["payload"] for d in docs if "payload" in d]
-        if not mirrored:
-            raise HTTPException(500, "No immunizations found (FHIR & Mongo failed)")
-        return mirrored
+        raise HTTPException(500, f"No immunizations found (FHIR & Mongo failed): {e}")
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -606,18 +472,7 @@ async def create_immunization(
 
     # ── resolve patient username (for Mongo mirror) ─────────────────────────
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.get(
-                f"{FHIR}/Patient/{patient_id}",
-                headers={"Accept": "application/fhir+json"},
-            )
-        r.raise_for_status()
-        patient    = r.json()
-        username = next(
-            (idn["value"] for idn in patient.get("identifier", [])
-             if idn.get("system") == USERNAME_SYSTEM),
-            None,
-        )
+        username = await identity.username_for(patient_id)
         if not username:
             raise RuntimeError("username identifier missing")
     except Exception as e:
@@ -639,12 +494,7 @@ async def create_immunization(
 
     # 1️⃣ POST to FHIR
     try:
-        async with httpx.AsyncClient() as cli:
-            r = await cli.post(
-                f"{FHIR}/Immunization",
-                json    = imm_resource,
-                headers = {"Content-Type": "application/fhir+json"},
-            )
+        r = await fhir_post("Immunization", json=imm_resource)
         r.raise_for_status()
         fhir_id = r.json().get("id")
         synced  = True
@@ -687,14 +537,15 @@ async def decrypt_sample(payload: dict):
 async def download_patient_report(patient_id: str, user=Depends(get_current_user)):
     # check_doctor(user)
 
-    async with httpx.AsyncClient() as client:
-        # notice no Patient/ prefix
-        p = await client.get(f"{FHIR}/Patient/{patient_id}")
-        a = await client.get(f"{FHIR}/AllergyIntolerance", params={"patient": patient_id, "_sort": "-recorded-date"})
-        c = await client.get(f"{FHIR}/Condition", params={"patient": patient_id, "_sort": "-onset-date"})
-        i = await client.get(f"{FHIR}/Immunization", params={"patient": patient_id})
-        t = await client.get(f"{FHIR}/MedicationRequest", params={"subject": f"Patient/{patient_id}"})
-        o = await client.get(f"{FHIR}/Observation", params={"subject": f"Patient/{patient_id}"})
+    # notice no Patient/ prefix; the shared pool lets all six run concurrently
+    p, a, c, i, t, o = await asyncio.gather(
+        fhir_get(f"Patient/{patient_id}"),
+        fhir_get("AllergyIntolerance", params={"patient": patient_id, "_sort": "-recorded-date"}),
+        fhir_get("Condition", params={"patient": patient_id, "_sort": "-onset-date"}),
+        fhir_get("Immunization", params={"patient": patient_id}),
+        fhir_get("MedicationRequest", params={"subject": f"Patient/{patient_id}"}),
+        fhir_get("Observation", params={"subject": f"Patient/{patient_id}"}),
+    )
 
     patient = p.json()
     allergies = a.json().get("entry", [])
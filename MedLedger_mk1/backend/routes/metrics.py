@@ -0,0 +1,82 @@
+# backend/routes/metrics.py
+from fastapi import APIRouter, Query, Request
+
+from fhir_service import fhir_pool_stats
+from identity_cache import identity
+from audit_queue import audit_queue_stats
+from alert_buffer import alert_buffer_stats, subscriber_count
+from fanout import fanout_stats
+from notification import vital_history_stats, ws_fanout_stats
+from routes.anomaly import iso_scheduler
+from sync_fhir import SYNC_RUNS_COLLECTION
+from fhir_outbox import outbox_stats
+from mirror_reads import mirror_read_stats
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/fhir")
+async def fhir_metrics():
+    """
+    Shared FHIR client: request counters, configured limits and a snapshot
+    of the connection pool (idle / active / queued).
+    """
+    return fhir_pool_stats()
+
+
+@router.get("/audit")
+async def audit_metrics():
+    """Blockchain audit queue depth, in-flight txs and submit/confirm latency."""
+    return audit_queue_stats()
+
+
+@router.get("/alerts")
+async def alert_metrics():
+    """Open SSE alert streams in this worker and cross-worker fan-out counters."""
+    return {"sse_subscribers": subscriber_count(), "fanout": fanout_stats()}
+
+
+@router.get("/ws")
+async def ws_metrics():
+    """Per-patient WebSocket fan-out: deliveries, drops and send latency."""
+    return ws_fanout_stats()
+
+
+@router.get("/inference")
+async def inference_metrics():
+    """Isolation Forest micro-batching: batch size, queue wait and inference time."""
+    return iso_scheduler.stats()
+
+
+@router.get("/buffers")
+async def buffer_metrics():
+    """In-memory recent vitals/alerts ring buffers: keys held, bytes, evictions."""
+    return {"vitals": vital_history_stats(), "alerts": alert_buffer_stats()}
+
+
+@router.get("/identity")
+async def identity_metrics():
+    """username ↔ patient_id cache: hits, negative hits, misses, evictions."""
+    return identity.stats()
+
+
+@router.get("/sync")
+async def sync_metrics(request: Request, n: int = Query(10, ge=1, le=200)):
+    """Last `n` mirror → FHIR resync runs: dirty docs scanned, replayed, failed, duration."""
+    cursor = (request.app.state.mongo[SYNC_RUNS_COLLECTION]
+              .find({}, {"_id": 0})
+              .sort("started_at", -1)
+              .limit(n))
+    return await cursor.to_list(length=n)
+
+
+@router.get("/outbox")
+async def outbox_metrics(request: Request):
+    """Failed-replay outbox: pending / due / dead items, oldest pending lag, worker lease."""
+    return await outbox_stats(request.app.state.mongo)
+
+
+@router.get("/reads")
+async def read_metrics():
+    """Clinical list reads by source: FHIR, fresh / stale mirror, fallback; background refreshes."""
+    return mirror_read_stats()
@@ -0,0 +1,49 @@
+# backend/routes/models.py
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+import os
+import config
+
+from auth import get_current_user
+from fanout import publish, register_handler
+from model_registry import registry
+
+router = APIRouter(prefix="/models", tags=["Models"])
+
+
+async def _swap(name: str, payload: dict) -> None:
+    try:
+        await registry.swap(name, payload.get("path"))
+    except Exception as e:
+        print(f"⚠️ model reload for {name} failed:", e)
+
+
+# Every worker swaps when any one of them is asked to (see fanout.py)
+register_handler("model", _swap)
+
+
+@router.get("/")
+async def list_models():
+    """Active version of each registered model in this worker."""
+    return registry.describe()
+
+
+@router.post("/{name}/reload")
+async def reload_model(name: str, path: Optional[str] = None, user=Depends(get_current_user)):
+    """
+    Hot-swap `name` to the artifact `path` in MODEL_DIR (or re-read the
+    current file) on every worker.  In-flight predictions finish on the old version.
+    """
+    if user["role"] != "admin":
+        raise HTTPException(403, "Not permitted")
+    try:
+        registry.get(name)
+    except KeyError:
+        raise HTTPException(404, f"Unknown model {name!r}")
+    if path is not None:
+        # artifacts are pickles – only load them from the model directory
+        path = os.path.abspath(os.path.join(config.MODEL_DIR, path))
+        if os.path.dirname(path) != os.path.abspath(config.MODEL_DIR) or not os.path.isfile(path):
+            raise HTTPException(400, f"No such artifact in {config.MODEL_DIR}")
+    publish("model", name, {"path": path})
+    return {"message": "Reload requested", "name": name, "path": path}
@@ -3,7 +3,6 @@ import asyncio
 import traceback
 
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-import httpx
 import config
 from pydantic import BaseModel, Field
 from auth import get_current_user
@@ -11,7 +10,7 @@ from fastapi.responses import StreamingResponse
 
 from utils.pdf_report import generate_patient_pdf
 # from mirror_utils import mirror_fetch_resources
-from blockchain import store_patient_record
+from audit_queue import enqueue_audit
 from models import PatientCreate, PatientAdditional, Patient
 from routes.users import fake_users_db
 from database import get_collection
@@ -19,6 +18,9 @@ from datetime import datetime, date, timezone
 from typing import List, Dict
 from routes.anomaly import ingest_vitals, VitalIn   # adjust imports to your layout
 from mongo_client import get_mongo_collection
+from fhir_service import fhir_get, fhir_post, fhir_put, fhir_delete
+from identity_cache import identity
+from mirror_reads import read_resources
 from routes.mirror_utils import mirror_patient
 from crypto import encrypt_text  # your existing RSA encrypt
 from datetime import datetime
@@ -31,35 +33,42 @@ USERNAME_SYSTEM = "http://medledger.example.org/username"
 router = APIRouter()
 
 
+async def _my_patient_id(username: str) -> str:
+    """Patient.id for the logged-in user, via the identity cache."""
+    patient_id = await identity.patient_id_for(username)
+    if not patient_id:
+        raise HTTPException(404, "Patient record not found")
+    return patient_id
+
+
 @router.get("/me")
 async def get_my_patient(current_user: dict = Depends(get_current_user)):
     """
-    Fetch the Patient resource for the logged‑in patient via identifier search,
+    Fetch the Patient resource for the logged‑in patient (id from the identity cache),
     and return only the fields the UI needs.
     """
     # if current_user["role"] != "patient":
     #     raise HTTPException(status_code=403, detail="Not permitted")
 
     username = current_user["username"]
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-            headers={"Accept": "application/fhir+json"}
-        )
+    try:
+        patient_id = await _my_patient_id(username)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"FHIR lookup failed: {e}")
+    resp = await fhir_get(f"Patient/{patient_id}")
 
+    if resp.status_code in (404, 410):
+        identity.invalidate(username=username)
+        raise HTTPException(status_code=404, detail="Patient record not found")
     if resp.status_code != 200:
         raise HTTPException(
             status_code=500,
             detail=f"FHIR lookup failed: {resp.status_code} {resp.text}"
         )
 
-    bundle = resp.json()
-    entries = bundle.get("entry", [])
-    if not entries:
-        raise HTTPException(status_code=404, detail="Patient record not found")
-
-    resource = entries[0]["resource"]
+    resource = resp.json()
     # Build a simple dict with exactly the fields we need:
     return {
         "id":        resource.get("id"),
@@ -77,11 +86,7 @@ async def get_my_patient(current_user: dict = Depends(get_current_user)):
 async def get_patient_resource(patient_id: str, current_user=Depends(get_current_user)):
     if current_user["role"] not in ("admin", "doctor"):
         raise HTTPException(403, "Not permitted")
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient/{patient_id}",
-            headers={"Accept": "application/fhir+json"}
-        )
+    resp = await fhir_get(f"Patient/{patient_id}")
     if resp.status_code != 200:
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
     return resp.json()
@@ -99,11 +104,7 @@ async def add_additional_details(
         raise HTTPException(403, "Not permitted")
 
     # 1) fetch current FHIR resource
-    async with httpx.AsyncClient() as client:
-        get_resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient/{patient_id}",
-            headers={"Accept": "application/fhir+json"}
-        )
+    get_resp = await fhir_get(f"Patient/{patient_id}")
     if get_resp.status_code != 200:
         raise HTTPException(
             status_code=get_resp.status_code,
@@ -147,15 +148,14 @@ async def add_additional_details(
         resource["contact"] = contacts
 
     # 3) PUT it back to FHIR
-    async with httpx.AsyncClient() as client:
-        put_resp = await client.put(
-            f"{config.FHIR_SERVER_URL}/Patient/{patient_id}",
-            json=resource,
-            headers={
-              "Content-Type": "application/json",
-              "Prefer": "return=representation"
-            }
-        )
+    put_resp = await fhir_put(
+        f"Patient/{patient_id}",
+        json=resource,
+        headers={
+          "Content-Type": "application/json",
+          "Prefer": "return=representation"
+        }
+    )
     if put_resp.status_code not in (200, 201):
         raise HTTPException(
             status_code=500,
@@ -188,8 +188,8 @@ async def add_additional_details(
     # 5) blockchain audit
     try:
         rec_str = f"action:additional;id:{patient_id};data:{details.json()}"
-        receipt = store_patient_record(rec_str)
-        print("🔗 blockchain receipt:", receipt)
+        record_hash = enqueue_audit(rec_str)
+        print("🔗 blockchain audit queued:", record_hash)
     except Exception as ex:
         print("⚠️ blockchain audit failed:", ex)
 
@@ -197,46 +197,42 @@ async def add_additional_details(
 
 
 @router.get("/me/treatments", response_model=List[Dict])
-async def get_my_treatments(current_user: dict = Depends(get_current_user)):
+async def get_my_treatments(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    col=Depends(get_mongo_collection("treatments")),
+):
     if current_user["role"] != "patient":
         raise HTTPException(403, "Not permitted")
 
-    username = current_user["username"]
-    # 1) Find patient by identifier
-    async with httpx.AsyncClient() as client:
-        pat = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-            headers={"Accept": "application/fhir+json"}
-        )
-    pat.raise_for_status()
-    entries = pat.json().get("entry", [])
-    if not entries:
-        raise HTTPException(404, "Patient not found")
-    patient_id = entries[0]["resource"]["id"]
-
-    # 2) Fetch their MedicationRequest (treatments), sorted newest first
-    async with httpx.AsyncClient() as client:
-        trt = await client.get(
-            f"{config.FHIR_SERVER_URL}/MedicationRequest",
-            params={"subject": f"Patient/{patient_id}", "_sort": "-authoredon"},
-            headers={"Accept": "application/fhir+json"}
+    # 1) Lookup patient ID (cached username → id)
+    patient_id = await _my_patient_id(current_user["username"])
+
+    # 2) MedicationRequest resources from FHIR or the Mongo mirror (FHIR_READ_POLICY)
+    try:
+        resources = await read_resources(
+            col, "MedicationRequest", patient_id, {"subject": f"Patient/{patient_id}", "_sort": "-authoredon"}, response
         )
-    trt.raise_for_status()
+    except Exception as e:
+        raise HTTPException(500, f"FHIR treatments fetch failed: {e}")
 
-    # 3) Build simple list
+    # 3) Extract minimal fields and sort newest first
     result = []
-    for e in trt.json().get("entry", []):
-        t = e["resource"]
+    for r in resources:
         result.append({
-            "id": t["id"],
-            "date": t.get("authoredOn"),
-            "medication": t.get("medicationCodeableConcept", {}).get("text")
+            "id": r.get("id"),
+            "date": r.get("authoredOn"),
+            "medication": r.get("medicationCodeableConcept", {}).get("text")
         })
+    result.sort(key=lambda x: x["date"] or "", reverse=True)
     return result
 
 @router.get("/me/observations", response_model=List[Dict])
-async def get_my_observations(current_user: dict = Depends(get_current_user)):
+async def get_my_observations(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    col=Depends(get_mongo_collection("observations")),
+):
     """
     Return all Observations (date + note) that doctors have recorded
     for the logged‑in patient, sorted newest first.
@@ -244,46 +240,26 @@ async def get_my_observations(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "patient":
         raise HTTPException(403, "Not permitted")
 
-    # 1) Look up the Patient resource by identifier=username
-    username = current_user["username"]
-    async with httpx.AsyncClient() as client:
-        pat_resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-            headers={"Accept": "application/fhir+json"}
-        )
-    if pat_resp.status_code != 200:
-        raise HTTPException(500, f"FHIR lookup failed: {pat_resp.status_code} {pat_resp.text}")
-
-    pat_data = pat_resp.json()
-    entries = pat_data.get("entry") or []
-    if not entries:
-        raise HTTPException(404, "Patient record not found")
-
-    patient_id = entries[0]["resource"]["id"]
+    # 1) Lookup patient ID (cached username → id)
+    patient_id = await _my_patient_id(current_user["username"])
 
-    # 2) Query Observations for that patient
-    async with httpx.AsyncClient() as client:
-        obs_resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Observation",
-            params={"subject": f"Patient/{patient_id}"},
-            headers={"Accept": "application/fhir+json"}
+    # 2) Observation resources from FHIR or the Mongo mirror (FHIR_READ_POLICY)
+    try:
+        resources = await read_resources(
+            col, "Observation", patient_id, {"subject": f"Patient/{patient_id}"}, response
         )
-    if obs_resp.status_code != 200:
-        raise HTTPException(500, f"FHIR observations fetch failed: {obs_resp.status_code} {obs_resp.text}")
+    except Exception as e:
+        raise HTTPException(500, f"FHIR observations fetch failed: {e}")
 
-    obs_bundle = obs_resp.json()
+    # 3) Extract minimal fields and sort newest first
     result = []
-    for entry in obs_bundle.get("entry", []):
-        o = entry["resource"]
+    for r in resources:
         result.append({
-            "id": o.get("id"),
-            "date": o.get("effectiveDateTime"),
-            "note": o.get("valueString")
+            "id": r.get("id"),
+            "date": r.get("effectiveDateTime"),
+            "note": r.get("valueString")
         })
-
-    # 3) Sort newest first
-    result.sort(key=lambda r: r["date"] or "", reverse=True)
+    result.sort(key=lambda x: x["date"] or "", reverse=True)
     return result
 
 
@@ -295,11 +271,7 @@ async def get_patient_by_id(
     if current_user["role"] not in ("admin", "doctor"):
         raise HTTPException(403, "Not permitted")
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient/{patient_id}",
-            headers={"Accept": "application/fhir+json"}
-        )
+    resp = await fhir_get(f"Patient/{patient_id}")
 
     if resp.status_code != 200:
         raise HTTPException(
@@ -313,11 +285,7 @@ async def get_patient_by_id(
 
 @router.get("/{patient_id}", summary="Get one patient by ID")
 async def get_patient(patient_id: str, current_user=Depends(get_current_user)):
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient/{patient_id}",
-            headers={"Accept": "application/fhir+json"}
-        )
+    resp = await fhir_get(f"Patient/{patient_id}")
     if resp.status_code != 200:
         raise HTTPException(resp.status_code, resp.text)
     return resp.json()
@@ -346,12 +314,7 @@ async def create_patient(patient: Patient):
         "Prefer": "return=representation"
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            json=fhir_payload,
-            headers=headers
-        )
+    response = await fhir_post("Patient", json=fhir_payload, headers=headers)
 
     if response.status_code not in (200, 201):
         raise HTTPException(
@@ -378,11 +341,7 @@ async def create_patient(patient: Patient):
         patient_id = location.rstrip("/").split("/")[-1]
 
     if not patient_id:
-        async with httpx.AsyncClient() as client:
-            get_response = await client.get(
-                f"{config.FHIR_SERVER_URL}/Patient?name={family_name}",
-                headers={"Accept": "application/fhir+json"}
-            )
+        get_response = await fhir_get("Patient", params={"name": family_name})
         if get_response.status_code in (200, 201):
             try:
                 data = get_response.json()
@@ -396,9 +355,8 @@ async def create_patient(patient: Patient):
     # --- Blockchain Audit Integration ---
     try:
         patient_data_str = f"action:create;id:{patient_id};name:{patient.name}"
-        print("✅ About to call store_patient_record()")
-        receipt = store_patient_record(patient_data_str)
-        print("✅ Blockchain transaction receipt:", receipt)
+        record_hash = enqueue_audit(patient_data_str)
+        print("✅ Blockchain audit queued:", record_hash)
     except Exception as e:
         print("❌ Blockchain transaction failed:", e)
         print(traceback.format_exc())
@@ -433,12 +391,7 @@ async def update_patient(
     }
 
     # 3) Send the update to HAPI FHIR
-    async with httpx.AsyncClient() as client:
-        response = await client.put(
-            f"{config.FHIR_SERVER_URL}/Patient/{patient_id}",
-            json=updated_data,
-            headers=headers
-        )
+    response = await fhir_put(f"Patient/{patient_id}", json=updated_data, headers=headers)
 
     if response.status_code not in (200, 201):
         # Surface any diagnostic HTML/JSON from HAPI
@@ -457,11 +410,14 @@ async def update_patient(
             detail=f"Failed to parse update response JSON: {e}"
         )
 
+    # Identifiers may have changed; drop the cached username mapping
+    identity.invalidate(patient_id=patient_id)
+
     # 5) Blockchain audit: record that update
     try:
         audit_str = f"action:update;id:{patient_id};data:{updated_data}"
-        receipt = store_patient_record(audit_str)
-        print("Blockchain update receipt:", receipt)
+        record_hash = enqueue_audit(audit_str)
+        print("Blockchain update queued:", record_hash)
     except Exception as e:
         # we do not fail the whole operation if blockchain fails
         print("Blockchain update failed:", e)
@@ -478,19 +434,20 @@ async def delete_patient(patient_id: str, current_user=Depends(get_current_user)
     if current_user["role"] != "admin":
         raise HTTPException(403, "Not permitted")
 
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(f"{config.FHIR_SERVER_URL}/Patient/{patient_id}")
+    response = await fhir_delete(f"Patient/{patient_id}")
     if response.status_code not in (200, 204):
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete patient on FHIR server: {response.text}"
         )
 
+    identity.invalidate(patient_id=patient_id)
+
     # --- Blockchain Audit Integration for Delete ---
     try:
         delete_data_str = f"action:delete;id:{patient_id}"
-        blockchain_receipt = await store_patient_record(delete_data_str)
-        print("Blockchain delete transaction receipt:", blockchain_receipt)
+        record_hash = enqueue_audit(delete_data_str)
+        print("Blockchain delete queued:", record_hash)
     except Exception as e:
         print("Blockchain delete transaction failed:", e)
     # --- End of Blockchain Integration for Delete ---
@@ -507,11 +464,7 @@ async def list_patients(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "admin":
         raise HTTPException(403, "Not permitted")
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient?_count=100",
-            headers={"Accept": "application/fhir+json"}
-        )
+    resp = await fhir_get("Patient", params={"_count": 100})
 
     if resp.status_code not in (200, 201):
         raise HTTPException(500, f"FHIR search failed: {resp.status_code} {resp.text}")
@@ -525,99 +478,61 @@ async def list_patients(current_user: dict = Depends(get_current_user)):
     return {"patients": patients}
 
 @router.get("/me/allergies", response_model=List[Dict])
-async def get_my_allergies(current_user: dict = Depends(get_current_user)):
+async def get_my_allergies(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    col=Depends(get_mongo_collection("allergies")),
+):
     if current_user["role"] != "patient":
         raise HTTPException(403, "Not permitted")
 
-    username = current_user["username"]
+    # 1) Lookup patient ID (cached username → id)
+    patient_id = await _my_patient_id(current_user["username"])
 
+    # 2) AllergyIntolerance resources from FHIR or the Mongo mirror (FHIR_READ_POLICY)
     try:
-        # 1) Lookup the patient by identifier
-        async with httpx.AsyncClient() as client:
-            pat_resp = await client.get(
-                f"{config.FHIR_SERVER_URL}/Patient",
-                params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-                headers={"Accept": "application/fhir+json"}
-            )
-        pat_resp.raise_for_status()
-        entries = pat_resp.json().get("entry", [])
-        if not entries:
-            raise HTTPException(404, "Patient record not found")
-        patient_id = entries[0]["resource"]["id"]
-
-        # 2) Fetch AllergyIntolerance for that patient
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{config.FHIR_SERVER_URL}/AllergyIntolerance",
-                params={"patient": f"Patient/{patient_id}"},
-                headers={"Accept": "application/fhir+json"}
-            )
-        resp.raise_for_status()
-        bundle = resp.json()
-
-        # ✅ If FHIR succeeded, process normally
-        result = []
-        for entry in bundle.get("entry", []):
-            r = entry["resource"]
-            result.append({
-                "id":   r["id"],
-                "date": r.get("recordedDate"),
-                "text": r.get("code", {}).get("text")
-            })
-        result.sort(key=lambda x: x["date"] or "", reverse=True)
-        return result
-
+        resources = await read_resources(
+            col, "AllergyIntolerance", patient_id, {"patient": f"Patient/{patient_id}"}, response
+        )
     except Exception as e:
-        # ⚠ If FHIR fails, fallback to Mongo mirror
-        print(f"[⚠] FHIR allergy fetch failed – using Mongo: {e}")
-        patient_id = patient_id if 'patient_id' in locals() else None
-        if not patient_id:
-            # if lookup patient itself failed
-            db = await get_mongo_db()
-            patient_doc = await db["patients_basic"].find_one({"username": username})
-            if not patient_doc:
-                raise HTTPException(404, "Patient not found in database")
-            patient_id = patient_doc.get("patient_id")
-            if not patient_id:
-                raise HTTPException(404, "Patient ID missing in database")
-
-        return await mirror_fetch_resources("AllergyIntolerance", patient_id)
+        raise HTTPException(500, f"FHIR allergies fetch failed: {e}")
+
+    # 3) Extract minimal fields and sort newest first
+    result = []
+    for r in resources:
+        result.append({
+            "id":   r.get("id"),
+            "date": r.get("recordedDate"),
+            "text": r.get("code", {}).get("text")
+        })
+    result.sort(key=lambda x: x["date"] or "", reverse=True)
+    return result
 
 @router.get("/me/conditions", response_model=List[Dict])
-async def get_my_conditions(current_user: dict = Depends(get_current_user)):
+async def get_my_conditions(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    col=Depends(get_mongo_collection("conditions")),
+):
     if current_user["role"] != "patient":
         raise HTTPException(403, "Not permitted")
 
-    # 1) Lookup patient ID via identifier
-    username = current_user["username"]
-    async with httpx.AsyncClient() as client:
-        pat_resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-            headers={"Accept": "application/fhir+json"}
-        )
-    pat_resp.raise_for_status()
-    entries = pat_resp.json().get("entry", [])
-    if not entries:
-        raise HTTPException(404, "Patient record not found")
-    patient_id = entries[0]["resource"]["id"]
-
-    # 2) Fetch all Condition resources
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Condition",
-            params={"patient": f"Patient/{patient_id}"},
-            headers={"Accept": "application/fhir+json"}
+    # 1) Lookup patient ID (cached username → id)
+    patient_id = await _my_patient_id(current_user["username"])
+
+    # 2) Condition resources from FHIR or the Mongo mirror (FHIR_READ_POLICY)
+    try:
+        resources = await read_resources(
+            col, "Condition", patient_id, {"patient": f"Patient/{patient_id}"}, response
         )
-    resp.raise_for_status()
-    bundle = resp.json()
+    except Exception as e:
+        raise HTTPException(500, f"FHIR conditions fetch failed: {e}")
 
     # 3) Extract minimal fields and sort newest first
     result = []
-    for entry in bundle.get("entry", []):
-        r = entry["resource"]
+    for r in resources:
         result.append({
-            "id":   r["id"],
+            "id":   r.get("id"),
             "date": r.get("onsetDateTime"),
             "text": r.get("code", {}).get("text")
         })
@@ -625,40 +540,30 @@ async def get_my_conditions(current_user: dict = Depends(get_current_user)):
     return result
 
 @router.get("/me/immunizations", response_model=List[Dict])
-async def get_my_immunizations(current_user: dict = Depends(get_current_user)):
+async def get_my_immunizations(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    col=Depends(get_mongo_collection("immunizations")),
+):
     if current_user["role"] != "patient":
         raise HTTPException(403, "Not permitted")
 
-    # 1) Lookup patient ID via identifier
-    username = current_user["username"]
-    async with httpx.AsyncClient() as client:
-        pat_resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-            headers={"Accept": "application/fhir+json"}
-        )
-    pat_resp.raise_for_status()
-    entries = pat_resp.json().get("entry", [])
-    if not entries:
-        raise HTTPException(404, "Patient record not found")
-    patient_id = entries[0]["resource"]["id"]
-
-    # 2) Fetch all Immunization resources
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Immunization",
-            params={"patient": f"Patient/{patient_id}"},
-            headers={"Accept": "application/fhir+json"}
+    # 1) Lookup patient ID (cached username → id)
+    patient_id = await _my_patient_id(current_user["username"])
+
+    # 2) Immunization resources from FHIR or the Mongo mirror (FHIR_READ_POLICY)
+    try:
+        resources = await read_resources(
+            col, "Immunization", patient_id, {"patient": f"Patient/{patient_id}"}, response
         )
-    resp.raise_for_status()
-    bundle = resp.json()
+    except Exception as e:
+        raise HTTPException(500, f"FHIR immunizations fetch failed: {e}")
 
     # 3) Extract minimal fields and sort newest first
     result = []
-    for entry in bundle.get("entry", []):
-        r = entry["resource"]
+    for r in resources:
         result.append({
-            "id":   r["id"],
+            "id":   r.get("id"),
             "date": r.get("occurrenceDateTime"),
             "text": r.get("vaccineCode", {}).get("text")
         })
@@ -702,37 +607,26 @@ async def download_my_report(current_user: dict = Depends(get_current_user)):
 
     username = current_user["username"]
 
-    # 1) Lookup the Patient by username
-    async with httpx.AsyncClient() as client:
-        pat_resp = await client.get(
-            f"{config.FHIR_SERVER_URL}/Patient",
-            params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-            headers={"Accept": "application/fhir+json"}
-        )
-    pat_resp.raise_for_status()
-    entries = pat_resp.json().get("entry", [])
-    if not entries:
+    # 1) Lookup the patient id by username (cached)
+    patient_id = await _my_patient_id(username)
+
+    # 2) Pull the Patient and its clinical data
+    pat_resp, *resps = await asyncio.gather(
+        fhir_get(f"Patient/{patient_id}"),
+        fhir_get("Observation", params={"subject": f"Patient/{patient_id}", "_sort": "-date"}),
+        fhir_get("AllergyIntolerance", params={"patient": f"Patient/{patient_id}"}),
+        fhir_get("Condition", params={"patient": f"Patient/{patient_id}"}),
+        fhir_get("MedicationRequest", params={"subject": f"Patient/{patient_id}"}),
+        fhir_get("Immunization", params={"patient": f"Patient/{patient_id}"}),
+        return_exceptions=True
+    )
+    if isinstance(pat_resp, Exception):
+        raise HTTPException(500, f"FHIR lookup failed: {pat_resp}")
+    if pat_resp.status_code in (404, 410):
+        identity.invalidate(username=username)
         raise HTTPException(404, "Patient record not found")
-    patient = entries[0]["resource"]
-    patient_id = patient["id"]
-
-    # 2) Pull clinical data
-    async with httpx.AsyncClient() as client:
-        def fhir_fetch(resource, params):
-            return client.get(
-                f"{config.FHIR_SERVER_URL}/{resource}",
-                params=params,
-                headers={"Accept": "application/fhir+json"}
-            )
-
-        resps = await asyncio.gather(
-            fhir_fetch("Observation", {"subject": f"Patient/{patient_id}", "_sort": "-date"}),
-            fhir_fetch("AllergyIntolerance", {"patient": f"Patient/{patient_id}"}),
-            fhir_fetch("Condition", {"patient": f"Patient/{patient_id}"}),
-            fhir_fetch("MedicationRequest", {"subject": f"Patient/{patient_id}"}),
-            fhir_fetch("Immunization", {"patient": f"Patient/{patient_id}"}),
-            return_exceptions=True
-        )
+    pat_resp.raise_for_status()
+    patient = pat_resp.json()
 
     # Process fetched responses
     observations = []
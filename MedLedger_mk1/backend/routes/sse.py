@@ -1,26 +1,52 @@
 # backend/routes/sse.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
+from typing import Optional
 import asyncio, json
-from auth import get_current_user
-from alert_buffer import get_alerts
+import config
+from auth import decode_token
+from alert_buffer import get_alerts_since, subscribe, unsubscribe
 
 router = APIRouter(prefix="/sse", tags=["alerts"])
 
-async def stream(username: str):
-    last = 0
-    while True:
-        alerts = get_alerts(username)
-        if len(alerts) > last:
-            for rec in alerts[:last*-1 or None]:
-                yield f"data: {json.dumps(rec)}\n\n"
-            last = len(alerts)
-        await asyncio.sleep(1)
+
+def _event(seq: int, rec: dict) -> str:
+    return f"id: {seq}\ndata: {json.dumps(rec)}\n\n"
+
+
+async def stream(username: str, last_id: int):
+    """
+    Push alerts as add_alert() publishes them.  The connection just awaits its
+    queue, so an idle client costs one parked coroutine; a comment line goes
+    out every SSE_KEEPALIVE seconds so proxies don't drop it.
+    """
+    q = subscribe(username)     # subscribe first so nothing slips between replay and live
+    try:
+        # Seqs come from each worker's clock, so they are not a global order:
+        # only drop live events that the replay already sent.
+        replayed = set()
+        for seq, rec in get_alerts_since(username, last_id):
+            replayed.add(seq)
+            yield _event(seq, rec)
+        while True:
+            try:
+                seq, rec = await asyncio.wait_for(q.get(), timeout=config.SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if seq in replayed:
+                replayed.discard(seq)
+                continue
+            yield _event(seq, rec)
+    finally:
+        unsubscribe(username, q)
+
 
 @router.get("/alerts")
-async def sse_alerts(token: str):
+async def sse_alerts(request: Request, token: str, last_event_id: Optional[int] = None):
     """
     Simple token query-param auth so EventSource can work.
+    Resumes after the browser's Last-Event-ID header (or ?last_event_id=).
     """
     try:
         payload = decode_token(token)          # returns {"sub": "patient1", ...}
@@ -28,4 +54,12 @@ async def sse_alerts(token: str):
     except Exception:
         raise HTTPException(401, "bad token")
 
-    return StreamingResponse(stream(username), media_type="text/event-stream")
\ No newline at end of file
+    header = request.headers.get("last-event-id")
+    if last_event_id is None and header and header.isdigit():
+        last_event_id = int(header)
+
+    return StreamingResponse(
+        stream(username, last_event_id or 0),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
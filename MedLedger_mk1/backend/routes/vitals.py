@@ -1,23 +1,25 @@
 # backend/routes/vitals.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from datetime import datetime, timezone
-from typing import Dict
-import os
+from array import array
+
 import numpy as np
-import joblib
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
 
 from auth import get_current_user
+import config
 from config import MONGO_URI
 from motor.motor_asyncio import AsyncIOMotorClient
 from mongo_client import get_mongo_collection
+from utils.downsample import downsample
+from routes.anomaly import iso_scheduler
+from vitals_store import insert_vital, fetch_vitals, iter_vitals
+from vitals_rollups import RESOLUTIONS, as_utc, query_rollups
 
 router = APIRouter(tags=["Vitals"])
 router2 = APIRouter(tags=["Vitals"])
 
-# Load Isolation Forest model
-model = joblib.load(os.path.join(os.path.dirname(__file__), "../isoforest.joblib"))
-
 # Mongo connection
 mongo_client = AsyncIOMotorClient(MONGO_URI)
 db = mongo_client["medledger_analytics"]
@@ -45,8 +47,9 @@ async def post_vitals(
     #     raise HTTPException(403, "Not permitted")
 
     # Run anomaly detection
-    X = np.array([[body["heart_rate"], body["spo2"], body["temperature"]]])  # Match model's training order
-    is_anomaly = model.predict(X)[0] == -1
+    X = [body["heart_rate"], body["spo2"], body["temperature"]]  # Match model's training order
+    pred, model_version = await iso_scheduler.predict(X)
+    is_anomaly = pred == -1
 
     doc = {
         "patient_id":  patient_id,
@@ -56,13 +59,14 @@ async def post_vitals(
         "heart_rate":  body["heart_rate"],
         "timestamp":   datetime.now(timezone.utc),
         "anomaly":     bool(is_anomaly),
+        "model_version": model_version,
     }
 
-    await col.insert_one(doc)
+    await insert_vital(col, doc)
 
     # Optional: push_alert(...) if SSE is enabled
 
-    return {"stored": True, "anomaly": bool(is_anomaly)}
+    return {"stored": True, "anomaly": bool(is_anomaly), "model_version": model_version}
 
 # ---------------------------------------------------------------------------- #
 # GET /patients/me/vitals
@@ -71,7 +75,84 @@ async def post_vitals(
 @router2.get("/vitals_raw/{patient_id}")
 async def get_raw_vitals(patient_id: str, n: int = Query(10, ge=1, le=100)):
     """Basic endpoint for vitals data, no auth, no role checks — for charts/debug."""
-    cursor = db["vitals"].find({"patient_id": patient_id}, {"_id": 0}).sort("timestamp", -1).limit(n)
-    vitals = await cursor.to_list(length=n)
-    vitals.reverse()
-    return vitals
\ No newline at end of file
+    return await fetch_vitals(db["vitals"], patient_id, limit=n)
+
+
+# ---------------------------------------------------------------------------- #
+# GET /vitals_rollup/{patient_id}
+# ---------------------------------------------------------------------------- #
+@router2.get("/vitals_rollup/{patient_id}")
+async def get_vitals_rollup(
+    patient_id: str,
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+    resolution: Optional[str] = Query(None, description="minute | hour | day (default: picked from the range)"),
+):
+    """
+    Pre-aggregated vitals (count, min, max, mean, variance, anomalies) for a
+    time range, default the last 7 days, in a single indexed query.
+    """
+    if resolution and resolution not in RESOLUTIONS:
+        raise HTTPException(400, f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    until = as_utc(until) if until else datetime.now(timezone.utc)
+    since = as_utc(since) if since else until - timedelta(days=7)
+    if since >= until:
+        raise HTTPException(400, "'from' must be before 'to'")
+    return await query_rollups(db["vitals"], patient_id, since, until, resolution)
+
+
+# ---------------------------------------------------------------------------- #
+# GET /vitals_chart/{patient_id}
+# ---------------------------------------------------------------------------- #
+CHART_SERIES = ("spo2", "temperature", "heart_rate")
+
+
+@router2.get("/vitals_chart/{patient_id}")
+async def get_vitals_chart(
+    patient_id: str,
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+    max_points: int = Query(500, ge=10, le=config.VITALS_CHART_MAX_POINTS),
+):
+    """
+    Chart-ready vitals for any window (default the last 24 hours): each
+    series is reduced to at most `max_points` points with LTTB, and every
+    anomaly sample is kept (see utils/downsample.py).
+    """
+    until = as_utc(until) if until else datetime.now(timezone.utc)
+    since = as_utc(since) if since else until - timedelta(hours=24)
+    if since >= until:
+        raise HTTPException(400, "'from' must be before 'to'")
+
+    # Stream the window into flat arrays – no per-sample dicts are kept
+    ts, flags = array("d"), array("b")
+    values = {f: array("d") for f in CHART_SERIES}
+    async for d in iter_vitals(db["vitals"], patient_id, since, until):
+        ts.append(as_utc(d["timestamp"]).timestamp())
+        flags.append(bool(d.get("anomaly")))
+        for f in CHART_SERIES:
+            v = d.get(f)
+            values[f].append(float("nan") if v is None else float(v))
+
+    t = np.frombuffer(ts, dtype=float)
+    anomaly = np.frombuffer(flags, dtype=np.int8).astype(bool)
+    series = {}
+    for f in CHART_SERIES:
+        y = np.frombuffer(values[f], dtype=float)
+        ok = ~np.isnan(y)
+        xs, ys, an = t[ok], y[ok], anomaly[ok]
+        idx = downsample(xs, ys, max_points, keep=an)
+        series[f] = {
+            "t": [datetime.fromtimestamp(v, tz=timezone.utc).isoformat() for v in xs[idx]],
+            "v": ys[idx].tolist(),
+            "anomaly": an[idx].tolist(),
+        }
+
+    return {
+        "patient_id": patient_id,
+        "from": since,
+        "to": until,
+        "samples": len(t),
+        "max_points": max_points,
+        "series": series,
+    }
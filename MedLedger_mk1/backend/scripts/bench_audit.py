@@ -0,0 +1,60 @@
+"""
+Records-per-second for the three ways of anchoring audit records:
+
+  blocking   – store_patient_record(), one tx and one receipt wait per record
+  per-record – one tx per record, all in flight at once (audit_queue default)
+  merkle     – one tx for the Merkle root of the whole batch (AUDIT_BATCH_MODE)
+
+Run from backend/ against a Hardhat node:
+    python scripts/bench_audit.py [n_records]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blockchain import w3, compute_patient_hash, get_sender, send_record_hash, store_patient_record
+from merkle import build_levels
+
+
+def _records(n: int, tag: str):
+    return [compute_patient_hash(f"action:bench;mode:{tag};i:{i};t:{time.time()}") for i in range(n)]
+
+
+def bench_blocking(n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        store_patient_record(f"action:bench;mode:blocking;i:{i};t:{time.time()}")
+    return time.perf_counter() - t0
+
+
+def bench_per_record(n: int) -> float:
+    sender = get_sender()
+    hashes = _records(n, "per-record")
+    t0 = time.perf_counter()
+    nonce = w3.eth.get_transaction_count(sender, "pending")
+    txs = [send_record_hash(h, nonce + i, sender) for i, h in enumerate(hashes)]
+    for tx in txs:
+        w3.eth.wait_for_transaction_receipt(tx)
+    return time.perf_counter() - t0
+
+
+def bench_merkle(n: int) -> float:
+    sender = get_sender()
+    hashes = _records(n, "merkle")
+    t0 = time.perf_counter()
+    root = build_levels(hashes)[-1][0]
+    nonce = w3.eth.get_transaction_count(sender, "pending")
+    w3.eth.wait_for_transaction_receipt(send_record_hash(root, nonce, sender))
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"anchoring {n} records\n")
+    for name, fn in (("blocking", bench_blocking),
+                     ("per-record", bench_per_record),
+                     ("merkle", bench_merkle)):
+        elapsed = fn(n)
+        print(f"{name:<11} {elapsed:8.2f}s  {n / elapsed:10.1f} records/s")
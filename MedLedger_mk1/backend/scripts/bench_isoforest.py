@@ -0,0 +1,62 @@
+"""
+CompiledForest vs sklearn IsolationForest on the vitals model.
+
+Checks that scores/predictions agree on a synthetic validation set, then
+times single-sample latency and batch throughput.  Run from backend/:
+    python scripts/bench_isoforest.py [n_validation]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import config
+from compiled_forest import CompiledForest
+
+
+def _validation_set(n: int) -> np.ndarray:
+    rng = np.random.default_rng(42)
+    return np.column_stack([
+        rng.integers(30, 180, n),                  # heart_rate
+        rng.uniform(70, 100, n).round(1),          # spo2
+        rng.uniform(34, 41, n).round(1),           # temperature
+    ]).astype(float)
+
+
+def _best(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n: int):
+    model = joblib.load(os.path.join(os.path.dirname(__file__), "..", "isoforest.joblib"))
+    compiled = CompiledForest.from_sklearn(model)
+    X = _validation_set(n)
+    df = pd.DataFrame(X, columns=getattr(model, "feature_names_in_", None))
+
+    diff = np.abs(model.score_samples(df) - compiled.score_samples(X)).max()
+    agree = (model.predict(df) == compiled.predict(X)).mean()
+    print(f"validation: {n} rows, max |score diff| = {diff:.2e}, prediction agreement = {agree:.2%}\n")
+
+    rows = 200
+    sk_one = _best(lambda: [model.predict(df.iloc[[i]]) for i in range(rows)]) / rows
+    c_one = _best(lambda: [compiled.predict_one(X[i]) for i in range(rows)]) / rows
+    print(f"single sample   sklearn {sk_one * 1e6:9.1f} µs   compiled {c_one * 1e6:9.1f} µs   ({sk_one / c_one:.0f}×)")
+
+    for size in sorted({64, 1000, config.ISOFOREST_COMPILED_MAX_BATCH, n}):
+        sk = _best(lambda: model.predict(df[:size]))
+        c = _best(lambda: compiled.predict(X[:size]))
+        print(f"batch {size:>7}   sklearn {size / sk:11.0f}/s   compiled {size / c:11.0f}/s   ({sk / c:.1f}×)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,48 @@
+"""
+Samples/second: N single-sample POSTs vs one POST /vitals/batch.
+
+Needs a running backend and a JWT (any role) in BENCH_TOKEN:
+    BENCH_TOKEN=... python scripts/bench_vitals.py [n_samples] [base_url]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+
+
+def _sample(i: int) -> dict:
+    return {
+        "patient_id": str(1 + i % 20),
+        "heart_rate": random.randint(55, 110),
+        "spo2": round(random.uniform(90, 100), 1),
+        "temperature": round(random.uniform(36.0, 38.5), 1),
+    }
+
+
+async def main(n: int, base: str):
+    headers = {"Authorization": f"Bearer {os.environ['BENCH_TOKEN']}"}
+    samples = [_sample(i) for i in range(n)]
+
+    async with httpx.AsyncClient(base_url=base, headers=headers, timeout=60) as cli:
+        t0 = time.perf_counter()
+        for s in samples:
+            r = await cli.post(f"/vitals/vitals/{s['patient_id']}", json=s)
+            r.raise_for_status()
+        single = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        r = await cli.post("/vitals/batch", json=samples)
+        r.raise_for_status()
+        batch = time.perf_counter() - t0
+
+    print(f"single-sample {single:7.2f}s  {n / single:10.1f} samples/s")
+    print(f"batch         {batch:7.2f}s  {n / batch:10.1f} samples/s  ({single / batch:.1f}×)")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    base = sys.argv[2] if len(sys.argv) > 2 else "http://localhost:8000"
+    asyncio.run(main(n, base))
@@ -0,0 +1,53 @@
+"""
+Smoke-test the Mongo fan-out backend against a local mongod.
+
+Two MongoCappedBackend instances stand in for two uvicorn workers: every
+message published through either one must be delivered by both tails.
+
+    python scripts/check_fanout.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+import fanout
+
+load_dotenv()
+
+
+async def main(n: int = 50):
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    db = client[os.getenv("MONGO_DB", "medledger_analytics")]
+
+    received = []
+    fanout.register_handler("check", lambda key, payload: received.append((key, payload["i"])))
+
+    a = fanout.MongoCappedBackend(db, "fanout_check", 1024 * 1024)
+    b = fanout.MongoCappedBackend(db, "fanout_check", 1024 * 1024)
+    await a.start()
+    await b.start()
+    await asyncio.sleep(0.5)                     # let both tails open
+
+    for i in range(n):
+        (a if i % 2 else b).publish("check", "p1", {"i": i})
+
+    for _ in range(50):
+        if len(received) >= 2 * n:
+            break
+        await asyncio.sleep(0.1)
+
+    await a.stop()
+    await b.stop()
+    client.close()
+
+    ok = sorted(i for _, i in received) == sorted(list(range(n)) * 2)
+    print(f"delivered {len(received)}/{2 * n} → {'OK' if ok else 'MISSING MESSAGES'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Copy one-document-per-reading vitals collections into the layout used by
+VITALS_STORAGE=timeseries or VITALS_STORAGE=buckets (see vitals_store.py).
+
+ISO-string timestamps written by older simulate_vitals.py runs are converted
+to dates on the way.  Rollups are left alone: they already cover these
+samples (or can be rebuilt with scripts/rebuild_vitals_rollups.py).  The source collection is left in place unless
+--drop-source is given, so a migration can be re-checked before switching
+the app over.
+
+Run from backend/:
+    python scripts/migrate_vitals_storage.py --to buckets [--collection vitals anomaly_vitals]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import config
+import vitals_store
+
+
+async def _size(db, name: str) -> int:
+    try:
+        stats = await db.command("collStats", name)
+    except Exception:
+        return 0
+    return stats.get("storageSize", 0) + stats.get("totalIndexSize", 0)
+
+
+async def migrate(db, name: str, batch: int, drop: bool) -> None:
+    source = db[name]
+    total = await source.estimated_document_count()
+    print(f"[🚚] {name}: {total} readings → {config.VITALS_STORAGE}")
+
+    t0, done, buf = time.perf_counter(), 0, []
+    async for doc in source.find({}, {"_id": 0}).sort([("patient_id", 1), ("timestamp", 1)]):
+        if doc.get("timestamp") is None:
+            continue
+        doc["timestamp"] = vitals_store.as_utc(doc["timestamp"])
+        buf.append(doc)
+        if len(buf) >= batch:
+            await vitals_store.insert_vitals(source, buf, rollup=False)
+            done += len(buf)
+            buf = []
+            print(f"    {done}/{total}")
+    if buf:
+        await vitals_store.insert_vitals(source, buf, rollup=False)
+        done += len(buf)
+
+    target = (await vitals_store._target(source)).name
+    before, after = await _size(db, name), await _size(db, target)
+    print(f"[✅] {name}: {done} readings in {time.perf_counter() - t0:.1f}s; "
+          f"{before / 1e6:.1f} MB → {target} {after / 1e6:.1f} MB (data + indexes)")
+    if drop:
+        await source.drop()
+        print(f"[🗑️] dropped {name}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", required=True, choices=["timeseries", "buckets"])
+    parser.add_argument("--collection", nargs="+", default=["vitals", "anomaly_vitals"])
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--drop-source", action="store_true")
+    args = parser.parse_args()
+
+    config.VITALS_STORAGE = args.to
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", config.MONGO_URI), tz_aware=True)
+    db = client[config.MONGO_DB]
+    for name in args.collection:
+        await migrate(db, name, args.batch, args.drop_source)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
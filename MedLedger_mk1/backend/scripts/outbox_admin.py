@@ -0,0 +1,71 @@
+"""
+Inspect and repair the FHIR replay outbox (fhir_outbox.py).
+
+Run from backend/:
+    python scripts/outbox_admin.py lag                 # backlog, oldest pending lag, lease
+    python scripts/outbox_admin.py dead [--limit 50]   # dead-lettered items and their last error
+    python scripts/outbox_admin.py requeue [--id observations:65f…]   # dead → pending (all if no --id)
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import config
+from fhir_outbox import OUTBOX_COLLECTION, outbox_stats
+
+
+async def show_dead(db, limit: int) -> None:
+    cursor = db[OUTBOX_COLLECTION].find({"status": "dead"}).sort("dead_at", -1).limit(limit)
+    n = 0
+    async for item in cursor:
+        n += 1
+        print(f"{item['_id']}  {item.get('resource_type')}  patient={item.get('patient_key')}  "
+              f"attempts={item.get('attempts')}  dead_at={item.get('dead_at')}")
+        print(f"    {item.get('last_error')}")
+    print(f"[📭] {n} dead item(s) shown")
+
+
+async def requeue(db, ids) -> None:
+    query = {"status": "dead"}
+    if ids:
+        query["_id"] = {"$in": ids}
+    now = datetime.now(timezone.utc)
+    items = await db[OUTBOX_COLLECTION].find(query, {"collection": 1, "doc_id": 1}).to_list(length=None)
+    res = await db[OUTBOX_COLLECTION].update_many(
+        {"_id": {"$in": [i["_id"] for i in items]}},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt": now, "updated_at": now},
+         "$unset": {"dead_at": ""}},
+    )
+    # the outbox owns these mirror docs again (the resync skips them)
+    for item in items:
+        await db[item["collection"]].update_one({"_id": item["doc_id"]}, {"$set": {"outbox": True}})
+    print(f"[♻] requeued {res.modified_count} item(s)")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["lag", "dead", "requeue"])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--id", nargs="*", default=None, help="outbox item ids (<collection>:<doc _id>)")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", config.MONGO_URI), tz_aware=True)
+    db = client[config.MONGO_DB]
+    if args.command == "lag":
+        print(json.dumps(await outbox_stats(db), indent=2, default=str))
+    elif args.command == "dead":
+        await show_dead(db, args.limit)
+    else:
+        await requeue(db, args.id)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
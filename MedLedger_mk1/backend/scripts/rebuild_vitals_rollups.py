@@ -0,0 +1,54 @@
+"""
+Recompute the minute/hour/day rollups (vitals_rollups.py) from stored
+samples – for data written before rollups existed, or after a manual fix.
+Reads through vitals_store, so it works under any VITALS_STORAGE engine.
+
+Run from backend/:
+    python scripts/rebuild_vitals_rollups.py [--collection vitals anomaly_vitals]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import config
+from vitals_rollups import update_rollups
+from vitals_store import iter_vitals, patient_ids
+
+
+async def rebuild(db, name: str, batch: int) -> None:
+    col = db[name]
+    await db[f"{name}_rollups"].delete_many({})
+    t0, total = time.perf_counter(), 0
+    for pid in await patient_ids(col):
+        buf = []
+        async for doc in iter_vitals(col, pid):
+            buf.append(doc)
+            if len(buf) >= batch:
+                await update_rollups(col, buf)
+                total, buf = total + len(buf), []
+        await update_rollups(col, buf)
+        total += len(buf)
+    print(f"[✅] {name}: rolled up {total} samples in {time.perf_counter() - t0:.1f}s")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", nargs="+", default=["vitals", "anomaly_vitals"])
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", config.MONGO_URI), tz_aware=True)
+    db = client[config.MONGO_DB]
+    for name in args.collection:
+        await rebuild(db, name, args.batch)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,14 @@
 """
-Mirror every locally-cached FHIR resource in Mongo back to the live FHIR
-server.  A doc is considered “fixed” when GET /<type>/<fhir_id> returns 200;
-otherwise we POST its `payload` again.
+Mirror locally-cached FHIR resources in Mongo back to the live FHIR server.
+Only dirty docs are visited (`synced` not True and not owned by the outbox),
+a bounded number at a time; per-collection stats land in `fhir_sync_state`.
+A doc is considered “fixed” when GET /<type>/<fhir_id> returns 200;
+otherwise its `payload` is POSTed again – grouped into `batch`/`transaction`
+Bundles of FHIR_SYNC_BUNDLE_SIZE, with per-item retries only for the entries
+that failed.  Each run is logged to `fhir_sync_runs`.
+Docs whose replay fails are handed to the durable outbox (fhir_outbox.py),
+which retries them with backoff; the resync skips them from then on, and
+queues other dirty docs of the same patient behind them.
 
 Collections mirrored   →   FHIR resourceType
 ----------------------------------------------------
@@ -15,12 +22,12 @@ treatments             →   MedicationRequest
 
 from __future__ import annotations
 
-import asyncio, os
+import asyncio, os, time
 from datetime import datetime
 from typing import Dict, List
 
-import httpx
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateMany, UpdateOne
 
 from dotenv import load_dotenv
 import config
@@ -28,6 +35,9 @@ import config
 load_dotenv()
 
 from config import FHIR_SERVER_URL, USERNAME_SYSTEM
+from fhir_service import fhir_get, fhir_post
+from identity_cache import identity
+import fhir_outbox
 
 RESOURCE_COLLECTIONS: Dict[str, str] = {
     "patients_basic": "Patient",
@@ -49,135 +59,361 @@ async def wait_for_fhir_server(base_url: str, retries: int = 20, delay: int = 3)
     if not base_url.endswith("/fhir"):
         probe_urls.append(f"{base_url}/fhir/metadata")
 
-    async with httpx.AsyncClient(timeout=4) as cli:
-        for _ in range(retries):
-            for url in probe_urls:
-                try:
-                    print(f"[probe] GET {url}")
-                    r = await cli.get(url)
-                    if r.status_code == 200:
-                        print(f"[✅] FHIR reachable at {url}")
-                        return True
-                except Exception as e:
-                    print(f"[✘] {url} → {e}")
-            await asyncio.sleep(delay)
+    for _ in range(retries):
+        for url in probe_urls:
+            try:
+                print(f"[probe] GET {url}")
+                r = await fhir_get(url, timeout=4)
+                if r.status_code == 200:
+                    print(f"[✅] FHIR reachable at {url}")
+                    return True
+            except Exception as e:
+                print(f"[✘] {url} → {e}")
+        await asyncio.sleep(delay)
     print(" FHIR server NOT reachable.")
     return False
 
 
-async def ensure_fhir_sync(db: AsyncIOMotorDatabase) -> None:
+SYNC_STATE_COLLECTION = "fhir_sync_state"
+SYNC_RUNS_COLLECTION = "fhir_sync_runs"
+
+_sync_indexes_ready = False
+
+
+async def ensure_sync_indexes(db: AsyncIOMotorDatabase) -> None:
+    global _sync_indexes_ready
+    if _sync_indexes_ready:
+        return
+    for coll_name in RESOURCE_COLLECTIONS:
+        # dirty scan: synced ∈ {False, missing}, oldest first
+        await db[coll_name].create_index([("synced", 1), ("timestamp", 1)])
+        await db[coll_name].create_index([("username", 1)])   # patient_id backfill
+    await db[SYNC_RUNS_COLLECTION].create_index([("started_at", -1)])
+    _sync_indexes_ready = True
+
+
+def _dirty_query() -> dict:
+    """Not yet on the FHIR server (`synced` False or never set), and not owned by the outbox."""
+    return {"synced": {"$in": [False, None]}, "outbox": {"$ne": True}}
+
+
+async def _verify_doc(coll, fhir_type: str, doc: dict, stats: Dict[str, int]) -> bool:
+    """
+    True if the doc's fhir_id still exists on the server (and mark it synced),
+    False if the server says it is gone.  Any other answer raises, so the
+    doc is not re-POSTed as a duplicate.
+    """
+    r = await fhir_get(f"{fhir_type}/{doc['fhir_id']}")
+    if r.status_code in (404, 410):
+        return False
+    r.raise_for_status()
+    await coll.update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"synced": True, "error": None}}
+    )
+    stats["verified"] += 1
+    return True
+
+
+async def _mark_failed(coll, fhir_type: str, doc: dict, exc: Exception, stats: Dict[str, int]) -> None:
+    await coll.update_one(
+        {"_id": doc["_id"]},
+        {"$set": {
+            "synced": False,
+            "error": str(exc),
+            "resynced_failed_at": datetime.utcnow()
+        }}
+    )
+    stats["failed"] += 1
+    print(f"[✘] {fhir_type} {doc['_id']} : {exc}")
+    await fhir_outbox.enqueue(coll.database, coll.name, doc, str(exc))
+
+
+async def _post_doc(coll, fhir_type: str, doc: dict, stats: Dict[str, int]) -> None:
+    """Re-POST one mirrored document on its own."""
+    doc_id = doc["_id"]
+    try:
+        print(f"[→] Replaying {fhir_type} {doc_id} …")
+        r = await fhir_post(fhir_type, json=doc["payload"])
+        r.raise_for_status()
+        new_id = r.json()["id"]
+
+        await coll.update_one(
+            {"_id": doc_id},
+            {"$set": {
+                "fhir_id": new_id,
+                "synced": True,
+                "error": None,
+                "resynced_at": datetime.utcnow()
+            }}
+        )
+        stats["replayed"] += 1
+        print(f"[✔] {fhir_type} {doc_id} → FHIR ID {new_id}")
+    except Exception as exc:
+        await _mark_failed(coll, fhir_type, doc, exc, stats)
+
+
+def _entry_id(entry: dict) -> str | None:
+    """New resource id from a Bundle.response entry, or None if it failed."""
+    response = entry.get("response") or {}
+    if not str(response.get("status", "")).startswith("2"):
+        return None
+    resource_id = (entry.get("resource") or {}).get("id")
+    if resource_id:
+        return resource_id
+    # location: "Observation/123/_history/1"
+    parts = (response.get("location") or "").split("/")
+    return parts[1] if len(parts) > 1 else None
+
+
+async def _post_bundle(coll, fhir_type: str, docs: List[dict], stats: Dict[str, int]) -> List[dict]:
     """
-    * for each doc in every mirrored collection:
-        – if `fhir_id` exists and GET returns 200 → mark synced True
-        – else  POST payload again, store new id, timestamps, etc.
+    POST `docs` as one FHIR_SYNC_BUNDLE_TYPE Bundle, record the ids it
+    assigned, and return the docs that still need a per-item retry.
+    """
+    bundle = {
+        "resourceType": "Bundle",
+        "type": config.FHIR_SYNC_BUNDLE_TYPE,
+        "entry": [
+            {"resource": d["payload"], "request": {"method": "POST", "url": fhir_type}}
+            for d in docs
+        ],
+    }
+    try:
+        r = await fhir_post("", json=bundle)
+        r.raise_for_status()
+        entries = r.json().get("entry") or []
+    except Exception as exc:
+        print(f"[⚠] {fhir_type} bundle of {len(docs)} failed ({exc}); retrying one by one")
+        return docs
+    stats["bundles"] += 1
+
+    now = datetime.utcnow()
+    ops, retry = [], []
+    # Bundle.response entries come back in request order
+    for i, doc in enumerate(docs):
+        new_id = _entry_id(entries[i]) if i < len(entries) else None
+        if new_id is None:
+            retry.append(doc)
+            continue
+        ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"fhir_id": new_id, "synced": True, "error": None, "resynced_at": now}},
+        ))
+    if ops:
+        await coll.bulk_write(ops, ordered=False)
+        stats["replayed"] += len(ops)
+    print(f"[✔] {fhir_type} bundle: {len(ops)}/{len(docs)} stored")
+    return retry
+
+
+async def _sync_collection(db: AsyncIOMotorDatabase, coll_name: str, fhir_type: str,
+                           sem: asyncio.Semaphore, blocked: set) -> Dict[str, int]:
+    coll = db[coll_name]
+    state_col = db[SYNC_STATE_COLLECTION]
+    started = datetime.utcnow()
+
+    stats = {"scanned": 0, "verified": 0, "replayed": 0, "failed": 0, "skipped": 0,
+             "deferred": 0, "bundles": 0, "retried": 0}
+    to_post: List[dict] = []
+
+    async def _bounded(coro):
+        async with sem:
+            return await coro
+
+    async def _check(doc):
+        try:
+            if not await _bounded(_verify_doc(coll, fhir_type, doc, stats)):
+                to_post.append(doc)
+        except Exception as exc:
+            await _mark_failed(coll, fhir_type, doc, exc, stats)
+
+    # 1) scan dirty docs; ones that already have a fhir_id are verified first
+    checks = []
+    async for doc in coll.find(_dirty_query()).sort("timestamp", 1):
+        stats["scanned"] += 1
+        if (doc.get("payload") or {}).get("resourceType") != fhir_type:
+            print(f"[⚠] {coll_name}:{doc['_id']} type mismatch – skipped")
+            stats["skipped"] += 1
+            continue
+        key = await fhir_outbox.patient_key(coll_name, doc)
+        if key in blocked:
+            # older writes of this patient are still queued: go behind them
+            await fhir_outbox.enqueue(db, coll_name, doc, key=key, failed=False)
+            stats["deferred"] += 1
+        elif doc.get("fhir_id"):
+            checks.append(asyncio.create_task(_check(doc)))
+        else:
+            to_post.append(doc)
+    await asyncio.gather(*checks)
+
+    # 2) replay in Bundles, 3) retry only the entries that failed, one by one
+    size = max(1, config.FHIR_SYNC_BUNDLE_SIZE)
+    if size == 1:
+        retry = to_post
+    else:
+        chunks = [to_post[i:i + size] for i in range(0, len(to_post), size)]
+        leftovers = await asyncio.gather(*(
+            _bounded(_post_bundle(coll, fhir_type, chunk, stats)) for chunk in chunks
+        ))
+        retry = [doc for part in leftovers for doc in part]
+        stats["retried"] = len(retry)
+    await asyncio.gather(*(_bounded(_post_doc(coll, fhir_type, doc, stats)) for doc in retry))
+
+    await state_col.update_one(
+        {"_id": coll_name},
+        {"$set": {"last_run_at": started, "last_stats": stats}},
+        upsert=True,
+    )
+    return stats
+
+
+async def ensure_fhir_sync(db: AsyncIOMotorDatabase) -> Dict | None:
+    """
+    Replay only dirty mirrored documents (see `_dirty_query`), up to
+    FHIR_SYNC_CONCURRENCY at a time, and record the run in `fhir_sync_runs`.
     """
     if not await wait_for_fhir_server(FHIR_SERVER_URL, retries=10, delay=3):
         print("FHIR unavailable; aborting")
-        return
+        return None
+
+    await ensure_sync_indexes(db)
+    started = datetime.utcnow()
+    t0 = time.perf_counter()
+    sem = asyncio.Semaphore(config.FHIR_SYNC_CONCURRENCY)
+    blocked = await fhir_outbox.blocked_patients(db)
+
+    results = await asyncio.gather(*(
+        _sync_collection(db, coll_name, fhir_type, sem, blocked)
+        for coll_name, fhir_type in RESOURCE_COLLECTIONS.items()
+    ))
+    per_collection = dict(zip(RESOURCE_COLLECTIONS, results))
+    totals = {k: sum(r[k] for r in results) for k in results[0]}
+
+    run = {
+        "started_at": started,
+        "duration_s": round(time.perf_counter() - t0, 3),
+        **totals,
+        "collections": per_collection,
+    }
+    await db[SYNC_RUNS_COLLECTION].insert_one(dict(run))
+    print(f"[🔁] FHIR resync: {totals['scanned']} dirty, {totals['replayed']} replayed, "
+          f"{totals['failed']} failed in {run['duration_s']}s")
+    return run
+
 
-    async with httpx.AsyncClient(timeout=15) as cli:
-        for coll_name, fhir_type in RESOURCE_COLLECTIONS.items():
-            coll = db[coll_name]
-            async for doc in coll.find():
-                fhir_id = doc.get("fhir_id")
-                payload = doc.get("payload") or {}
-                doc_id = doc["_id"]
-
-                if payload.get("resourceType") != fhir_type:
-                    print(f"[⚠] {coll_name}:{doc_id} type mismatch – skipped")
-                    continue
-
-                try:
-
-                    already = False
-                    if fhir_id:
-                        r = await cli.get(
-                            f"{FHIR_SERVER_URL}/{fhir_type}/{fhir_id}",
-                            headers={"Accept": "application/fhir+json"}
-                        )
-                        if r.status_code == 200:
-                            already = True
-                            await coll.update_one(
-                                {"_id": doc_id},
-                                {"$set": {"synced": True, "error": None}}
-                            )
-
-                    if already:
-                        continue
-                    if not payload:
-                        raise ValueError("payload missing")
-
-                    print(f"[→] Replaying {fhir_type} {doc_id} …")
-                    r = await cli.post(
-                        f"{FHIR_SERVER_URL}/{fhir_type}",
-                        json=payload,
-                        headers={"Content-Type": "application/fhir+json"}
-                    )
-                    r.raise_for_status()
-                    new_id = r.json()["id"]
-
-                    await coll.update_one(
-                        {"_id": doc_id},
-                        {"$set": {
-                            "fhir_id": new_id,
-                            "synced": True,
-                            "error": None,
-                            "resynced_at": datetime.utcnow()
-                        }}
-                    )
-                    print(f"[✔] {fhir_type} {doc_id} → FHIR ID {new_id}")
-
-                except Exception as exc:
-                    await coll.update_one(
-                        {"_id": doc_id},
-                        {"$set": {
-                            "synced": False,
-                            "error": str(exc),
-                            "resynced_failed_at": datetime.utcnow()
-                        }}
-                    )
-                    print(f"[✘] {fhir_type} {doc_id} : {exc}")
-
-
-async def update_patient_ids_from_usernames(db: AsyncIOMotorDatabase) -> None:
+def _usernames_in(resource: dict) -> List[str]:
+    return [i["value"] for i in resource.get("identifier", [])
+            if i.get("system") == USERNAME_SYSTEM and i.get("value")]
+
+
+async def _resolve_usernames(usernames: List[str], sem: asyncio.Semaphore) -> Dict[str, str]:
+    """username → Patient.id for one `identifier=sys|a,sys|b,…` search, following `next` pages."""
+    found: Dict[str, str] = {}
+    url = "Patient"
+    params: Dict[str, str] | None = {
+        "identifier": ",".join(f"{USERNAME_SYSTEM}|{u}" for u in usernames),
+        "_count": str(len(usernames)),
+        "_elements": "identifier",
+    }
+    async with sem:
+        while url:
+            r = await fhir_get(url, params=params, timeout=8)
+            r.raise_for_status()
+            bundle = r.json()
+            for entry in bundle.get("entry") or []:
+                resource = entry.get("resource") or {}
+                for username in _usernames_in(resource):
+                    found.setdefault(username, resource["id"])
+            # the next link is absolute and already carries the query
+            url = next((l["url"] for l in bundle.get("link", []) if l.get("relation") == "next"), None)
+            params = None
+    return found
+
+
+async def update_patient_ids_from_usernames(db: AsyncIOMotorDatabase) -> Dict[str, float]:
+    """
+    Backfill `patient_id` from the FHIR username identifier, in bulk:
+    FHIR_BACKFILL_BATCH usernames per search, then one unordered bulk_write
+    per collection.  A username is written only where its stored id differs
+    (in `patients_basic`) or is still missing (in the other collections).
+    """
+    await ensure_sync_indexes(db)
+    t0 = time.perf_counter()
     patient_col = db["patients_basic"]
-    secondary_cols: List[str] = [
-        c for c in RESOURCE_COLLECTIONS.keys() if c != "patients_basic"
-    ]
+    known: Dict[str, str | None] = {}
+    async for p in patient_col.find({"username": {"$exists": True}}, {"username": 1, "patient_id": 1}):
+        known[p["username"]] = p.get("patient_id")
 
-    async with httpx.AsyncClient(timeout=8) as cli:
-        async for patient in patient_col.find({"username": {"$exists": True}}):
-            username = patient["username"]
-            try:
-                r = await cli.get(
-                    f"{FHIR_SERVER_URL}/Patient",
-                    params={"identifier": f"{USERNAME_SYSTEM}|{username}"},
-                    headers={"Accept": "application/fhir+json"}
-                )
-                r.raise_for_status()
-                entry = (r.json().get("entry") or [])[0]
-                fhir_id = entry["resource"]["id"]
-
-                await patient_col.update_one({"_id": patient["_id"]},
-                                             {"$set": {"patient_id": fhir_id}})
-                for c in secondary_cols:
-                    await db[c].update_many({"username": username},
-                                            {"$set": {"patient_id": fhir_id}})
-
-                print(f" patient_id for {username} → {fhir_id}")
-            except Exception as e:
-                print(f"patient_id refresh for {username} failed: {e}")
+    names = list(known)
+    size = max(1, config.FHIR_BACKFILL_BATCH)
+    sem = asyncio.Semaphore(config.FHIR_SYNC_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_resolve_usernames(names[i:i + size], sem) for i in range(0, len(names), size)),
+        return_exceptions=True,
+    )
+    resolved: Dict[str, str] = {}
+    for res in results:
+        if isinstance(res, Exception):
+            print(f"patient_id lookup batch failed: {res}")
+        else:
+            resolved.update(res)
+
+    for username, fhir_id in resolved.items():
+        identity.remember(username, fhir_id)
+    changed = {u: pid for u, pid in resolved.items() if known.get(u) != pid}
+
+    async def _apply(coll_name: str) -> int:
+        coll = db[coll_name]
+        targets = dict(changed)
+        if coll_name != "patients_basic":
+            # docs mirrored while the patient had no id yet
+            for u in await coll.distinct("username", {"patient_id": {"$in": [None, ""]}}):
+                if u in resolved:
+                    targets[u] = resolved[u]
+        if not targets:
+            return 0
+        res = await coll.bulk_write(
+            [UpdateMany({"username": u, "patient_id": {"$ne": pid}}, {"$set": {"patient_id": pid}})
+             for u, pid in targets.items()],
+            ordered=False,
+        )
+        return res.modified_count
+
+    modified = await asyncio.gather(*(_apply(c) for c in RESOURCE_COLLECTIONS))
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "patients": len(names),
+        "resolved": len(resolved),
+        "changed": len(changed),
+        "docs_updated": sum(modified),
+        "duration_s": round(elapsed, 3),
+        "patients_per_s": round(len(names) / elapsed, 1) if elapsed > 0 else None,
+    }
+    print(f"[🪪] patient_id backfill: {stats['resolved']}/{stats['patients']} resolved, "
+          f"{stats['changed']} changed, {stats['docs_updated']} docs updated "
+          f"({stats['patients_per_s']} patients/s)")
+    return stats
 
 
 async def periodic_sync(db: AsyncIOMotorDatabase):
+    # One resync at a time across all workers
+    if not await fhir_outbox.acquire_lease(db, "fhir_resync", config.FHIR_RESYNC_LEASE_SECONDS):
+        print("[⏭] background FHIR sync already running elsewhere – skipped")
+        return
     print("[🔄] background FHIR sync")
-    await ensure_fhir_sync(db)
-    await update_patient_ids_from_usernames(db)
+    try:
+        await ensure_fhir_sync(db)
+        await update_patient_ids_from_usernames(db)
+    finally:
+        await fhir_outbox.release_lease(db, "fhir_resync")
 
 
 def start_scheduler(db: AsyncIOMotorDatabase):
     from apscheduler.schedulers.asyncio import AsyncIOScheduler
     sched = AsyncIOScheduler()
-    sched.add_job(lambda: asyncio.create_task(periodic_sync(db)),
-                  trigger="interval", minutes=2, id="fhir_resync_job")
+    # The coroutine itself is the job, so a run still going when the next one
+    # is due is skipped (max_instances) instead of piling up.
+    sched.add_job(periodic_sync, args=[db], trigger="interval", minutes=2,
+                  id="fhir_resync_job", max_instances=1, coalesce=True)
     sched.start()
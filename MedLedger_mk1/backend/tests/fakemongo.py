@@ -0,0 +1,226 @@
+"""Minimal in-memory stand-in for the Motor collections used by the tests."""
+import copy
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne, UpdateMany
+
+
+def _get(doc, path):
+    cur = doc
+    for part in path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return None, False
+        cur = cur[part]
+    return cur, True
+
+
+def _norm(value):
+    # BSON dates are UTC: naive and aware datetimes compare as they would in Mongo
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _cmp_ok(val, present, cond):
+    val = _norm(val)
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$in":
+                if val not in arg:
+                    return False
+            elif op == "$nin":
+                if val in arg:
+                    return False
+            elif op == "$ne":
+                if val == arg:
+                    return False
+            elif op == "$exists":
+                if bool(present) != bool(arg):
+                    return False
+            elif op in ("$lt", "$lte", "$gt", "$gte"):
+                arg = _norm(arg)
+                if not present or val is None:
+                    return False
+                if op == "$lt" and not val < arg:
+                    return False
+                if op == "$lte" and not val <= arg:
+                    return False
+                if op == "$gt" and not val > arg:
+                    return False
+                if op == "$gte" and not val >= arg:
+                    return False
+            else:
+                raise NotImplementedError(op)
+        return True
+    return val == cond
+
+
+def matches(doc, query):
+    for k, cond in query.items():
+        if k == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+            continue
+        if k == "$nor":
+            if any(matches(doc, q) for q in cond):
+                return False
+            continue
+        if k == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+            continue
+        val, present = _get(doc, k)
+        if not _cmp_ok(val, present, cond):
+            return False
+    return True
+
+
+def _apply(doc, update, insert=False):
+    for k, v in update.get("$set", {}).items():
+        doc[k] = copy.deepcopy(v)
+    if insert:
+        for k, v in update.get("$setOnInsert", {}).items():
+            doc[k] = copy.deepcopy(v)
+    for k in update.get("$unset", {}):
+        doc.pop(k, None)
+    for k, v in update.get("$inc", {}).items():
+        doc[k] = doc.get(k, 0) + v
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self._limit = None
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        for k, d in reversed(keys):
+            self.docs.sort(key=lambda x: (_get(x, k)[0] is not None, _get(x, k)[0]), reverse=d == -1)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    async def to_list(self, length=None):
+        docs = self.docs
+        n = self._limit or length
+        return [copy.deepcopy(d) for d in (docs[:n] if n else docs)]
+
+    def __aiter__(self):
+        self._it = iter(copy.deepcopy(self.docs[: self._limit] if self._limit else self.docs))
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class Result:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class Collection:
+    def __init__(self, db, name):
+        self.database = db
+        self.name = name
+        self.docs = []
+
+    async def create_index(self, *a, **k):
+        return "ix"
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(copy.deepcopy(doc))
+        return Result(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        for d in docs:
+            await self.insert_one(d)
+        return Result()
+
+    def find(self, query=None, projection=None):
+        return Cursor([d for d in self.docs if matches(d, query or {})])
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        c = self.find(query)
+        if sort:
+            c.sort(sort)
+        r = await c.to_list(1)
+        return r[0] if r else None
+
+    async def distinct(self, key, query=None):
+        out = []
+        for d in self.docs:
+            if matches(d, query or {}):
+                v, p = _get(d, key)
+                if p and v not in out:
+                    out.append(v)
+        return out
+
+    async def count_documents(self, query):
+        return len([d for d in self.docs if matches(d, query)])
+
+    async def update_one(self, query, update, upsert=False):
+        for d in self.docs:
+            if matches(d, query):
+                _apply(d, update)
+                return Result(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            _apply(doc, update, insert=True)
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(doc)
+            return Result(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update, upsert=False):
+        n = 0
+        for d in self.docs:
+            if matches(d, query):
+                _apply(d, update)
+                n += 1
+        return Result(matched_count=n, modified_count=n)
+
+    async def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, query)]
+        return Result(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            f, u, ups = op._filter, op._doc, op._upsert
+            if isinstance(op, UpdateMany):
+                await self.update_many(f, u, upsert=ups)
+            else:
+                await self.update_one(f, u, upsert=bool(ups))
+        return Result()
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=False):
+        for d in self.docs:
+            if matches(d, query):
+                _apply(d, update)
+                return copy.deepcopy(d)
+        if upsert:
+            from pymongo.errors import DuplicateKeyError
+            if "_id" in query and any(d["_id"] == query["_id"] for d in self.docs):
+                raise DuplicateKeyError("dup")
+            doc = {"_id": query["_id"]} if "_id" in query else {}
+            _apply(doc, update, insert=True)
+            self.docs.append(doc)
+            return copy.deepcopy(doc)
+        return None
+
+
+class Database:
+    def __init__(self):
+        self._c = {}
+
+    def __getitem__(self, name):
+        if name not in self._c:
+            self._c[name] = Collection(self, name)
+        return self._c[name]
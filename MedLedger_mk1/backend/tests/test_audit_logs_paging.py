@@ -0,0 +1,83 @@
+import asyncio
+import sys
+import types
+
+import pytest
+from bson import ObjectId, json_util
+from fastapi import HTTPException
+
+
+@pytest.fixture
+def audit(db, monkeypatch):
+    # routes.audit pulls in the web3 client, which needs a live node at import
+    chain = types.ModuleType("blockchain")
+    chain.compute_patient_hash = lambda data: b"\0" * 32
+    indexer = types.ModuleType("audit_indexer")
+    indexer.find_audit_events = indexer.verify_record_hashes = None
+    monkeypatch.setitem(sys.modules, "blockchain", chain)
+    monkeypatch.setitem(sys.modules, "audit_indexer", indexer)
+    monkeypatch.delitem(sys.modules, "routes.audit", raising=False)
+    from routes import audit as module
+
+    col = db["audit_trail"]
+    monkeypatch.setattr(module, "get_audit_collection", lambda: col)
+    return module, col
+
+
+def _page(module, **kw):
+    params = dict(after=None, after_block=None, order="id", limit=3, since=None,
+                  until=None, sender=None, fields=None, format="json")
+    params.update(kw)
+    resp = asyncio.run(module.get_audit_logs(**params))
+    return json_util.loads(resp.body), resp.headers
+
+
+def _walk(module, order):
+    seen, cursor = [], {}
+    for _ in range(50):
+        docs, headers = _page(module, order=order, **cursor)
+        seen += [d["_id"] for d in docs]
+        if "x-next-after" not in headers:
+            return seen
+        cursor = {"after": headers["x-next-after"]}
+        if order == "block":
+            assert "x-next-after-block" in headers
+            cursor["after_block"] = int(headers["x-next-after-block"])
+    pytest.fail("paging did not terminate")
+
+
+def _mixed(col):
+    # blocks out of insert order, ties within a block, and receipts with a
+    # null or missing blockNumber in between
+    blocks = [7, None, 3, 7, "missing", 3, 9, None, 3, 7, 1]
+    docs = []
+    for b in blocks:
+        doc = {"_id": ObjectId()}
+        if b != "missing":
+            doc["blockNumber"] = b
+        docs.append(doc)
+    col.docs.extend(docs)
+    return docs
+
+
+def test_block_order_walks_every_mined_receipt_once(audit):
+    module, col = audit
+    docs = _mixed(col)
+    expected = [d["_id"] for d in sorted(
+        (d for d in docs if d.get("blockNumber") is not None),
+        key=lambda d: (d["blockNumber"], d["_id"]))]
+    assert _walk(module, "block") == expected
+
+
+def test_id_order_walks_every_receipt_once(audit):
+    module, col = audit
+    docs = _mixed(col)
+    assert _walk(module, "id") == sorted(d["_id"] for d in docs)
+
+
+def test_block_order_rejects_after_without_after_block(audit):
+    module, col = audit
+    _mixed(col)
+    with pytest.raises(HTTPException) as exc:
+        _page(module, order="block", after=str(ObjectId()))
+    assert exc.value.status_code == 400
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+import mirror_reads
+import sync_fhir
+
+
+class _Created:
+    status_code = 201
+
+    def __init__(self, resource_id):
+        self._id = resource_id
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"id": self._id}
+
+
+def _doc(offset_s, **fields):
+    when = datetime.now(timezone.utc) - timedelta(seconds=offset_s)
+    return {"_id": ObjectId.from_datetime(when), "patient_id": "p1",
+            "payload": {"resourceType": "Observation", "id": fields.get("fhir_id")}, **fields}
+
+
+@pytest.fixture
+def col(db):
+    return db["observations"]
+
+
+def test_doc_synced_during_search_is_kept(col, monkeypatch):
+    kept = _doc(120, fhir_id="obs-1", synced=True, username="alice")
+    local = _doc(60, synced=False, username="alice", note="local only")
+    col.docs += [kept, local]
+
+    async def post(path, json=None):
+        return _Created("obs-2")
+
+    async def fetch(resource_type, params):
+        # the resync replays the local doc while the search is in flight; the
+        # search started before obs-2 existed on FHIR, so it is not in the result
+        monkeypatch.setattr(sync_fhir, "fhir_post", post)
+        await sync_fhir._post_doc(col, "Observation", dict(local), {"replayed": 0})
+        return [{"resourceType": "Observation", "id": "obs-1"}], True
+
+    monkeypatch.setattr(mirror_reads, "_fetch", fetch)
+    asyncio.run(mirror_reads._refresh(col, "Observation", "p1", {}))
+
+    synced = next(d for d in col.docs if d["_id"] == local["_id"])
+    assert synced["fhir_id"] == "obs-2" and synced["synced"] is True
+    assert "deleted_on_fhir" not in synced
+    assert synced["note"] == "local only"
+    ids = [r["id"] for r in asyncio.run(mirror_reads._read_mirror(col, "p1"))]
+    assert sorted(ids) == ["obs-1", "obs-2"]
+
+
+def test_doc_gone_from_fhir_is_soft_deleted_and_restored(col):
+    gone = _doc(60, fhir_id="obs-9", synced=True, username="alice")
+    col.docs.append(gone)
+    started = datetime.now(timezone.utc)
+
+    asyncio.run(mirror_reads._store(col, "Observation", "p1", [], True, started))
+    doc = next(d for d in col.docs if d["_id"] == gone["_id"])
+    assert doc["deleted_on_fhir"] is True and doc["username"] == "alice"
+    assert asyncio.run(mirror_reads._read_mirror(col, "p1")) == []
+
+    # it shows up again (e.g. the earlier search hit a lagging index)
+    back = [{"resourceType": "Observation", "id": "obs-9"}]
+    asyncio.run(mirror_reads._store(col, "Observation", "p1", back, True, datetime.now(timezone.utc)))
+    assert [r["id"] for r in asyncio.run(mirror_reads._read_mirror(col, "p1"))] == ["obs-9"]
+
+
+def test_incomplete_search_prunes_nothing(col):
+    col.docs.append(_doc(60, fhir_id="obs-9", synced=True))
+    asyncio.run(mirror_reads._store(col, "Observation", "p1", [], False, datetime.now(timezone.utc)))
+    assert "deleted_on_fhir" not in col.docs[0]
@@ -0,0 +1,78 @@
+# backend/utils/downsample.py
+"""
+Largest-Triangle-Three-Buckets downsampling for chart series.
+
+The points are split into `n_out - 2` equal-count buckets between the fixed
+first and last points.  From each bucket LTTB keeps the point that forms the
+largest triangle with the previously kept point and the next bucket's mean.
+
+The bucket layout, next-bucket means and padded candidate matrices are all
+built with NumPy up front.  Only the argmax per bucket runs in a loop,
+because it depends on the previous pick, so the cost is one short row
+operation per output point, whatever the input length.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices (ascending) of the `n_out` points LTTB keeps from x/y."""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.linspace(0, n - 1, max(n_out, 0)).astype(np.intp)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)   # n_out - 2 buckets over [1, n-1)
+    starts, ends = edges[:-1], edges[1:]
+    width = int((ends - starts).max())
+
+    # Padded (bucket × candidate) views; padding gets area -1 so it never wins
+    cand = starts[:, None] + np.arange(width)[None, :]
+    valid = cand < ends[:, None]
+    cand = np.where(valid, cand, starts[:, None])
+    cx, cy = x[cand], y[cand]
+
+    # Mean of the following bucket (the last point for the final bucket)
+    csum_x, csum_y = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    nxt_s = np.append(ends[:-1], n - 1)
+    nxt_e = np.append(ends[1:], n)
+    cnt = nxt_e - nxt_s
+    mx = (csum_x[nxt_e] - csum_x[nxt_s]) / cnt
+    my = (csum_y[nxt_e] - csum_y[nxt_s]) / cnt
+
+    # Area for anchor a is |(a.x - m.x)(p.y - a.y) - (a.x - p.x)(m.y - a.y)| / 2
+    out = np.empty(n_out, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+    ax, ay = x[0], y[0]
+    for b in range(len(starts)):
+        area = np.abs((ax - mx[b]) * (cy[b] - ay) - (ax - cx[b]) * (my[b] - ay))
+        area[~valid[b]] = -1.0
+        k = int(area.argmax())
+        out[b + 1] = cand[b, k]
+        ax, ay = cx[b, k], cy[b, k]
+    return out
+
+
+def downsample(
+    x: np.ndarray,
+    y: np.ndarray,
+    max_points: int,
+    keep: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    LTTB indices for a series, always including the points flagged in `keep`
+    (e.g. anomalies).  Kept points take at most half of `max_points`; if
+    there are more, an even spread of them is kept.  The result never holds
+    more than `max_points` indices.
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+    forced = np.flatnonzero(keep) if keep is not None else np.zeros(0, dtype=np.intp)
+    cap = max_points // 2
+    if len(forced) > cap:
+        forced = forced[np.linspace(0, len(forced) - 1, cap).astype(int)]
+    picked = lttb_indices(x, y, max_points - len(forced))
+    return np.union1d(picked, forced)
@@ -0,0 +1,77 @@
+# backend/utils/etag.py
+"""
+Weak ETags for the backend's own JSON GET responses.
+
+Every 200 `application/json` reply to a GET gets `ETag: W/"<hash>"` and
+`Cache-Control: private, no-cache`, so the browser keeps the body but asks
+again each time.  A request whose `If-None-Match` matches gets an empty 304.
+The route still runs, but with the FHIR-side conditional cache
+(fhir_service.py) that usually costs a 304 upstream too, and the payload
+is not sent twice.
+
+This is plain ASGI middleware.  It only buffers the JSON responses it
+tags; SSE, NDJSON exports and PDFs stream through untouched.
+"""
+import hashlib
+from typing import List
+
+
+def _etag(body: bytes) -> str:
+    return 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def _matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    opaque = etag[2:]
+    return "*" in tags or any(t == etag or t.removeprefix("W/") == opaque for t in tags)
+
+
+class ETagMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = None
+        for name, value in scope.get("headers", []):
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+
+        start = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def _send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                ctype = dict(message.get("headers", [])).get(b"content-type", b"")
+                if message["status"] != 200 or not ctype.startswith(b"application/json"):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            # http.response.body: buffer until the last chunk
+            chunks.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+            body = b"".join(chunks)
+            etag = _etag(body)
+            headers = [(k, v) for k, v in start.get("headers", [])
+                       if k not in (b"etag", b"cache-control")]
+            headers += [(b"etag", etag.encode()), (b"cache-control", b"private, no-cache")]
+            if if_none_match and _matches(if_none_match, etag):
+                headers = [(k, v) for k, v in headers if k != b"content-length"]
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, _send)
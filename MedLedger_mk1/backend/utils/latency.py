@@ -0,0 +1,65 @@
+# backend/utils/latency.py
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class LatencyWindow:
+    """
+    Rolling window of the last `size` samples (seconds).  Cheap enough to
+    record on every request; `snapshot()` is what the /metrics routes return.
+    """
+
+    def __init__(self, size: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def _pct(self, ordered: list, q: float) -> Optional[float]:
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        ordered = sorted(self._samples)
+        ms = lambda v: None if v is None else round(v * 1000, 3)
+        return {
+            "count": self.count,
+            "avg_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self._pct(ordered, 0.50)),
+            "p95_ms": ms(self._pct(ordered, 0.95)),
+            "p99_ms": ms(self._pct(ordered, 0.99)),
+            "max_ms": ms(ordered[-1]) if ordered else None,
+        }
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus-style upper bounds, last is +inf)."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> Dict[str, object]:
+        labels = [f"le_{b}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
@@ -1,27 +1,41 @@
-from blockchain import contract, w3
+"""
+Print RecordStored audit events.
+
+Catches the `audit_events` index up from its checkpoint (only new blocks are
+read from the node), then answers from Mongo:
+
+    python view_audit.py [--hash HEX] [--sender ADDR] [--since ISO] [--until ISO] [--limit N]
+"""
+import argparse
+import asyncio
 import json
+from datetime import datetime
+
+from audit_indexer import index_audit_events, find_audit_events
 
-START_BLOCK = 0
 
-event_sig = w3.keccak(text="RecordStored(address,bytes32,uint256)").hex()
+async def main(args):
+    await index_audit_events()
+    events = await find_audit_events(
+        record_hash=args.hash,
+        sender=args.sender,
+        since=datetime.fromisoformat(args.since) if args.since else None,
+        until=datetime.fromisoformat(args.until) if args.until else None,
+        limit=args.limit,
+    )
+    if not events:
+        print("No audit events found. Make sure you’ve actually called storeRecord().")
+        return
+    print(f"Found {len(events)} RecordStored events:\n")
+    for evt in events:
+        print(json.dumps(evt, indent=2, default=str))
 
-logs = w3.eth.get_logs({
-    "fromBlock": START_BLOCK,
-    "toBlock": "latest",
-    "address": contract.address,
-    "topics": [event_sig]
-})
 
-if not logs:
-    print("No audit events found. Make sure you’ve actually called storeRecord().")
-else:
-    print(f"Found {len(logs)} RecordStored events:\n")
-    for raw in logs:
-        evt = contract.events.RecordStored().process_log(raw)
-        print(json.dumps({
-            "transactionHash": evt.transactionHash.hex(),
-            "blockNumber": evt.blockNumber,
-            "sender": evt.args.sender,
-            "recordHash": evt.args.recordHash.hex(),
-            "timestamp": evt.args.timestamp
-        }, indent=2))
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--hash")
+    p.add_argument("--sender")
+    p.add_argument("--since")
+    p.add_argument("--until")
+    p.add_argument("--limit", type=int, default=100)
+    asyncio.run(main(p.parse_args()))
@@ -0,0 +1,193 @@
+"""
+Compact per-key ring buffers of recent vitals records.
+
+Each key (patient_id or username) gets one preallocated NumPy structured
+array of VITALS_RING_DEPTH slots:
+
+    seq int64 | ts float64 | heart_rate, spo2, temperature float32 |
+    anomaly bool | model uint16 (index into an interned version table)
+
+That is 31 bytes per reading, where a dict cost several hundred.  Records
+go in and come out as the same dicts the routes build
+({spo2, temperature, heart_rate, timestamp, anomaly, model_version}).
+
+Reads never create keys.  Keys that have not been written for
+VITALS_RING_IDLE_SECONDS are evicted, and once VITALS_RING_MAX_BYTES is
+reached the least recently written key makes room for a new one.  `stats()`
+reports the footprint for /metrics/buffers.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+RING_DTYPE = np.dtype([
+    ("seq", np.int64),
+    ("ts", np.float64),
+    ("heart_rate", np.float32),
+    ("spo2", np.float32),
+    ("temperature", np.float32),
+    ("anomaly", np.bool_),
+    ("model", np.uint16),
+])
+
+_SWEEP_EVERY = 30.0                    # seconds between idle sweeps
+
+_VERSIONS: List[Optional[str]] = [None]
+_VERSION_IDS: Dict[Optional[str], int] = {None: 0}
+
+
+def _version_id(version: Optional[str]) -> int:
+    vid = _VERSION_IDS.get(version)
+    if vid is None:
+        vid = _VERSION_IDS[version] = len(_VERSIONS)
+        _VERSIONS.append(version)
+    return vid
+
+
+def _epoch(ts) -> float:
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.timestamp()
+    return float(ts or 0.0)
+
+
+def _float(v) -> float:
+    return np.nan if v is None else float(v)
+
+
+class _Ring:
+    __slots__ = ("buf", "head", "size", "touched")
+
+    def __init__(self, depth: int):
+        self.buf = np.zeros(depth, dtype=RING_DTYPE)
+        self.head = 0                  # next slot to write
+        self.size = 0
+        self.touched = time.monotonic()
+
+    def ordered(self) -> np.ndarray:
+        """Filled slots, newest first."""
+        depth = len(self.buf)
+        idx = (self.head - 1 - np.arange(self.size)) % depth
+        return self.buf[idx]
+
+
+class RingStore:
+    def __init__(self, name: str, depth: int, idle_seconds: float, max_bytes: int):
+        self.name = name
+        self.depth = depth
+        self.idle_seconds = idle_seconds
+        self.max_keys = max(1, max_bytes // (depth * RING_DTYPE.itemsize))
+        self._rings: "OrderedDict[str, _Ring]" = OrderedDict()   # least recently written first
+        self._last_sweep = time.monotonic()
+        self._stats = {"appended": 0, "evicted_idle": 0, "evicted_memory": 0}
+
+    def append(self, key: str, record: Dict[str, Any], seq: int = 0) -> None:
+        self._maybe_sweep()
+        ring = self._rings.get(key)
+        if ring is None:
+            while len(self._rings) >= self.max_keys:
+                self._rings.popitem(last=False)
+                self._stats["evicted_memory"] += 1
+            ring = self._rings[key] = _Ring(self.depth)
+        else:
+            self._rings.move_to_end(key)
+        ring.touched = time.monotonic()
+
+        ring.buf[ring.head] = (
+            seq,
+            _epoch(record.get("timestamp")),
+            _float(record.get("heart_rate")),
+            _float(record.get("spo2")),
+            _float(record.get("temperature")),
+            bool(record.get("anomaly")),
+            _version_id(record.get("model_version")),
+        )
+        ring.head = (ring.head + 1) % self.depth
+        ring.size = min(ring.size + 1, self.depth)
+        self._stats["appended"] += 1
+
+    def _rows(self, key: str) -> Optional[np.ndarray]:
+        ring = self._rings.get(key)
+        return ring.ordered() if ring is not None else None
+
+    @staticmethod
+    def _to_records(rows: np.ndarray) -> List[Dict[str, Any]]:
+        # float32 → the short decimal the reading came in as (97.2, not 97.19999)
+        num = lambda v, cast=float: None if v != v else cast(round(v, 4))
+        out = []
+        for seq, ts, hr, spo2, temp, anomaly, model in rows.tolist():
+            out.append({
+                "spo2": num(spo2),
+                "temperature": num(temp),
+                "heart_rate": num(hr, int),
+                "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+                "anomaly": anomaly,
+                "model_version": _VERSIONS[model],
+            })
+        return out
+
+    def records(self, key: str, anomalies_only: bool = False) -> List[Dict[str, Any]]:
+        """Buffered records for `key`, newest first."""
+        rows = self._rows(key)
+        if rows is None:
+            return []
+        if anomalies_only:
+            rows = rows[rows["anomaly"]]
+        return self._to_records(rows)
+
+    def since(self, key: str, last_seq: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """(seq, record) pairs newer than `last_seq`, oldest first."""
+        rows = self._rows(key)
+        if rows is None:
+            return []
+        rows = rows[rows["seq"] > last_seq][::-1]
+        return list(zip(rows["seq"].tolist(), self._to_records(rows)))
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        cutoff = (now or time.monotonic()) - self.idle_seconds
+        evicted = 0
+        # Write order == touch order, so idle keys sit at the front
+        while self._rings:
+            ring = next(iter(self._rings.values()))
+            if ring.touched >= cutoff:
+                break
+            self._rings.popitem(last=False)
+            evicted += 1
+        self._stats["evicted_idle"] += evicted
+        return evicted
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep >= _SWEEP_EVERY:
+            self._last_sweep = now
+            self.evict_idle(now)
+
+    def stats(self) -> Dict[str, Any]:
+        per_key = self.depth * RING_DTYPE.itemsize
+        return {
+            "keys": len(self._rings),
+            "max_keys": self.max_keys,
+            "depth": self.depth,
+            "bytes_per_key": per_key,
+            "bytes": len(self._rings) * per_key,
+            "idle_seconds": self.idle_seconds,
+            **self._stats,
+        }
+
+
+def make_store(name: str) -> RingStore:
+    return RingStore(
+        name,
+        depth=config.VITALS_RING_DEPTH,
+        idle_seconds=config.VITALS_RING_IDLE_SECONDS,
+        max_bytes=config.VITALS_RING_MAX_BYTES,
+    )
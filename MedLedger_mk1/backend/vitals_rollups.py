@@ -0,0 +1,154 @@
+"""
+Per-patient minute / hour / day rollups of vitals, kept current on ingest.
+
+vitals_store.insert_vitals() hands every stored batch to `update_rollups`,
+which folds it into `<collection>_rollups` documents
+
+    {patient_id, res: "minute"|"hour"|"day", start,
+     count, anomalies, first, last,
+     stats: {spo2: {sum, sumsq, min, max}, temperature: {...}, heart_rate: {...}}}
+
+with one `$inc`/`$min`/`$max` upsert per (patient, resolution, period) in
+the batch.  Mean and variance are derived from count/sum/sumsq when read,
+so rollups never need a read-modify-write.  `query_rollups` picks the
+finest resolution that keeps a range under VITALS_ROLLUP_MAX_POINTS and
+reads it with one query on the unique (patient_id, res, start) index.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+import config
+
+FIELDS = ("spo2", "temperature", "heart_rate")
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+
+_ready: set = set()
+
+
+def as_utc(ts) -> datetime:
+    if isinstance(ts, str):                       # legacy simulate_vitals.py docs
+        ts = datetime.fromisoformat(ts)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _floor(ts: datetime, seconds: int) -> datetime:
+    return datetime.fromtimestamp(int(ts.timestamp()) // seconds * seconds, tz=timezone.utc)
+
+
+async def _rollup_col(col):
+    name = f"{col.name}_rollups"
+    target = col.database[name]
+    if name not in _ready:
+        await target.create_index(
+            [("patient_id", ASCENDING), ("res", ASCENDING), ("start", ASCENDING)], unique=True
+        )
+        _ready.add(name)
+    return target
+
+
+def _fold(docs: List[Dict[str, Any]]) -> Dict[Tuple[str, str, datetime], Dict[str, Any]]:
+    """Pre-aggregate a batch in memory so each period gets a single upsert."""
+    acc: Dict[Tuple[str, str, datetime], Dict[str, Any]] = defaultdict(
+        lambda: {"count": 0, "anomalies": 0, "first": None, "last": None, "stats": {}}
+    )
+    for d in docs:
+        if not d.get("patient_id") or d.get("timestamp") is None:
+            continue
+        ts = as_utc(d["timestamp"])
+        for res, secs in RESOLUTIONS.items():
+            a = acc[(d["patient_id"], res, _floor(ts, secs))]
+            a["count"] += 1
+            a["anomalies"] += int(bool(d.get("anomaly")))
+            a["first"] = ts if a["first"] is None else min(a["first"], ts)
+            a["last"] = ts if a["last"] is None else max(a["last"], ts)
+            for f in FIELDS:
+                v = d.get(f)
+                if v is None:
+                    continue
+                v = float(v)
+                s = a["stats"].setdefault(f, {"sum": 0.0, "sumsq": 0.0, "min": v, "max": v})
+                s["sum"] += v
+                s["sumsq"] += v * v
+                s["min"] = min(s["min"], v)
+                s["max"] = max(s["max"], v)
+    return acc
+
+
+async def update_rollups(col, docs: List[Dict[str, Any]]) -> None:
+    """Fold stored samples of `col` into its rollup documents."""
+    acc = _fold(docs)
+    if not acc:
+        return
+    ops = []
+    for (patient_id, res, start), a in acc.items():
+        inc = {"count": a["count"], "anomalies": a["anomalies"]}
+        mins, maxs = {"first": a["first"]}, {"last": a["last"]}
+        for f, s in a["stats"].items():
+            inc[f"stats.{f}.sum"] = s["sum"]
+            inc[f"stats.{f}.sumsq"] = s["sumsq"]
+            mins[f"stats.{f}.min"] = s["min"]
+            maxs[f"stats.{f}.max"] = s["max"]
+        ops.append(UpdateOne(
+            {"patient_id": patient_id, "res": res, "start": start},
+            {"$inc": inc, "$min": mins, "$max": maxs},
+            upsert=True,
+        ))
+    target = await _rollup_col(col)
+    await target.bulk_write(ops, ordered=False)
+
+
+def pick_resolution(since: datetime, until: datetime) -> str:
+    span = max((until - since).total_seconds(), 1)
+    for res, secs in RESOLUTIONS.items():
+        if span / secs <= config.VITALS_ROLLUP_MAX_POINTS:
+            return res
+    return "day"
+
+
+def _summarize(doc: Dict[str, Any]) -> Dict[str, Any]:
+    n = doc["count"]
+    out = {
+        "start": doc["start"],
+        "count": n,
+        "anomalies": doc.get("anomalies", 0),
+        "first": doc.get("first"),
+        "last": doc.get("last"),
+    }
+    for f, s in doc.get("stats", {}).items():
+        mean = s["sum"] / n
+        out[f] = {
+            "min": s["min"],
+            "max": s["max"],
+            "mean": mean,
+            "variance": max(s["sumsq"] / n - mean * mean, 0.0),
+        }
+    return out
+
+
+async def query_rollups(
+    col,
+    patient_id: str,
+    since: datetime,
+    until: datetime,
+    resolution: Optional[str] = None,
+) -> Dict[str, Any]:
+    since, until = as_utc(since), as_utc(until)
+    res = resolution or pick_resolution(since, until)
+    target = await _rollup_col(col)
+    cursor = target.find(
+        {"patient_id": patient_id, "res": res,
+         "start": {"$gte": _floor(since, RESOLUTIONS[res]), "$lte": until}},
+        {"_id": 0, "patient_id": 0, "res": 0},
+    ).sort("start", ASCENDING)
+    points = [_summarize(d) async for d in cursor]
+    return {
+        "patient_id": patient_id,
+        "resolution": res,
+        "from": since,
+        "to": until,
+        "points": points,
+    }
@@ -0,0 +1,188 @@
+"""
+Storage engines for vitals samples.
+
+Routes hand this module the plain collection they always used (`vitals`,
+`anomaly_vitals`) and flat sample documents; VITALS_STORAGE decides how they
+are actually laid out:
+
+  documents  – one document per reading in the collection itself (default)
+  timeseries – MongoDB native time-series collection `<name>_ts`
+               (timeField=timestamp, metaField=meta{patient_id, username})
+  buckets    – `<name>_buckets`: one document per patient per
+               VITALS_BUCKET_SECONDS window holding up to VITALS_BUCKET_MAX
+               samples as an array plus per-field min/max summaries
+
+Reads (`iter_vitals`, `fetch_vitals`) always yield the flat shape
+{patient_id, username, spo2, temperature, heart_rate, timestamp, anomaly, …}
+so callers never see the difference.  Every write also updates the
+minute/hour/day rollups in vitals_rollups.py.  scripts/migrate_vitals_storage.py
+converts existing collections (run it once per collection; it appends).
+"""
+
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+import config
+from vitals_rollups import as_utc, update_rollups
+
+_META = ("patient_id", "username")
+_FIELDS = ("spo2", "temperature", "heart_rate")
+_ready: set = set()
+
+
+def _engine() -> str:
+    return config.VITALS_STORAGE
+
+
+async def _target(col):
+    """The collection that really holds the data for `col` under the engine."""
+    engine = _engine()
+    if engine == "documents":
+        return col
+    db = col.database
+    name = f"{col.name}_ts" if engine == "timeseries" else f"{col.name}_buckets"
+    if name not in _ready:
+        if engine == "timeseries":
+            try:
+                await db.create_collection(name, timeseries={
+                    "timeField": "timestamp", "metaField": "meta", "granularity": "seconds",
+                })
+            except CollectionInvalid:
+                pass
+            await db[name].create_index([("meta.patient_id", ASCENDING), ("timestamp", DESCENDING)])
+        else:
+            await db[name].create_index([("patient_id", ASCENDING), ("start", DESCENDING)])
+        _ready.add(name)
+    return db[name]
+
+
+def _bucket_start(ts: datetime) -> datetime:
+    secs = config.VITALS_BUCKET_SECONDS
+    return datetime.fromtimestamp(int(ts.timestamp()) // secs * secs, tz=timezone.utc)
+
+
+def _bucket_op(doc: Dict[str, Any]) -> UpdateOne:
+    ts = as_utc(doc["timestamp"])
+    sample = {k: v for k, v in doc.items() if k not in _META and k != "_id"}
+    sample["timestamp"] = ts
+    update: Dict[str, Any] = {
+        "$push": {"samples": sample},
+        "$inc": {"count": 1, "anomalies": int(bool(doc.get("anomaly")))},
+        "$min": {"first": ts, **{f"min.{f}": doc[f] for f in _FIELDS if doc.get(f) is not None}},
+        "$max": {"last": ts, **{f"max.{f}": doc[f] for f in _FIELDS if doc.get(f) is not None}},
+        "$setOnInsert": {"username": doc.get("username")},
+    }
+    # A full bucket no longer matches, so the upsert opens a fresh one.
+    return UpdateOne(
+        {"patient_id": doc.get("patient_id"), "start": _bucket_start(ts),
+         "count": {"$lt": config.VITALS_BUCKET_MAX}},
+        update,
+        upsert=True,
+    )
+
+
+async def insert_vitals(col, docs: List[Dict[str, Any]], rollup: bool = True) -> None:
+    """
+    Store flat sample documents (unordered; bulk where the engine allows)
+    and fold the ones that were written into the rollups (vitals_rollups.py).
+    """
+    if not docs:
+        return
+    engine = _engine()
+    target = await _target(col)
+    try:
+        if engine == "documents":
+            await target.insert_many(docs, ordered=False)
+        elif engine == "timeseries":
+            await target.insert_many([
+                {**{k: v for k, v in d.items() if k not in _META and k != "_id"},
+                 "timestamp": as_utc(d["timestamp"]),
+                 "meta": {k: d.get(k) for k in _META}}
+                for d in docs
+            ], ordered=False)
+        else:
+            await target.bulk_write([_bucket_op(d) for d in docs], ordered=False)
+    except BulkWriteError as exc:
+        if rollup:
+            failed = {e["index"] for e in exc.details["writeErrors"]}
+            await update_rollups(col, [d for i, d in enumerate(docs) if i not in failed])
+        raise
+    if rollup:
+        await update_rollups(col, docs)
+
+
+async def insert_vital(col, doc: Dict[str, Any]) -> None:
+    await insert_vitals(col, [doc])
+
+
+async def patient_ids(col) -> List[str]:
+    """Every patient with stored samples in `col`."""
+    engine = _engine()
+    target = await _target(col)
+    ids = await target.distinct("meta.patient_id" if engine == "timeseries" else "patient_id")
+    return [i for i in ids if i]
+
+
+async def iter_vitals(
+    col,
+    patient_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    descending: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Flat samples for one patient in time order, streamed from the cursor."""
+    engine = _engine()
+    target = await _target(col)
+    order = DESCENDING if descending else ASCENDING
+    since = as_utc(since) if since else None
+    until = as_utc(until) if until else None
+    window: Dict[str, Any] = {}
+    if since:
+        window["$gte"] = since
+    if until:
+        window["$lte"] = until
+
+    if engine in ("documents", "timeseries"):
+        key = "patient_id" if engine == "documents" else "meta.patient_id"
+        query: Dict[str, Any] = {key: patient_id}
+        if window:
+            query["timestamp"] = window
+        async for d in target.find(query, {"_id": 0}).sort("timestamp", order):
+            if engine == "timeseries":
+                d.update(d.pop("meta", {}))
+            yield d
+        return
+
+    # buckets: pick overlapping buckets, then unpack and trim their samples
+    query = {"patient_id": patient_id}
+    if since:
+        query["last"] = {"$gte": since}
+    if until:
+        query["first"] = {"$lte": until}
+    async for b in target.find(query, {"_id": 0}).sort([("start", order), ("first", order)]):
+        samples = sorted(b.get("samples", []), key=lambda s: s["timestamp"], reverse=descending)
+        for s in samples:
+            ts = as_utc(s["timestamp"])      # naive if the client isn't tz_aware
+            if (since and ts < since) or (until and ts > until):
+                continue
+            yield {"patient_id": b["patient_id"], "username": b.get("username"), **s}
+
+
+async def fetch_vitals(
+    col,
+    patient_id: str,
+    limit: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """The newest `limit` samples in the window, returned oldest first."""
+    out = []
+    async for d in iter_vitals(col, patient_id, since, until, descending=True):
+        out.append(d)
+        if len(out) >= limit:
+            break
+    out.reverse()
+    return out
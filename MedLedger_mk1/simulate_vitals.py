@@ -3,18 +3,21 @@
 import asyncio
 import random
 import os
+import sys
 from datetime import datetime, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
-import joblib
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from model_registry import registry, ISOFOREST
+from vitals_store import insert_vital
+
 # --- MongoDB Setup ---
 MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("MONGO_DB", "medledger_analytics")
 
-# --- Load ML model ---
-# MODEL_PATH = os.getenv("MODEL_PATH", "isoforest.joblib")
-model = joblib.load("backend/isoforest.joblib")
+# --- ML model: shared, memory-mapped registry copy (backend/model_registry.py) ---
+model = registry.get(ISOFOREST)
 
 # --- Random Vital Generators ---
 def random_spo2():
@@ -59,18 +62,19 @@ async def simulate_vitals():
         pred = model.predict(features)
         anomaly = bool(pred[0] == -1)
 
-        # Insert into vitals collection
+        # Insert into vitals (layout chosen by VITALS_STORAGE)
         vitals_doc = {
             "username": username,
             "patient_id": patient_id,
             "spo2": spo2,
             "temperature": temp,
             "heart_rate": hr,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "anomaly": anomaly
+            "timestamp": datetime.now(timezone.utc),
+            "anomaly": anomaly,
+            "model_version": model.version,
         }
 
-        await db["vitals"].insert_one(vitals_doc)
+        await insert_vital(db["vitals"], vitals_doc)
 
         if anomaly:
             print(f"[🚨] Anomalous vitals inserted for {username}: {vitals_doc}")